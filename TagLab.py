@@ -83,6 +83,7 @@ from source.QtTableLabel import QtTableLabel
 from source.QtProjectWidget import QtProjectWidget
 from source.QtProjectEditor import QtProjectEditor
 from source.Project import Project, loadProject
+from source import ProjectArchive
 from source.Point import Point
 from source.Image import Image
 from source.MapClassifier import MapClassifier
@@ -959,8 +960,9 @@ class TagLab(QMainWindow):
 
     @pyqtSlot()
     def autosave(self):
-        filename, file_extension = os.path.splitext(self.project.filename)
-        self.project.save(filename + "_autosave.json")
+        filename, _ = os.path.splitext(self.project.filename)
+        # the autosave is always compressed, so only the modified images are re-encoded
+        self.project.save(filename + "_autosave" + ProjectArchive.ARCHIVE_EXTENSION, incremental=True, background=True)
 
     # call by pressing right button
     def openContextMenu(self, position):
@@ -2946,6 +2948,7 @@ class TagLab(QMainWindow):
         if len(self.activeviewer.selected_blobs) > 0:
             for blob in self.activeviewer.selected_blobs:
                 blob.note = self.editNote.toPlainText()
+                blob.dirty = True
     #
     @pyqtSlot()
     def updatePanelInfoSelected(self):
@@ -3525,7 +3528,7 @@ class TagLab(QMainWindow):
             bbox[2] += 2*padding  # width
             bbox[3] += 2*padding  # height
 
-            img = genutils.cropQImage(view.img_map, bbox)
+            img = view.cropImage(bbox)
             img = genutils.qimageToNumpyArray(img)
 
             # USE DEPTH INFORMATION IF AVAILABLE
@@ -4035,13 +4038,7 @@ class TagLab(QMainWindow):
         else:
             # all the blobs need to be re-assigned in all the orthoimages
             for orthoimage in self.project.images:
-                for blob in orthoimage.annotations.seg_blobs:
-                    if blob.class_name == oldname:
-                        blob.class_name = newname
-
-                for point in orthoimage.annotations.annpoints:
-                    if point.class_name == oldname:
-                        point.class_name = newname
+                orthoimage.annotations.renameClass(oldname, newname)
 
             self.activeviewer.drawAllBlobs()
             self.activeviewer.drawAllPoints()
@@ -4284,7 +4281,7 @@ class TagLab(QMainWindow):
 
             # update area information in the data panel
             image.annotations.table_needs_update = True
-            self.data_panel.updateTable(image.create_data_table())
+            self.data_panel.updateTable(image.create_data_table(self.project.labels))
 
             # update area information in the comparison panel
             area_mode = self.compare_panel.getAreaMode()
@@ -4366,7 +4363,7 @@ class TagLab(QMainWindow):
     @pyqtSlot()
     def openProject(self):
 
-        filters = "ANNOTATION PROJECT (*.json)"
+        filters = "ANNOTATION PROJECT (*.json *" + ProjectArchive.ARCHIVE_EXTENSION + ")"
         filename, _ = QFileDialog.getOpenFileName(self, "Open a project", self.taglab_dir, filters)
 
         if filename:
@@ -4391,11 +4388,14 @@ class TagLab(QMainWindow):
     @pyqtSlot()
     def saveAsProject(self):
 
-        filters = "ANNOTATION PROJECT (*.json)"
-        filename, _ = QFileDialog.getSaveFileName(self, "Save project", self.taglab_dir, filters)
+        filters = "ANNOTATION PROJECT (*.json);;COMPRESSED ANNOTATION PROJECT (*" + ProjectArchive.ARCHIVE_EXTENSION + ")"
+        filename, selected_filter = QFileDialog.getSaveFileName(self, "Save project", self.taglab_dir, filters)
 
         if filename:
-            if not filename.endswith('.json'):
+            if selected_filter.startswith("COMPRESSED"):
+                if not ProjectArchive.isArchiveFilename(filename):
+                    filename += ProjectArchive.ARCHIVE_EXTENSION
+            elif not filename.endswith('.json'):
                 filename += '.json'
             dir = QDir(self.taglab_dir)
             self.project.filename = dir.relativeFilePath(filename)
@@ -4408,7 +4408,7 @@ class TagLab(QMainWindow):
         Opens a previously saved project and append the annotated images to the current ones.
         """
 
-        filters = "ANNOTATION PROJECT (*.json)"
+        filters = "ANNOTATION PROJECT (*.json *" + ProjectArchive.ARCHIVE_EXTENSION + ")"
         filename, _ = QFileDialog.getOpenFileName(self, "Open a project", self.taglab_dir, filters)
         if filename:
             self.disableSplitScreen()
@@ -4684,6 +4684,7 @@ class TagLab(QMainWindow):
                                                                        scale=[1.0, 1.0])
         for blob in created_blobs:
             self.activeviewer.addBlob(blob, selected=False)
+        self.activeviewer.annotations.compactContours()
         self.activeviewer.saveUndo()
 
         QApplication.restoreOverrideCursor()
@@ -4876,7 +4877,9 @@ class TagLab(QMainWindow):
                 right = left + working_area[2] + pad
                 bottom = top + working_area[3] + pad
 
-                orthoimage = self.viewerplus.image.getRGBChannel().qimage
+                # the map is read region by region, it does not need to be loaded
+                rgb_channel = self.viewerplus.image.getRGBChannel()
+                (map_width, map_height) = rgb_channel.size()
 
                 if top < 0:
                     top = 0
@@ -4884,11 +4887,11 @@ class TagLab(QMainWindow):
                 if left < 0:
                     left = 0
 
-                if right > orthoimage.width():
-                    right = orthoimage.width()
+                if right > map_width:
+                    right = map_width
 
-                if bottom > orthoimage.height():
-                    bottom = orthoimage.height()
+                if bottom > map_height:
+                    bottom = map_height
 
                 w = right - left
                 h = bottom - top
@@ -4911,7 +4914,7 @@ class TagLab(QMainWindow):
                         y1 = top + h_size * j
                         bbox = [y1, x1, w_size, h_size]
 
-                        img_tile = genutils.cropQImage(orthoimage, bbox)
+                        img_tile = rgb_channel.readRegionAsQImage(bbox)
 
                         idx = i + j * w_step
                         filename = os.path.join(folder_name, self.viewerplus.image.name) + "_tile{:04d}_offx={:05d}_offy={:05d}.png".format(idx, x1, y1)
@@ -5227,8 +5230,7 @@ class TagLab(QMainWindow):
             QApplication.setOverrideCursor(Qt.WaitCursor)
 
             size = QSize(self.activeviewer.image.width, self.activeviewer.image.height)
-            label_map_img = self.activeviewer.annotations.create_label_map(size, self.project.labels, None)
-            label_map_np = genutils.qimageToNumpyArray(label_map_img)
+            label_map_np = self.activeviewer.annotations.render_label_map(size, self.project.labels, None)
             georef_filename = self.activeviewer.image.georef_filename
             outfilename = os.path.splitext(output_filename)[0]
             rasterops.saveGeorefLabelMap(label_map_np, georef_filename, self.project.working_area, outfilename)
@@ -5264,7 +5266,9 @@ class TagLab(QMainWindow):
         if output_filename:
             QApplication.setOverrideCursor(Qt.WaitCursor)
 
-            myimage_np = genutils.qimageToNumpyArray(self.activeviewer.image.getRGBChannel().qimage)
+            rgb_channel = self.activeviewer.image.getRGBChannel()
+            (map_width, map_height) = rgb_channel.size()
+            myimage_np = rgb_channel.readRegion([0, 0, map_width, map_height])
             georef_filename = self.activeviewer.image.georef_filename
             outfilename = os.path.splitext(output_filename)[0]
             rasterops.saveGeorefLabelMap(myimage_np, georef_filename, self.project.working_area, outfilename)
@@ -5285,7 +5289,7 @@ class TagLab(QMainWindow):
                 if self.newDatasetWidget is None:
 
                     if not self.activeviewer.image.export_dataset_area:
-                        self.activeviewer.image.export_dataset_area = [0, 0 , self.activeviewer.img_map.width(), self.activeviewer.img_map.height()]
+                        self.activeviewer.image.export_dataset_area = [0, 0 , self.activeviewer.imgwidth, self.activeviewer.imgheight]
 
                     annotations = self.activeviewer.annotations
                     self.newDatasetWidget = QtNewDatasetWidget(self.activeviewer.image.export_dataset_area, parent=self)
@@ -5332,10 +5336,15 @@ class TagLab(QMainWindow):
             index = self.comboboxSourceImage.currentIndex()
             current_image = self.project.images[index]
 
-            new_dataset = NewDataset(self.activeviewer.img_map, self.project.labels, current_image,
+            # the dataset is cut from the whole map (read from the file if it is not in memory)
+            ortho_image = self.activeviewer.img_map
+            if ortho_image is None:
+                ortho_image = self.activeviewer.cropImage([0, 0, self.activeviewer.imgwidth, self.activeviewer.imgheight])
+
+            new_dataset = NewDataset(ortho_image, self.project.labels, current_image,
                                      tile_size=1024, step=512, data_format=self.newDatasetWidget.comboDataFormat.currentText())
 
-            target_classes = training.createTargetClasses(self.activeviewer.annotations)
+            target_classes = training.createTargetClasses(self.activeviewer.annotations, self.project.labels)
 
             new_dataset.createLabelImage(self.project.labels)
             new_dataset.convertColorsToLabels(target_classes, self.project.labels)
@@ -5577,6 +5586,10 @@ class TagLab(QMainWindow):
             else:
                 blobs = self.activeviewer.annotations.calculate_inner_blobs(self.project.working_area)
 
+            annotations = self.activeviewer.annotations
+            annotations.setClassVisibility(self.project.labels)
+            blobs = annotations.visibleBlobs(blobs)
+
             gf = self.activeviewer.image.georef_filename
             rasterops.saveClippedTiff(input_tiff, blobs, gf, output_filename)
 
@@ -5736,6 +5749,7 @@ class TagLab(QMainWindow):
         georef_filename = self.activeviewer.image.georef_filename
         blobs = self.activeviewer.annotations.seg_blobs
         rasterops.calculateAreaUsingSlope(input_tiff, blobs)
+        self.activeviewer.annotations.updateBlobAttributes(blobs)
 
         QApplication.restoreOverrideCursor()
 
@@ -5818,7 +5832,7 @@ class TagLab(QMainWindow):
         Save the current project.
         """
         QApplication.setOverrideCursor(Qt.WaitCursor)
-        self.project.save()
+        self.project.save(incremental=True)
         QApplication.restoreOverrideCursor()
 
         if self.timer is None:
@@ -5905,7 +5919,7 @@ class TagLab(QMainWindow):
             x, y, w, h = self.classifierWidget.getPreviewArea()
             width = max(513 * scale_factor, w)
             height = max(513 * scale_factor, h)
-            crop_image = self.activeviewer.img_map.copy(int(x), int(y), int(width), int(height))
+            crop_image = self.activeviewer.cropImage([int(y), int(x), int(width), int(height)])
 
             self.classifierWidget.setRGBPreview(crop_image)
             self.classifierWidget.chkAutocolor.setChecked(False)
@@ -5946,7 +5960,7 @@ class TagLab(QMainWindow):
             self.progress_bar.hidePerc()
             self.progress_bar.setMessage("Initialization..")
 
-            orthoimage = self.activeviewer.img_map
+            orthoimage = self.activeviewer.imageSource()
             target_pixel_size = classifier_selected['Scale']
             self.classifier.setup(orthoimage, self.activeviewer.image.pixelSize(), target_pixel_size,
                                   working_area=[y, x, w, h], padding=256)
@@ -6040,7 +6054,7 @@ class TagLab(QMainWindow):
                 self.progress_bar.setMessage("Map rescaling..")
                 QApplication.processEvents()
 
-                orthoimage = self.activeviewer.img_map
+                orthoimage = self.activeviewer.imageSource()
                 target_pixel_size = classifier_selected['Scale']
                 self.classifier.setup(orthoimage, self.activeviewer.image.pixelSize(), target_pixel_size,
                                       working_area=self.project.working_area, padding=256)
@@ -6052,7 +6066,7 @@ class TagLab(QMainWindow):
 
                 # runs the classifier
                 self.classifier.run(1026, 513, 256, prediction_threshold=pred_thresh,
-                    save_scores=False, autocolor=checkcolor,  autolevel=checklevel)
+                    save_scores=False, autocolor=checkcolor,  autolevel=checklevel, streaming=True)
 
                 if self.classifier.flagStopProcessing is False:
 
@@ -6061,14 +6075,14 @@ class TagLab(QMainWindow):
                     self.progress_bar.setMessage("Finalizing classification results..")
                     QApplication.processEvents()
 
-                    filename = os.path.join("temp", "labelmap.png")
-
                     offset = self.classifier.offset
                     scale = [self.classifier.scale_factor, self.classifier.scale_factor]
-                    created_blobs = self.activeviewer.annotations.import_label_map(filename, self.project.labels,
-                                                                                   offset, scale)
+                    created_blobs = self.activeviewer.annotations.import_label_indices(self.classifier.label_raster,
+                                                                                       self.classifier.classNames(),
+                                                                                       offset, scale)
                     for blob in created_blobs:
                         self.viewerplus.addBlob(blob, selected=False)
+                    self.viewerplus.annotations.compactContours()
 
                     logfile.info("[AUTOCLASS] Automatic classification ENDS.")
 
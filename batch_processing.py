@@ -1,12 +1,17 @@
 import os
+import re
 import sys
+import csv
 import glob
 import json
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from PyQt5.QtCore import QDir, QSize
 from source.Project import Project, loadProject
 import torch
 import argparse
+from source.Blob import Blob
 from source.Image import Image
 from source.MapClassifier import MapClassifier
 
@@ -21,58 +26,286 @@ class ProgressPrinter(object):
         print(txt)
 
 
-def applyClassifier(input_image, classifier_to_use, taglab_project, prediction_th, autocolor_flag, autolevels_flag, output_label_maps):
+def applyClassifier(input_image, classifier_to_use, taglab_project, prediction_th, autocolor_flag, autolevels_flag, output_label_maps,
+                    output_folder, batch_size=9, classifier=None, region_workers=None):
+    """
+    Classify the given image and add the resulting regions to its annotations.
+    If a classifier is given it is reused (and its network is kept loaded), otherwise a new one is created.
+    region_workers is the number of processes used to convert the regions into blobs (None: one for each CPU).
+    It returns the list of the created blobs.
+    """
 
     # setup the desired classifier
 
     progress_printer = ProgressPrinter(input_image.name)
 
-    classifier = MapClassifier(classifier_to_use, taglab_project.labels)
+    reuse_classifier = classifier is not None
+    if reuse_classifier:
+        classifier.setLabels(taglab_project.labels)
+    else:
+        classifier = MapClassifier(classifier_to_use, taglab_project.labels)
     classifier.updateProgress.connect(progress_printer.updateProgress)
 
     # rescaling the map to fit the target scale of the network
 
+    # only the working area of the map is read (see Channel.readRegion)
     RGB_channel = input_image.getRGBChannel()
-    RGB_channel.loadData()
-    w = RGB_channel.qimage.width()
-    h = RGB_channel.qimage.height()
+    (w, h) = RGB_channel.size()
     target_pixel_size = classifier_to_use['Scale']
-    classifier.setup(RGB_channel.qimage, input_image.pixelSize(), target_pixel_size,
+    classifier.setup(RGB_channel, input_image.pixelSize(), target_pixel_size,
                      working_area=taglab_project.working_area, padding=256)
 
     # runs the classifier
     classifier.run(1026, 513, 256, prediction_threshold=prediction_th,
-                   save_scores=False, autocolor=autocolor_flag, autolevel=autolevels_flag)
+                   save_scores=False, autocolor=autocolor_flag, autolevel=autolevels_flag, batch_size=batch_size,
+                   streaming=True, keep_network=reuse_classifier)
 
-    if classifier.flagStopProcessing is False:
+    created_blobs = []
 
-        filename = os.path.join("temp", "labelmap.png")
+    if classifier.flagStopProcessing is False:
 
         offset = classifier.offset
         scale = [classifier.scale_factor, classifier.scale_factor]
-        created_blobs = input_image.annotations.import_label_map(filename, taglab_project.labels, offset, scale)
+        created_blobs = input_image.annotations.import_label_indices(classifier.label_raster, classifier.classNames(),
+                                                                     offset, scale, workers=region_workers)
 
         for blob in created_blobs:
-            input_image.annotations.seg_blobs.append(blob)
+            input_image.annotations.addBlob(blob)
+        input_image.annotations.compactContours()
 
         if output_label_maps == 1:
             filename = input_image.name + ".png"
-            fileout = os.path.join(OUTPUT_FOLDER, filename)
+            fileout = os.path.join(output_folder, filename)
             input_image.annotations.export_image_data_for_Scripps(QSize(w, h), fileout, taglab_project)
         elif output_label_maps == 2:
             filename = input_image.name + ".png"
-            fileout = os.path.join(OUTPUT_FOLDER, filename)
+            fileout = os.path.join(output_folder, filename)
             wa = taglab_project.working_area
             taglab_project.working_area = [0, 0, w, h]  # update working area to the entire map
             input_image.annotations.export_image_data_for_Scripps(QSize(w, h), fileout, taglab_project)
             taglab_project.working_area = wa  # restore working area
 
+    RGB_channel.close()
+
+    classifier.updateProgress.disconnect(progress_printer.updateProgress)
+
     # reset GPU memory
     torch.cuda.empty_cache()
-    if classifier is not None:
+    if not reuse_classifier:
         del classifier
         classifier = None
 
+    return created_blobs
+
+
+##### BATCH ENGINE
+#
+# A job is the classification of one image of one project. Each job is run by a worker process that keeps
+# its own MapClassifier. The regions created by a job are stored in a per-job result file, and a completion
+# marker is written when the job ends, so an interrupted batch can be resumed. When all the jobs of a project
+# are completed the results are merged into the project, which is saved in the output folder.
+
+class BatchConfig(object):
+
+    def __init__(self, taglab_dir, default_dictionary, output_folder, classifier_info, prediction_threshold,
+                 autocolor, autolevels, output_label_maps, batch_size, threads_per_worker, region_workers=None):
+
+        self.taglab_dir = taglab_dir
+        self.default_dictionary = default_dictionary
+        self.output_folder = output_folder
+        self.classifier_info = classifier_info
+        self.prediction_threshold = prediction_threshold
+        self.autocolor = autocolor
+        self.autolevels = autolevels
+        self.output_label_maps = output_label_maps
+        self.batch_size = batch_size
+        self.threads_per_worker = threads_per_worker
+        self.region_workers = region_workers
+
+
+def jobName(name):
+    """
+    Convert a project/image name in a string that can be safely used as a file name.
+    """
+    return re.sub(r'[^\w\-.]', '_', name)
+
+
+def jobFolder(config, project_filename):
+    project_name = os.path.splitext(os.path.basename(project_filename))[0]
+    return os.path.join(config.output_folder, "jobs", jobName(project_name))
+
+
+def jobMarker(config, project_filename, image_id):
+    return os.path.join(jobFolder(config, project_filename), jobName(image_id) + ".done")
+
+
+def jobResult(config, project_filename, image_id):
+    return os.path.join(jobFolder(config, project_filename), jobName(image_id) + ".json")
+
+
+# per-process state of the workers
+worker_config = None
+worker_classifier = None
+
+
+def initWorker(config):
+
+    global worker_config
+    global worker_classifier
+
+    worker_config = config
+    worker_classifier = None
+
+    if config.threads_per_worker > 0:
+        torch.set_num_threads(config.threads_per_worker)
+
+
+def runJob(job):
+    """
+    Classify one image of a project. It returns a dictionary describing the outcome of the job.
+    """
+
+    global worker_classifier
+
+    config = worker_config
+    (project_filename, image_id) = job
+
+    report = {
+        "project": os.path.basename(project_filename),
+        "image": image_id,
+        "status": "done",
+        "blobs": 0,
+        "seconds": 0.0,
+        "error": ""
+    }
+
+    start = time.time()
+
+    try:
+        project = loadProject(config.taglab_dir, project_filename, config.default_dictionary)
+        image = project.getImageFromId(image_id)
+
+        if worker_classifier is None:
+            worker_classifier = MapClassifier(config.classifier_info, project.labels)
+
+        # each worker has its own temporary folder
+        worker_classifier.temp_dir = os.path.join(config.output_folder, "temp", "worker-" + str(os.getpid()))
+
+        created_blobs = applyClassifier(image, config.classifier_info, project, config.prediction_threshold,
+                                        config.autocolor, config.autolevels, config.output_label_maps,
+                                        config.output_folder, config.batch_size, classifier=worker_classifier,
+                                        region_workers=config.region_workers)
+
+        report["blobs"] = len(created_blobs)
+        report["seconds"] = round(time.time() - start, 2)
+
+        os.makedirs(jobFolder(config, project_filename), exist_ok=True)
+
+        with open(jobResult(config, project_filename, image_id), "w") as f:
+            json.dump([blob.save() for blob in created_blobs], f)
+
+        # the marker is written last, a job without marker is run again when the batch is resumed
+        with open(jobMarker(config, project_filename, image_id), "w") as f:
+            json.dump(report, f)
+
+    except Exception as e:
+        report["status"] = "failed"
+        report["seconds"] = round(time.time() - start, 2)
+        report["error"] = str(e)
+
+    txt = "[{:s}] {:s} - {:s}: {:d} regions in {:.2f} seconds".format(report["status"].upper(), report["project"],
+                                                                       report["image"], report["blobs"],
+                                                                       report["seconds"])
+    print(txt, flush=True)
+
+    return report
+
+
+def mergeProject(config, project_filename):
+    """
+    Add the regions classified by the jobs to the project and save it in the output folder.
+    """
+
+    project = loadProject(config.taglab_dir, project_filename, config.default_dictionary)
+
+    for image in project.images:
+        with open(jobResult(config, project_filename, image.id), "r") as f:
+            blobs_data = json.load(f)
+
+        for data in blobs_data:
+            blob = Blob(None, 0, 0, 0)
+            blob.fromDict(data)
+            image.annotations.addBlob(blob)
+
+    filename = os.path.basename(project.filename)
+    fileout = os.path.join(config.output_folder, filename)
+    dir = QDir(config.taglab_dir)
+    project.filename = dir.relativeFilePath(fileout)
+    project.save()
+
+
+def writeReport(filename, reports):
+
+    fields = ["project", "image", "status", "blobs", "seconds", "error"]
+
+    with open(filename, mode='w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        for report in reports:
+            writer.writerow(report)
+
+
+def runBatch(config, projects, workers, resume=True):
+
+    # create the list of jobs, the ones already completed are skipped
+    jobs = []
+    project_jobs = {}
+    reports = []
+    for project_filename in projects:
+
+        print("Loading project ->", os.path.basename(project_filename))
+        project = loadProject(config.taglab_dir, project_filename, config.default_dictionary)
+
+        project_jobs[project_filename] = [image.id for image in project.images]
+
+        for image in project.images:
+            marker = jobMarker(config, project_filename, image.id)
+            if resume and os.path.exists(marker):
+                with open(marker, "r") as f:
+                    report = json.load(f)
+                report["status"] = "skipped"
+                reports.append(report)
+            else:
+                jobs.append((project_filename, image.id))
+
+    print("")
+    print("Jobs to run: {:d} ({:d} already completed)".format(len(jobs), len(reports)))
+    print("")
+
+    if workers <= 1:
+        initWorker(config)
+        for job in jobs:
+            reports.append(runJob(job))
+    else:
+        # spawn is required to safely use CUDA in the worker processes
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=initWorker,
+                                 initargs=(config,)) as executor:
+            for report in executor.map(runJob, jobs):
+                reports.append(report)
+
+    # merge the results of the completed projects
+    for project_filename, images_ids in project_jobs.items():
+        completed = all(os.path.exists(jobMarker(config, project_filename, image_id)) for image_id in images_ids)
+        if completed:
+            print("Save result ->", os.path.basename(project_filename))
+            mergeProject(config, project_filename)
+        else:
+            print("Project", os.path.basename(project_filename), "is not complete, it is not saved.")
+
+    return reports
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
@@ -83,6 +316,10 @@ if __name__ == '__main__':
     parser.add_argument("--output-label-maps", type=int, default=1, help="0: Not saved | 1: working area is saved | 2: entire map is saved")
     parser.add_argument("--autocolor", type=bool, default=False, help="Automatic color adjustment")
     parser.add_argument("--autolevels", type=bool, default=False, help="Automatic level adjustments")
+    parser.add_argument("--batch-size", type=int, default=9, help="Number of crops classified in a single forward pass (9 crops per tile)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes (one classifier per worker)")
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="Number of CPU threads used by each worker (0: automatic)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the completed jobs of a previous run and classify everything again")
 
     args = parser.parse_args()
 
@@ -94,8 +331,14 @@ if __name__ == '__main__':
     CLASSIFIER_NAME = args.classifier_name
     AUTOCOLOR = args.autocolor
     AUTOLEVELS = args.autolevels
+    BATCH_SIZE = args.batch_size
+    WORKERS = max(1, args.workers)
+    THREADS_PER_WORKER = args.threads_per_worker
     PREDICTION_THRESHOLD = 0.5
 
+    if THREADS_PER_WORKER <= 0 and WORKERS > 1:
+        THREADS_PER_WORKER = max(1, multiprocessing.cpu_count() // WORKERS)
+
     print("")
     print("* CONFIGURATION *")
     print("")
@@ -121,6 +364,13 @@ if __name__ == '__main__':
     else:
         print("White balance: NO")
 
+    print("Batch size:", BATCH_SIZE)
+    print("Workers:", WORKERS)
+    if args.restart:
+        print("Resume: NO")
+    else:
+        print("Resume: YES")
+
     print("------------------------------------------------")
     print("")
 
@@ -151,39 +401,40 @@ if __name__ == '__main__':
     # create projects list
     projects = [x for x in glob.glob(os.path.join(PROJECTS_FOLDER, '*.json'))]
 
-    ##### MAIN LOOP - run automatic recognition on all the images of all the projects and save the result
+    # the worker processes cannot start their own pool, the regions are converted serially
+    REGION_WORKERS = 1 if WORKERS > 1 else None
 
-    start = time.time()
+    config = BatchConfig(taglab_dir, default_dictionary, OUTPUT_FOLDER, selected_classifier, PREDICTION_THRESHOLD,
+                         AUTOCOLOR, AUTOLEVELS, OUTPUT_LABEL_MAPS, BATCH_SIZE, THREADS_PER_WORKER, REGION_WORKERS)
 
-    for project_filename in projects:
+    ##### MAIN LOOP - run automatic recognition on all the images of all the projects and save the result
 
-        # load project
-        print("Loading project ->", os.path.basename(project_filename))
-        project = loadProject(taglab_dir, project_filename, default_dictionary)
+    start = time.time()
 
-        # apply the classifier
-        for image in project.images:
+    reports = runBatch(config, projects, WORKERS, resume=not args.restart)
 
-            pstart = time.time()
-            applyClassifier(image, selected_classifier, project, PREDICTION_THRESHOLD,
-                            AUTOCOLOR, AUTOLEVELS, OUTPUT_LABEL_MAPS)
-            pend = time.time()
+    end = time.time()
 
-            txt = "Image classified in {:.2f} seconds".format(pend-pstart)
-            print(txt)
+    # summary report
+    report_filename = os.path.join(OUTPUT_FOLDER, "batch_report.csv")
+    writeReport(report_filename, reports)
 
-        # save project
-        print("Save result")
-        filename = os.path.basename(project.filename)
-        fileout = os.path.join(OUTPUT_FOLDER, filename)
-        dir = QDir(taglab_dir)
-        project.filename = dir.relativeFilePath(fileout)
-        project.save()
+    done = [r for r in reports if r["status"] == "done"]
+    skipped = [r for r in reports if r["status"] == "skipped"]
+    failed = [r for r in reports if r["status"] == "failed"]
 
-    end = time.time()
+    print("")
+    print("* SUMMARY *")
+    print("")
+    print("Images classified: {:d}".format(len(done)))
+    print("Images skipped (already classified): {:d}".format(len(skipped)))
+    print("Images failed: {:d}".format(len(failed)))
+    for r in failed:
+        print("   {:s} - {:s}: {:s}".format(r["project"], r["image"], r["error"]))
+    if len(done) > 0:
+        txt = "Average classification time {:.2f} seconds".format(sum(r["seconds"] for r in done) / len(done))
+        print(txt)
+    print("Report saved in", report_filename)
 
     txt = "Total processing time {:.2f} seconds".format(end-start)
     print(txt)
-
-
-
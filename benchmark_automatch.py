@@ -0,0 +1,120 @@
+import time
+import argparse
+import numpy as np
+
+from skimage import measure
+from skimage.draw import disk
+
+from source.Blob import Blob
+from source.Correspondences import Correspondences
+from source.Mask import intersectMask
+
+
+def autoMatchLoop(corr, blobs1, blobs2):
+    """
+    Previous version of Correspondences.autoMatch, which tests all the pairs of blobs.
+    """
+    corr.correspondences.clear()
+    for blob1 in blobs1:
+        for blob2 in blobs2:
+            x1 = max(blob1.bbox[0], blob2.bbox[0])
+            y1 = max(blob1.bbox[1], blob2.bbox[1])
+            x2 = min(blob1.bbox[0] + blob1.bbox[3], blob2.bbox[0] + blob2.bbox[3])
+            y2 = min(blob1.bbox[1] + blob1.bbox[2], blob2.bbox[1] + blob2.bbox[2])
+            interArea = abs(max((x2 - x1, 0)) * max((y2 - y1), 0))
+
+            if interArea != 0 and blob2.class_name == blob1.class_name and blob1.class_name != 'Empty':
+                mask1 = Blob.getMask(blob1)
+                sizeblob1 = np.count_nonzero(mask1)
+                mask2 = Blob.getMask(blob2)
+                sizeblob2 = np.count_nonzero(mask2)
+                minblob = min(sizeblob1, sizeblob2)
+                mask, bbox = intersectMask(mask1, blob1.bbox, mask2, blob2.bbox)
+                intersectionArea = np.count_nonzero(mask)
+
+                if (intersectionArea < (0.6 * minblob)):
+                    continue
+                if (sizeblob2 > sizeblob1 * corr.threshold):
+                    corr.correspondences.append([-1, blob1.id, blob2.id, blob1.area, blob2.area, blob1.class_name, 'grow', 'none'])
+                elif (sizeblob2 < sizeblob1 / corr.threshold):
+                    corr.correspondences.append([-1, blob1.id, blob2.id, blob1.area, blob2.area, blob1.class_name, 'shrink', 'none'])
+                else:
+                    corr.correspondences.append([-1, blob1.id, blob2.id, blob1.area, blob2.area, blob1.class_name, 'same', 'none'])
+
+    corr.assignSplit()
+    corr.assignFuse()
+    corr.assignDead(blobs1)
+    corr.assignBorn(blobs2)
+
+
+def syntheticSurvey(centers, radii, classes, size):
+    """
+    Blobs of a synthetic survey made of discs (overlapping discs are merged).
+    """
+    labels = np.zeros((size, size), dtype=np.int32)
+    for i, ((cy, cx), r) in enumerate(zip(centers, radii)):
+        rr, cc = disk((cy, cx), r, shape=labels.shape)
+        labels[rr, cc] = i + 1
+
+    blobs = []
+    for region in measure.regionprops(labels):
+        blob = Blob(region, 0, 0, len(blobs) + 1)
+        blob.class_name = classes[region.label - 1]
+        blob.area = region.area
+        blobs.append(blob)
+
+    return blobs
+
+
+def syntheticSurveys(count, seed):
+
+    rng = np.random.default_rng(seed)
+    size = int(np.sqrt(count) * 60)
+
+    centers = rng.uniform(20, size - 20, size=(count, 2))
+    radii = rng.uniform(5, 18, size=count)
+    classes = rng.choice(["Pocillopora", "Porites", "Montipora", "Empty"], size=count, p=[0.4, 0.3, 0.2, 0.1])
+
+    # the second survey: the colonies move a little, grow or shrink, some disappear
+    centers2 = centers + rng.normal(0.0, 2.0, size=centers.shape)
+    radii2 = np.clip(radii * rng.uniform(0.7, 1.3, size=count), 3, None)
+    alive = rng.uniform(size=count) > 0.1
+
+    blobs1 = syntheticSurvey(centers, radii, classes, size)
+    blobs2 = syntheticSurvey(centers2[alive], radii2[alive], classes[alive], size)
+
+    return blobs1, blobs2
+
+
+if __name__ == '__main__':
+
+    """
+    Benchmark of the automatic matching of the regions (Correspondences.autoMatch) against the previous
+    implementation that tests all the pairs of regions, on two synthetic surveys.
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--regions", type=int, default=2000, help="Number of regions of each synthetic survey")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    parser.add_argument("--skip-loop", action="store_true", help="Do not run the previous (quadratic) implementation")
+    args = parser.parse_args()
+
+    blobs1, blobs2 = syntheticSurveys(args.regions, args.seed)
+    print("Regions: {:d} - {:d}".format(len(blobs1), len(blobs2)))
+
+    corr = Correspondences(None, None)
+    start = time.perf_counter()
+    corr.autoMatch(blobs1, blobs2)
+    t_index = time.perf_counter() - start
+    print("Indexed match  : {:.3f} s  ({:d} matches, {:d} dead, {:d} born)".format(t_index, len(corr.correspondences),
+                                                                                  len(corr.dead), len(corr.born)))
+
+    if not args.skip_loop:
+        corr_loop = Correspondences(None, None)
+        start = time.perf_counter()
+        autoMatchLoop(corr_loop, blobs1, blobs2)
+        t_loop = time.perf_counter() - start
+        print("All pairs match: {:.3f} s  speed-up: {:.1f}x".format(t_loop, t_loop / t_index))
+
+        same = corr.correspondences == corr_loop.correspondences and corr.dead == corr_loop.dead and corr.born == corr_loop.born
+        print("Same results   :", same)
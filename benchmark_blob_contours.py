@@ -0,0 +1,138 @@
+import os
+import time
+import argparse
+import numpy as np
+import math
+
+from skimage import measure
+
+from source.Project import Project, loadProjectData
+
+
+def contourToMapLoop(contour, bbox, padding):
+    """
+    Previous (per-vertex) version of Blob.contourToMap.
+    """
+    contour = np.array(contour)
+    for i in range(contour.shape[0]):
+        ycoor = contour[i, 0]
+        xcoor = contour[i, 1]
+        contour[i, 0] = xcoor - padding + bbox[1]
+        contour[i, 1] = ycoor - padding + bbox[0]
+    return contour
+
+
+def contourPerimeterLoop(contour):
+    """
+    Previous (per-vertex) version of Blob.calculateContourPerimeter.
+    """
+    px1 = contour[0, 0]
+    py1 = contour[0, 1]
+    N = contour.shape[0]
+    pxlast = contour[N-1, 0]
+    pylast = contour[N-1, 1]
+    perim = math.sqrt((px1-pxlast)*(px1-pxlast) + (py1-pylast)*(py1-pylast))
+    for i in range(1, contour.shape[0]):
+        px2 = contour[i, 0]
+        py2 = contour[i, 1]
+
+        d = math.sqrt((px1 - px2)*(px1-px2) + (py1-py2)*(py1-py2))
+        perim += d
+
+        px1 = px2
+        py1 = py2
+
+    return perim
+
+
+def benchmark(blobs, repetitions):
+
+    PADDED_SIZE = 4
+
+    # the contours as returned by find_contours, from the masks of the blobs
+    raw_contours = []
+    for blob in blobs:
+        mask = blob.getMask()
+        img_padded = np.pad(mask, (PADDED_SIZE, PADDED_SIZE), mode="constant", constant_values=(0, 0))
+        for contour in measure.find_contours(img_padded, 0.6):
+            raw_contours.append((contour, blob.bbox))
+
+    # the loaded contours are float32 views of the contour store, both versions are given float64 copies
+    contours = []
+    for blob in blobs:
+        contours.append(np.asarray(blob.contour, dtype=np.float64))
+        contours.extend([np.asarray(c, dtype=np.float64) for c in blob.inner_contours])
+
+    vertices = sum([c.shape[0] for c in contours])
+    print("Regions: {:d}  Contours: {:d}  Vertices: {:d}".format(len(blobs), len(contours), vertices))
+    print("")
+
+    # check the results
+    mismatches = 0
+    for (contour, bbox) in raw_contours:
+        if not np.array_equal(contourToMapLoop(contour, bbox, PADDED_SIZE), blobs[0].contourToMap(contour, bbox, PADDED_SIZE)):
+            mismatches += 1
+    print("Contour offset  - mismatches: {:d} / {:d}".format(mismatches, len(raw_contours)))
+
+    mismatches = 0
+    for contour in contours:
+        if contourPerimeterLoop(contour) != blobs[0].calculateContourPerimeter(contour):
+            mismatches += 1
+    print("Perimeter       - mismatches: {:d} / {:d}".format(mismatches, len(contours)))
+    print("")
+
+    # timings
+    blob = blobs[0]
+
+    start = time.perf_counter()
+    for k in range(repetitions):
+        for (contour, bbox) in raw_contours:
+            contourToMapLoop(contour, bbox, PADDED_SIZE)
+    t_loop = (time.perf_counter() - start) / repetitions
+
+    start = time.perf_counter()
+    for k in range(repetitions):
+        for (contour, bbox) in raw_contours:
+            blob.contourToMap(contour, bbox, PADDED_SIZE)
+    t_vec = (time.perf_counter() - start) / repetitions
+
+    print("Contour offset  - loop: {:.4f} s  vectorized: {:.4f} s  speed-up: {:.1f}x".format(t_loop, t_vec, t_loop / t_vec))
+
+    start = time.perf_counter()
+    for k in range(repetitions):
+        for contour in contours:
+            contourPerimeterLoop(contour)
+    t_loop = (time.perf_counter() - start) / repetitions
+
+    start = time.perf_counter()
+    for k in range(repetitions):
+        for contour in contours:
+            blob.calculateContourPerimeter(contour)
+    t_vec = (time.perf_counter() - start) / repetitions
+
+    print("Perimeter       - loop: {:.4f} s  vectorized: {:.4f} s  speed-up: {:.1f}x".format(t_loop, t_vec, t_loop / t_vec))
+
+
+if __name__ == '__main__':
+
+    """
+    Micro-benchmark of the contour post-processing of the regions (Blob.contourToMap and
+    Blob.calculateContourPerimeter) against the previous per-vertex implementation, on the regions of a project.
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--project", type=str, default="sampleProjects/multi-temporal_comparison_project.json",
+                        help="Project whose regions are used for the benchmark")
+    parser.add_argument("--repetitions", type=int, default=3, help="Number of repetitions of each timing")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.project):
+        print("Project", args.project, "does not exist (!)")
+    else:
+        project = Project(**loadProjectData(args.project))
+        blobs = [blob for image in project.images for blob in image.annotations.seg_blobs]
+
+        if len(blobs) == 0:
+            print("The project does not contain regions.")
+        else:
+            benchmark(blobs, args.repetitions)
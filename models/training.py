@@ -43,9 +43,10 @@ def checkDataset(dataset_folder):
 
     return flag
 
-def createTargetClasses(annotations):
+def createTargetClasses(annotations, labels=None):
     """
-    Create the label name - label code correspondences for the classifier.
+    Create the label name - label code correspondences for the classifier, from the visible regions.
+    If labels (name -> Label) is given the visibility of the classes is updated from it.
     """
 
     labels_set = set()
@@ -53,9 +54,11 @@ def createTargetClasses(annotations):
     # Background class must be present
     labels_set.add("Background")
 
-    for blob in annotations.seg_blobs:
-        if blob.qpath_gitem.isVisible():
-            labels_set.add(blob.class_name)
+    if labels is not None:
+        annotations.setClassVisibility(labels)
+
+    for blob in annotations.visibleBlobs():
+        labels_set.add(blob.class_name)
 
     target_dict = {}
     for i, label in enumerate(labels_set):
@@ -21,9 +21,12 @@ import os
 import re
 import csv
 import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 from PyQt5.QtWidgets import QMessageBox
+import cv2
 from cv2 import fillPoly
 
 from skimage import measure
@@ -44,18 +47,48 @@ from source.Blob import Blob
 from source.Point import Point
 import source.Mask as Mask
 from source.Label import Label
+from source.SpatialIndex import SpatialIndex
+from source.IdAllocator import IdAllocator
+from source.ContourStore import ContourStore
+from source.AnnotationTable import AnnotationTable
+from source.ShapeDescriptors import ShapeDescriptors
 from coraline.Coraline import segment, mutual
 
 
 # from PIL import Image as Img  #for debug
 
+
+def blobsFromRegionMasks(masks, offset_x, offset_y):
+    """
+    Create a blob for each region, given as (top, left, mask of the region cropped to its bounding box).
+    It is a module function so it can be run in a worker process (see Annotation.blobsFromLabelCodes).
+    """
+    blobs = []
+    for (top, left, mask) in masks:
+        region = measure.regionprops(mask.astype(np.uint8))[0]
+        blobs.append(Blob(region, offset_x + left, offset_y + top, 0))
+
+    return blobs
+
+
 # refactor: change name to annotationS
+def roundValues(values, ndigits):
+    """
+    Python round() of each value, as the exports did when they were filled per object
+    (np.round rounds some halves differently, i.e. 339.15 -> 339.2 instead of 339.1).
+    """
+    return np.array([round(value, ndigits) for value in np.asarray(values, dtype=np.float64).tolist()], dtype=np.float64)
+
+
 class Annotation(object):
     """
         Annotation object contains all the annotations, a list of blobs and a list of annotation points
         Annotation point can't be manually edited or removed, only classified
     """
 
+    # minimum number of regions to convert them with a pool of processes (see blobsFromLabelCodes)
+    PARALLEL_MIN_REGIONS = 2000
+
     def __init__(self):
 
         # refactor: rename this to blobs.
@@ -64,6 +97,38 @@ class Annotation(object):
         self.annpoints = []
         self.annotationsDict = {}
 
+        # spatial indices (blobs bounding boxes and points coordinates) used by the hit-test and area queries
+        self.blobs_index = SpatialIndex()
+        self.points_index = SpatialIndex()
+
+        # id -> blob and id -> point, with the allocation of the free ids
+        self.blobs_by_id = IdAllocator()
+        self.points_by_id = IdAllocator()
+
+        # per-object attributes (class code, visibility flag, geometric measures) of the regions and of the points,
+        # used for the statistics and the exports (see updateBlobAttributes)
+        self.blobs_table = AnnotationTable()
+        self.blobs_table.addColumn("id", np.int64, -1)
+        self.blobs_table.addColumn("genet", np.int64, -1)
+        self.blobs_table.addColumn("area", np.float64, 0.0)
+        self.blobs_table.addColumn("surface_area", np.float64, 0.0)
+        self.blobs_table.addColumn("perimeter", np.float64, 0.0)
+        self.blobs_table.addColumn("centroid", np.float64, 0.0, shape=(2,))
+        self.blobs_table.addColumn("bbox", np.float64, 0.0, shape=(4,))
+
+        self.points_table = AnnotationTable()
+        self.points_table.addColumn("id", np.int64, -1)
+        self.points_table.addColumn("coords", np.float64, 0.0, shape=(2,))
+
+        # class name -> visible, the classes not in the dictionary are visible (see setClassVisibility)
+        self.class_visibility = {}
+
+        # cache of the shape descriptors of the regions (see QtGeometricInfoWidget)
+        self.shape_descriptors = ShapeDescriptors()
+
+        # contiguous buffer of the contours of the regions (see compactContours)
+        self.contour_store = None
+
         # relative weight of depth map for refine borders
         # refactor: this is to be saved and loaded in qsettings
         self.refine_depth_weight = 0.0
@@ -72,26 +137,39 @@ class Annotation(object):
         # cache
         self.table_needs_update = True
 
+        # modified since the last save (see Project.saveArchive), the last encoded chunk is kept
+        self.dirty = True
+        self.chunk = None
+
 
     def addPoint(self, point):
 
 
-        used = [point.id for point in self.annpoints]
-        if point.id in used:
+        if point.id in self.points_by_id:
             point.id = self.getFreePointId()
         self.annpoints.append(point)
+        self.points_by_id.add(point.id, point)
+        self.points_index.insert(point, self.pointBox(point))
+        row = self.points_table.insert(point, point.class_name)
+        self.points_table.columns["id"][row] = point.id
+        self.points_table.columns["coords"][row] = (point.coordx, point.coordy)
 
         self.table_needs_update = True
+        self.dirty = True
 
 
     def addBlob(self, blob):
 
-        used = [blob.id for blob in self.seg_blobs]
-        if blob.id in used:
+        if blob.id in self.blobs_by_id:
             blob.id = self.getFreeId()
         self.seg_blobs.append(blob)
+        self.blobs_by_id.add(blob.id, blob)
+        self.blobs_index.insert(blob, blob.bbox)
+        self.blobs_table.insert(blob, blob.class_name)
+        self.updateBlobAttributes([blob])
 
         self.table_needs_update = True
+        self.dirty = True
 
     def removeAnn(self, blob_or_point):
 
@@ -108,7 +186,11 @@ class Annotation(object):
                 print("WARNING!! point to be removed not found !")
             else:
                 del self.annpoints[index]
+                self.points_index.remove(point)
+                self.points_by_id.remove(point.id, point)
+                self.points_table.remove(point)
                 self.table_needs_update = True
+                self.dirty = True
         else:
             blob = blob_or_point
             try:
@@ -120,7 +202,12 @@ class Annotation(object):
                 print("WARNING!! region to be removed not found !")
             else:
                 del self.seg_blobs[index]
+                self.blobs_index.remove(blob)
+                self.blobs_by_id.remove(blob.id, blob)
+                self.blobs_table.remove(blob)
+                self.shape_descriptors.discard(blob)
                 self.table_needs_update = True
+                self.dirty = True
 
     def updateBlob(self, old_blob, new_blob):
 
@@ -129,10 +216,48 @@ class Annotation(object):
         self.addBlob(new_blob)
         self.table_needs_update = True
 
+    def reindexBlob(self, blob):
+        """
+        Update the spatial index after the geometry of a blob has been modified in place.
+        """
+        if blob in self.blobs_index:
+            self.blobs_index.update(blob, blob.bbox)
+        self.updateBlobAttributes([blob])
+        self.dirty = True
+
+    def updateBlobAttributes(self, blobs=None):
+        """
+        Copy the attributes of the given regions (all the regions by default) in the attribute table.
+        It has to be called when the attributes are modified in place (i.e. genets, surface areas).
+        """
+        if blobs is None:
+            blobs = self.seg_blobs
+
+        table = self.blobs_table
+        columns = table.columns
+        for blob in blobs:
+            row = table.row(blob)
+            if row < 0:
+                continue
+            columns["id"][row] = blob.id
+            columns["genet"][row] = -1 if blob.genet is None else blob.genet
+            columns["area"][row] = blob.area
+            columns["surface_area"][row] = blob.surface_area
+            columns["perimeter"][row] = blob.perimeter
+            columns["centroid"][row] = blob.centroid
+            columns["bbox"][row] = blob.bbox
+
+        self.table_needs_update = True
+
+    def pointBox(self, point):
+        return [point.coordy, point.coordx, 0, 0]
+
     def setBlobClass(self, blob, class_name):
 
         blob.class_name = class_name
+        self.blobs_table.setClass(blob, class_name)
         self.table_needs_update = True
+        self.dirty = True
 
     def setPointClass(self, point, class_name):
 
@@ -141,18 +266,128 @@ class Annotation(object):
         else:
             old_class_name = point.class_name
             point.class_name = class_name
+            self.points_table.setClass(point, class_name)
+            self.dirty = True
 
-    def blobById(self, id):
+    def renameClass(self, old_name, new_name):
+        """
+        Assign the regions and the points of the class old_name to the class new_name.
+        """
         for blob in self.seg_blobs:
-            if blob.id == id:
-                return blob
-        return None
+            if blob.class_name == old_name:
+                blob.class_name = new_name
 
-    def pointById(self, id):
         for point in self.annpoints:
-            if point.id == id:
-                return point
-        return None
+            if point.class_name == old_name:
+                point.class_name = new_name
+
+        self.blobs_table.renameClass(old_name, new_name)
+        self.points_table.renameClass(old_name, new_name)
+        self.table_needs_update = True
+        self.dirty = True
+
+    def tableOf(self, blob_or_point):
+        return self.points_table if type(blob_or_point) == Point else self.blobs_table
+
+    def setClassVisibility(self, labels):
+        """
+        Set the visibility of the classes from the visible flag of the labels (dictionary name -> Label).
+        """
+        self.class_visibility = {name: label.visible for name, label in labels.items()}
+
+    def setVisible(self, blob_or_point, visible):
+        """
+        Set the visibility flag of a region or of a point. It is shown only if also its class is visible.
+        """
+        self.tableOf(blob_or_point).set(blob_or_point, "visible", visible)
+
+    def resetVisibility(self):
+        """
+        Reset the visibility flags of all the regions and the points, only the class visibility is applied.
+        """
+        self.blobs_table.fill("visible", True)
+        self.points_table.fill("visible", True)
+
+    def isVisible(self, blob_or_point):
+        """
+        True if the region (or point) is visible. The objects not in the annotations are visible.
+        """
+        table = self.tableOf(blob_or_point)
+        row = table.row(blob_or_point)
+        if row < 0:
+            return True
+
+        if not table.columns["visible"][row]:
+            return False
+
+        class_name = table.class_names[table.columns["class"][row]]
+        return self.class_visibility.get(class_name, True)
+
+    def visibilityMask(self, table):
+        """
+        Visibility of all the rows of the given table (regions or points table), as a boolean array.
+        """
+        class_visible = table.classValues(self.class_visibility, True, dtype=bool)
+        return table.validRows() & table.column("visible") & class_visible[table.column("class")]
+
+    def selectVisible(self, table, objs):
+
+        # the objects not in the table (row -1) pick the last element, always visible
+        mask = np.append(self.visibilityMask(table), True)
+        keep = mask[table.rowsOf(objs)]
+        return [obj for obj, visible in zip(objs, keep) if visible]
+
+    def visibleBlobs(self, blobs=None):
+        """
+        The visible regions among the given ones (all the regions by default), in the same order.
+        """
+        return self.selectVisible(self.blobs_table, self.seg_blobs if blobs is None else blobs)
+
+    def visiblePoints(self, points=None):
+        """
+        The visible points among the given ones (all the points by default), in the same order.
+        """
+        return self.selectVisible(self.points_table, self.annpoints if points is None else points)
+
+    def isDirty(self):
+        """
+        True if the annotations have been modified since the last save. The attributes edited
+        in place (notes, custom data) are tracked by the dirty flag of each region/point.
+        """
+        if self.dirty:
+            return True
+
+        for blob in self.seg_blobs:
+            if blob.dirty:
+                return True
+
+        for point in self.annpoints:
+            if point.dirty:
+                return True
+
+        return False
+
+    def setClean(self):
+
+        self.dirty = False
+        for blob in self.seg_blobs:
+            blob.dirty = False
+        for point in self.annpoints:
+            point.dirty = False
+
+    def compactContours(self):
+        """
+        Move the contours of all the regions into a single contiguous buffer, the blobs keep views of it.
+        The contours created later (i.e. by editing) are separate arrays until the next compaction.
+        """
+        self.contour_store = ContourStore(self.seg_blobs)
+        self.contour_store.assign(self.seg_blobs)
+
+    def blobById(self, id):
+        return self.blobs_by_id.get(id)
+
+    def pointById(self, id):
+        return self.points_by_id.get(id)
 
     def blobByGenet(self, genet):
         return [blob for blob in self.seg_blobs if blob.genet == genet]
@@ -164,42 +399,58 @@ class Annotation(object):
         return self.annotationsDict
 
     # move to BLOB!
-    def blobsFromMask(self, seg_mask, map_pos_x, map_pos_y, area_mask):
+    def blobsFromMask(self, seg_mask, map_pos_x, map_pos_y, area_mask, workers=None):
         # create the blobs from the segmentation mask
 
-        last_blobs_added = []
-
         #seg_mask = ndi.binary_fill_holes(seg_mask).astype(int)
         label_image = measure.label(seg_mask)
 
         area_th = area_mask * 0.05
 
-        for region in measure.regionprops(label_image):
+        areas = np.bincount(label_image.ravel())
+        masks = []
+        for index, box in enumerate(ndi.find_objects(label_image)):
+            label = index + 1
+            if box is not None and areas[label] > area_th:
+                masks.append((box[0].start, box[1].start, label_image[box] == label))
 
-            if region.area > area_th:
-                blob = Blob(region, map_pos_x, map_pos_y, self.getFreeId())
+        return self.regionsToBlobs(masks, map_pos_x, map_pos_y, workers)
+
+    def regionsToBlobs(self, masks, offset_x, offset_y, workers=None):
+        """
+        Convert the regions, given as (top, left, cropped mask), into blobs. Many regions are converted in parallel
+        by a pool of processes (workers=None means one for each CPU, workers=1 disables it).
+        The free ids are assigned afterwards in the order of the regions, so the result does not depend on the workers.
+        """
 
-                last_blobs_added.append(blob)
+        if workers is None:
+            workers = (os.cpu_count() or 1) if len(masks) >= self.PARALLEL_MIN_REGIONS else 1
 
-        return last_blobs_added
+        if workers <= 1:
+            blobs = blobsFromRegionMasks(masks, offset_x, offset_y)
+        else:
+            chunk_size = max(1, int(np.ceil(len(masks) / (workers * 4))))
+            chunks = [masks[i:i + chunk_size] for i in range(0, len(masks), chunk_size)]
+
+            blobs = []
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = [executor.submit(blobsFromRegionMasks, chunk, offset_x, offset_y) for chunk in chunks]
+                for future in futures:
+                    blobs.extend(future.result())
+
+        ids = self.blobs_by_id.freeIds(len(blobs))
+        for blob, id in zip(blobs, ids):
+            blob.setId(id)
+            blob.instance_name = "region" + str(id)
+
+        return blobs
 
     def getFreeId(self):
-        used = []
-        for blob in self.seg_blobs:
-            used.append(blob.id)
-        for id in range(len(used)):
-            if id not in used:
-                return id
-        return len(used)
+        return self.blobs_by_id.freeId()
 
     def getFreePointId(self):
-        used = []
-        for annpoint in self.annpoints:
-            used.append(annpoint.id)
-        for id in range(len(used)):
-            if id not in used:
-                return id
-        return len(used)
+        return self.points_by_id.freeId()
 
     def union(self, blobs):
         """
@@ -232,6 +483,7 @@ class Annotation(object):
         if mask.any():
             # measure is brutally slower with non int types (factor 4), while byte&bool would be faster by 25%, conversion is fast.
             blobA.updateUsingMask(box, mask.astype(int))
+            self.reindexBlob(blobA)
             return True
         return False
 
@@ -269,6 +521,7 @@ class Annotation(object):
 
         if mask.any():
             blobA.updateUsingMask(bbox, mask.astype(int))
+            self.reindexBlob(blobA)
 
     def cut(self, blob, lines):
         """
@@ -359,13 +612,15 @@ class Annotation(object):
         return blob
 
 
-    def splitBlob(self, map, blob, seeds):
+    def splitBlob(self, cropimg, blob, seeds):
+        """
+        Split the blob using the seeds, cropimg is the image of the bounding box of the blob.
+        """
 
         seeds = np.asarray(seeds)
         seeds = seeds.astype(int)
         mask = blob.getMask()
         box = blob.bbox
-        cropimg = genutils.cropQImage(map, box)
         cropimgnp = rgb2gray(genutils.qimageToNumpyArray(cropimg))
 
         edges = sobel(cropimgnp)
@@ -461,6 +716,7 @@ class Annotation(object):
                 final_mask[tuple(region.coords.T)] = 0
 
         blob.updateUsingMask(box, final_mask)
+        self.reindexBlob(blob)
 
     def editBorder1(self, blob, lines):
         points = [blob.drawLine(line) for line in lines]
@@ -494,6 +750,7 @@ class Annotation(object):
             Mask.paintMask(mask, box, points_mask, points_box, 0)
 
         blob.updateUsingMask(box, mask)
+        self.reindexBlob(blob)
 
     def editBorderContour(self, blob, contour, points):
         snapped_points = np.empty(shape=(0, 2), dtype=int)
@@ -565,9 +822,9 @@ class Annotation(object):
 
         blobs_clicked = []
 
-        for blob in self.seg_blobs:
+        point = np.array([[x, y]])
+        for blob in self.blobs_index.queryPoint(x, y):
 
-            point = np.array([[x, y]])
             out = measure.points_in_poly(point, blob.contour)
             if out[0] == True:
                 blobs_clicked.append(blob)
@@ -588,7 +845,7 @@ class Annotation(object):
         point = np.array([[x, y]])
 
         selected_annpoint = None
-        for annpoint in self.annpoints:
+        for annpoint in self.points_index.queryPoint(x, y, radius=11):
             cx = annpoint.coordx
             cy = annpoint.coordy
             c = np.array([[cx, cy]])
@@ -609,59 +866,114 @@ class Annotation(object):
         Create a label map as a QImage and returns it.
         """
 
-        # create a black canvas of the same size of your map
-        w = size.width()
-        h = size.height()
+        image = self.render_label_map(size, labels_dictionary, working_area)
+        return genutils.rgbToQImage(image)
 
-        imagebox = [0, 0, h, w]
-        image = np.zeros([h, w, 3], np.uint8)
-
-        for i, blob in enumerate(self.seg_blobs):
+    def render_label_map(self, size, labels_dictionary, working_area, class_indices=None, borders=True):
+        """
+        Rasterize the visible regions inside the working area (the whole map if working_area is None),
+        the visibility of the classes is taken from the labels_dictionary (name -> Label).
+        It returns an RGB label map (h x w x 3, uint8) or, if class_indices (class name -> integer) is given,
+        a map of the class indices (h x w); the classes not in class_indices are left to 0.
+        If borders is True, the 1-pixel outer ring of each region is drawn in black (0) over the pixels of
+        the same color, i.e. the boundaries between touching regions of the same class.
+        Where regions overlap the last one in seg_blobs wins, as in the previous per-region drawing.
+        """
 
-            if blob.qpath_gitem is not None:
-                if not blob.qpath_gitem.isVisible():
-                    continue
+        if working_area is None:
+            working_area = [0, 0, size.width(), size.height()]
+
+        top = int(working_area[0])
+        left = int(working_area[1])
+        w = int(working_area[2])
+        h = int(working_area[3])
+
+        # the regions are drawn on a canvas one pixel larger (inside the map) than the working area,
+        # so that the borders of the regions lying just outside it are the same as in the whole map
+        canvas_top = max(top - 1, 0)
+        canvas_left = max(left - 1, 0)
+        canvas_bottom = max(min(top + h + 1, size.height()), canvas_top)
+        canvas_right = max(min(left + w + 1, size.width()), canvas_left)
+
+        self.setClassVisibility(labels_dictionary)
+
+        # visible regions in the drawing order (the order of seg_blobs, the last drawn region covers the others)
+        order = {id(blob): i for i, blob in enumerate(self.seg_blobs)}
+        query_area = [canvas_top, canvas_left, canvas_right - canvas_left, canvas_bottom - canvas_top]
+        blobs = self.visibleBlobs(self.blobs_index.query(query_area))
+        blobs.sort(key=lambda blob: order.get(id(blob), -1))
+
+        canvas_h = canvas_bottom - canvas_top
+        canvas_w = canvas_right - canvas_left
+        if class_indices is None:
+            canvas = np.zeros([canvas_h, canvas_w, 3], np.uint8)
+        else:
+            max_index = max(class_indices.values()) if len(class_indices) > 0 else 0
+            canvas = np.zeros([canvas_h, canvas_w], np.uint8 if max_index < 256 else np.int32)
 
-            if blob.class_name == "Empty":
-                rgb = [255, 255, 255]
-            else:
-                rgb = labels_dictionary[blob.class_name].fill
+        # 4-connected dilation, as skimage binary_dilation
+        kernel = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
 
-            mask = blob.getMask().astype(bool)  # bool is required for bitmask indexing
-            box = blob.bbox.copy()  # blob.bbox is top, left, width, height
-            (box[2], box[3]) = (box[3] + box[0], box[2] + box[1])  # box is now startx, starty, endx, endy
+        for blob in blobs:
 
-            # range is the interection of box and imagebox
-            range = [max(box[0], imagebox[0]), max(box[1], imagebox[1]), min(box[2], imagebox[2]),
-                     min(box[3], imagebox[3])]
-            subimage = image[range[0] - imagebox[0]:range[2] - imagebox[0],
-                       range[1] - imagebox[1]:range[3] - imagebox[1]]
-            submask = mask[range[0] - box[0]:range[2] - box[0], range[1] - box[1]:range[3] - box[1]]
+            if class_indices is None:
+                if blob.class_name == "Empty":
+                    value = [255, 255, 255]
+                else:
+                    value = labels_dictionary[blob.class_name].fill
+            else:
+                # the classes without an index cover the other regions with the background
+                value = class_indices.get(blob.class_name, 0)
+
+            # part of the bounding box of the region (top, left, width, height) inside the canvas
+            y0 = max(int(blob.bbox[0]), canvas_top)
+            x0 = max(int(blob.bbox[1]), canvas_left)
+            y1 = min(int(blob.bbox[0]) + int(blob.bbox[3]), canvas_bottom)
+            x1 = min(int(blob.bbox[1]) + int(blob.bbox[2]), canvas_right)
+            if y1 <= y0 or x1 <= x0:
+                continue
 
-            # use the binary mask to assign a color
-            subimage[submask] = rgb
+            # same mask as Blob.getMask(), restricted to the canvas
+            origin = np.array([x0, y0])
+            mask = np.zeros([y1 - y0, x1 - x0], np.uint8)
+            fillPoly(mask, pts=[blob.contour.round().astype(np.int32) - origin], color=1)
+            for inner_contour in blob.inner_contours:
+                fillPoly(mask, pts=[inner_contour.round().astype(np.int32) - origin], color=0)
+            region = mask > 0
+
+            subimage = canvas[y0 - canvas_top:y1 - canvas_top, x0 - canvas_left:x1 - canvas_left]
+            subimage[region] = value
+
+            if borders:
+                # 1px border: dilate then subtract the mask, drawn only over the pixels of the same color
+                border = (cv2.dilate(mask, kernel) > 0) & ~region
+                if class_indices is None:
+                    samecolor = np.all(subimage == value, axis=-1)
+                else:
+                    samecolor = subimage == value
+                subimage[border & samecolor] = 0
 
-            # create 1px border: dilate then subtract the mask.
-            border = binary_dilation(submask) & ~submask
+        if class_indices is None:
+            image = np.zeros([h, w, 3], np.uint8)
+        else:
+            image = np.zeros([h, w], canvas.dtype)
 
-            # select only the border over blobs of the same color and draw the border
-            samecolor = np.all(subimage == rgb, axis=-1)
-            subimage[border & samecolor] = [0, 0, 0]
+        # the working area inside the canvas (the parts outside the map stay at 0)
+        y0 = max(top, canvas_top)
+        x0 = max(left, canvas_left)
+        y1 = min(top + h, canvas_bottom)
+        x1 = min(left + w, canvas_right)
+        if y1 > y0 and x1 > x0:
+            image[y0 - top:y1 - top, x0 - left:x1 - left] = \
+                canvas[y0 - canvas_top:y1 - canvas_top, x0 - canvas_left:x1 - canvas_left]
 
-        labelimg = genutils.rgbToQImage(image)
-
-        if working_area is not None:
-            # FIXME: this is inefficient! The working_area should be used during the drawing.
-            labelimg_cropped = genutils.cropQImage(labelimg, working_area)
-            return labelimg_cropped
-        else:
-            return labelimg
+        return image
 
     def calculate_inner_blobs(self, working_area):
         """
         This consider only blobs falling ENTIRELY in the working area"
         """
-        selected_blobs = self.seg_blobs
+        selected_blobs = self.blobs_index.query(working_area)
         inner_blobs = []
         for blob in selected_blobs:
             if Mask.insideBox(working_area, blob.bbox):
@@ -673,7 +985,7 @@ class Annotation(object):
         """
         This consider only blobs inside or intersecting the working area"
         """
-        selected_blobs = self.seg_blobs
+        selected_blobs = self.blobs_index.query(working_area)
         intersecting_blobs = []
         for blob in selected_blobs:
             if Mask.checkIntersection(working_area, blob.bbox):
@@ -686,7 +998,7 @@ class Annotation(object):
         """
         This consider only points having center inside the working area"
         """
-        selected_annpoints = self.annpoints
+        selected_annpoints = self.points_index.query(working_area)
         inner_annpoints = []
         for annpoint in selected_annpoints:
             if (annpoint.coordy > working_area[0]) and (annpoint.coordy < working_area[0] + working_area[3]):
@@ -697,35 +1009,59 @@ class Annotation(object):
         return inner_annpoints
 
 
+    def perclassStatistics(self, pixel_size):
+        """
+        This consider all the existing blobs and points, inside and outside the working area.
+        It returns three dictionaries class name -> value: number of blobs, coverage and number of points.
+        """
+        counts = self.blobs_table.classTotals()
+        areas = self.blobs_table.classTotals("area")
+        coverage = {name: round((area * pixel_size * pixel_size) / 100.0, 2) for name, area in areas.items()}
+        point_counts = self.points_table.classTotals()
+
+        return counts, coverage, point_counts
+
     def calculate_perclass_blobs_value(self, label, pixel_size):
         """
         This consider all the existing blobs, inside and outside the working area.
         It returns number of blobs and coverage.
         """
-        count = 0
-        tot_area = 0.0
-        for blob in self.seg_blobs:
-            if blob.class_name == label.name:
-                count = count + 1
-                tot_area = tot_area + blob.area
-        tot_area = round((tot_area * pixel_size * pixel_size) / 100.0, 2)
-
-        return count, tot_area
+        counts, coverage, point_counts = self.perclassStatistics(pixel_size)
+        return counts.get(label.name, 0), coverage.get(label.name, 0.0)
 
     def countPoints(self, label):
         """
         This consider all the existing points, inside and outside the working area.
         It returns number of points per label
         """
-        count = 0
-        tot_area = 0.0
-        for annpoint in self.annpoints:
-            if annpoint.class_name == label.name:
-                count = count + 1
-        return count
+        return self.points_table.classTotals().get(label.name, 0)
+
+    def regionsColumns(self, blobs, scale_factor):
+        """
+        Exported measures of the given regions, as columns (id, class, genet, centroid, area, surface area, perimeter).
+        Areas are in cm^2 and perimeters in cm, given the pixel size (scale_factor, in mm).
+        """
+        table = self.blobs_table
+        rows = table.rowsOf(blobs)
+        centroids = table.columns["centroid"][rows]
+        surface_areas = table.columns["surface_area"][rows]
+        genets = table.columns["genet"][rows]
+
+        # same operations order as the per-object computation, so that the rounded values do not change;
+        # the centroids were numpy values (numpy rounding), areas and perimeters Python floats (Python rounding)
+        return {
+            "id": table.columns["id"][rows],
+            "class": table.classNames(table.columns["class"][rows]),
+            "genet": np.where(genets < 0, 0, genets),
+            "cx": np.round(centroids[:, 0], 1),
+            "cy": np.round(centroids[:, 1], 1),
+            "area": roundValues(table.columns["area"][rows] * scale_factor * scale_factor / 100, 2),
+            "surface_area": np.where(surface_areas > 0.0, roundValues(surface_areas * scale_factor * scale_factor / 100, 2), 0.0),
+            "perimeter": roundValues(table.columns["perimeter"][rows] * scale_factor / 10, 1)
+        }
 
 
-    def import_label_map(self, filename, labels_dictionary, offset, scale, create_holes=False):
+    def import_label_map(self, filename, labels_dictionary, offset, scale, create_holes=False, workers=None):
         """
         It imports a label map and create the corresponding blobs.
         The offset is stored as a [top, left] coordinates and scale are the scale factors of X and Y axis respectively.
@@ -744,32 +1080,76 @@ class Annotation(object):
         # RGB -> label code association (ok, it is a dirty trick but it saves time..)
         label_coded = label_map[:, :, 0] + (label_map[:, :, 1] << 8) + (label_map[:, :, 2] << 16)
 
+        classes = {}
+        for key in labels_dictionary.keys():
+            c = labels_dictionary[key].fill
+            code = c[0] + (c[1] << 8) + (c[2] << 16)
+            if code not in classes:
+                classes[code] = labels_dictionary[key].name
+
+        return self.blobsFromLabelCodes(label_coded, classes, offset, create_holes, workers)
+
+    def import_label_indices(self, label_indices, class_names, offset, scale, create_holes=False, workers=None):
+        """
+        It imports a map of class indices (for example the label raster written by the MapClassifier) and
+        create the corresponding blobs. class_names[i] is the name of the class of index i (None for the background).
+        The offset is stored as a [top, left] coordinates and scale are the scale factors of X and Y axis respectively.
+        """
+
+        # label map rescaling (if necessary)
+        w_rescaled = round(label_indices.shape[1] * scale[0])
+        h_rescaled = round(label_indices.shape[0] * scale[1])
+        if w_rescaled != label_indices.shape[1] or h_rescaled != label_indices.shape[0]:
+            label_indices = cv2.resize(np.asarray(label_indices, dtype=np.uint8), dsize=(w_rescaled, h_rescaled),
+                                       interpolation=cv2.INTER_NEAREST)
+
+        # index -> label code (the code 0 is reserved to the background)
+        lut = np.zeros(256, dtype=np.int32)
+        classes = {}
+        for index, name in enumerate(class_names):
+            if name is not None:
+                lut[index] = index + 1
+                classes[index + 1] = name
+
+        label_coded = lut[np.asarray(label_indices, dtype=np.uint8)]
+
+        return self.blobsFromLabelCodes(label_coded, classes, offset, create_holes, workers)
+
+    def blobsFromLabelCodes(self, label_coded, classes, offset, create_holes=False, workers=None):
+        """
+        Create the blobs corresponding to the connected regions of a map of label codes (0 is the background).
+        classes is the dictionary label code -> class name; regions with an unknown code are 'Empty'.
+        See regionsToBlobs() for the parallel conversion (workers).
+        """
+
         labels = measure.label(label_coded, connectivity=1)
 
         too_much_small_area = 50
-        region_big = None
 
-        offset_x = offset[1]
-        offset_y = offset[0]
-        created_blobs = []
-        for region in measure.regionprops(labels):
-            if region.area > too_much_small_area:
-                id = len(self.seg_blobs)
+        areas = np.bincount(labels.ravel())
+        slices = ndi.find_objects(labels)
 
-                blob = Blob(region, offset_x, offset_y, self.getFreeId())
+        # regions to convert, in label order
+        masks = []
+        class_names = []
+        for index, box in enumerate(slices):
+            label = index + 1
+            if box is None or areas[label] <= too_much_small_area:
+                continue
+
+            mask = labels[box] == label
+            code = label_coded[box][mask][0]
+            class_name = classes.get(code, "Empty")
+            if create_holes or class_name != 'Empty':
+                masks.append((box[0].start, box[1].start, mask))
+                class_names.append(class_name)
 
-                # assign class
-                row = region.coords[0, 0]
-                col = region.coords[0, 1]
-                color = label_map[row, col]
+        offset_x = offset[1]
+        offset_y = offset[0]
+        created_blobs = self.regionsToBlobs(masks, offset_x, offset_y, workers)
 
-                for key in labels_dictionary.keys():
-                    c = labels_dictionary[key].fill
-                    if c[0] == color[0] and c[1] == color[1] and c[2] == color[2]:
-                        blob.class_name = labels_dictionary[key].name
-                        break
-                if create_holes or blob.class_name != 'Empty':
-                    created_blobs.append(blob)
+        for blob, class_name in zip(created_blobs, class_names):
+            blob.class_name = class_name
 
         return created_blobs
 
@@ -779,36 +1159,21 @@ class Annotation(object):
         scale_factor = image.pixelSize()
         date = image.acquisition_date
 
-        # create a list of instances
-
-        blobindexlist = []
-        pointindexlist = []
-
         # check visibility and working area of both
         if working_area is None:
             # all the blobs are considered
             self.blobs = self.seg_blobs
+            annpoints = self.annpoints
 
         else:
             # only blobs and points inside the working area are considered
             self.blobs = self.calculate_inner_blobs(working_area)
-            self.annpoints = self.calculate_inner_points(working_area)
+            annpoints = self.calculate_inner_points(working_area)
 
-        visible_blobs = []
+        self.setClassVisibility(project.labels)
 
-        for blob in self.blobs:
-            if blob.qpath_gitem.isVisible():
-                index = blob.blob_name
-                blobindexlist.append(index)
-                visible_blobs.append(blob)
-
-        visible_points = []
-
-        for annpoint in self.annpoints:
-            if annpoint.cross1_gitem.isVisible():
-                point_id = annpoint.id
-                pointindexlist.append(point_id)
-                visible_points.append(annpoint)
+        visible_blobs = self.visibleBlobs(self.blobs)
+        visible_points = self.visiblePoints(annpoints)
 
         if choice == 'Regions':
             visible_points = []
@@ -816,23 +1181,31 @@ class Annotation(object):
         if choice == 'Points':
             visible_blobs = []
 
-        number_of_rows = len(visible_blobs) + len(visible_points)
+        number_of_blobs = len(visible_blobs)
+        number_of_points = len(visible_points)
+        number_of_rows = number_of_blobs + number_of_points
+
+        # the measures are taken column-wise from the attribute tables
+        regions = self.regionsColumns(visible_blobs, scale_factor)
+        point_coords = self.points_table.gather(visible_points, "coords")
+        point_classes = self.points_table.classNames(self.points_table.gather(visible_points, "class"))
+        no_points = np.zeros(number_of_points)
 
         # create a common dictionary
 
         dict = {
-            'Image name': [],
-            'TagLab Date': [],
-            'TagLab Type': [],
-            'TagLab Genet Id': np.zeros(number_of_rows, dtype=np.int64),
-            'TagLab Id': np.zeros(number_of_rows, dtype=np.int64),
-            'TagLab Class name': [],
-            'TagLab Centroid x': np.zeros(number_of_rows),
-            'TagLab Centroid y': np.zeros(number_of_rows),
-            'TagLab Perimeter': np.zeros(number_of_rows),
-            'TagLab Area': np.zeros(number_of_rows),
-            'TagLab Surf. area': np.zeros(number_of_rows),
-            'TagLab Note': []}
+            'Image name': [imagename] * number_of_rows,
+            'TagLab Date': [date] * number_of_rows,
+            'TagLab Type': ['Region'] * number_of_blobs + ['Points'] * number_of_points,
+            'TagLab Genet Id': np.concatenate([regions["genet"], no_points.astype(np.int64)]),
+            'TagLab Id': np.concatenate([regions["id"], self.points_table.gather(visible_points, "id")]),
+            'TagLab Class name': regions["class"] + point_classes,
+            'TagLab Centroid x': np.concatenate([regions["cx"], roundValues(point_coords[:, 0], 1)]),
+            'TagLab Centroid y': np.concatenate([regions["cy"], roundValues(point_coords[:, 1], 1)]),
+            'TagLab Perimeter': np.concatenate([regions["perimeter"], no_points]),
+            'TagLab Area': np.concatenate([regions["area"], no_points]),
+            'TagLab Surf. area': np.concatenate([regions["surface_area"], no_points]),
+            'TagLab Note': [blob.note for blob in visible_blobs] + [annpoint.note for annpoint in visible_points]}
 
         # Are attributes named the same? Check
         for attribute in project.region_attributes.data:
@@ -847,35 +1220,15 @@ class Annotation(object):
                 # unknown attribute type, not saved
                 pass
 
-        # fill it
-        i = 0
-
-        for blob in visible_blobs:
-            dict['Image name'].append(imagename)
-            dict['TagLab Id'][i] = blob.id
-            dict['TagLab Type'].append('Region')
-            dict['TagLab Date'].append(date)
-            dict['TagLab Class name'].append(blob.class_name)
-            dict['TagLab Centroid x'][i] = round(blob.centroid[0], 1)
-            dict['TagLab Centroid y'][i] = round(blob.centroid[1], 1)
-            dict['TagLab Area'][i] = round(blob.area * scale_factor * scale_factor / 100, 2)
-            if blob.surface_area > 0.0:
-
-                dict['TagLab Surf. area'][i] = round(blob.surface_area * scale_factor * scale_factor / 100, 2)
-
-            dict['TagLab Perimeter'][i] = round(blob.perimeter * scale_factor / 10, 1)
-
-            if blob.genet is not None:
-                dict['TagLab Genet Id'][i] = blob.genet
-
-            dict['TagLab Note'].append(blob.note)
+        # fill the custom attributes, regions first and then points
+        for i, blob_or_point in enumerate(visible_blobs + visible_points):
 
             for attribute in project.region_attributes.data:
 
                 key = attribute["name"]
 
                 try:
-                    value = blob.data[key]
+                    value = blob_or_point.data[key]
                 except:
                     value = None
 
@@ -899,54 +1252,6 @@ class Annotation(object):
                     else:
                         dict[key].append('')
 
-            i = i + 1
-
-        j = len(visible_blobs)
-        for annpoint in visible_points:
-            dict['Image name'].append(imagename)
-            dict['TagLab Id'][j] = annpoint.id
-            dict['TagLab Type'].append('Points')
-            dict['TagLab Date'].append(date)
-            dict['TagLab Class name'].append(annpoint.class_name)
-            dict['TagLab Centroid x'][j] = round(annpoint.coordx, 1)
-            dict['TagLab Centroid y'][j] = round(annpoint.coordy, 1)
-            dict['TagLab Area'][j] = int(0)
-            dict['TagLab Surf. area'][j] = int(0)
-            dict['TagLab Perimeter'][j] = int(0)
-            dict['TagLab Genet Id'][j] = int(0)
-            dict['TagLab Note'].append(annpoint.note)
-
-            for attribute in project.region_attributes.data:
-
-                key = attribute["name"]
-
-                try:
-                    value = annpoint.data[key]
-                except:
-                    value = None
-
-                if attribute['type'] == 'integer number':
-
-                    if value is not None:
-                        dict[key][j] = value
-                    else:
-                        dict[key][j] = 0
-
-                elif attribute['type'] == 'decimal number':
-
-                    if value is not None:
-                        dict[key][j] = value
-                    else:
-                        dict[key][j] = np.NaN
-
-                else:
-                    if value is not None:
-                        dict[key].append(value)
-                    else:
-                        dict[key].append('')
-
-            j = j+1
-
         # create dataframe
         df = pd.DataFrame(dict, columns=list(dict.keys()))
         df.to_csv(filename, sep=',', index=False)
@@ -1106,8 +1411,7 @@ class Annotation(object):
         basename = os.path.basename(image_name).split(".")[0]
 
         # Get the dimensions
-        width = channel.qimage.width()
-        height = channel.qimage.height()
+        (width, height) = channel.size()
 
         # Read in the csv file
         points = pd.read_csv(file_name, sep=r'[;,]', header=0, engine='python')
@@ -1227,8 +1531,7 @@ class Annotation(object):
         else:
             top = 0
             left = 0
-            bottom = channel.qimage.height()
-            right = channel.qimage.width()
+            (right, bottom) = channel.size()
 
         # Loop through point annotations, find those inside the box
         points = []
@@ -1268,7 +1571,7 @@ class Annotation(object):
         # Get the image basename
         _, image_name = os.path.split(channel.filename)
         basename = os.path.basename(image_name).split('.')[0]
-        img_width, img_height = channel.qimage.width(), channel.qimage.height()
+        img_width, img_height = channel.size()
 
         # Create the output directory to be based on ortho name
         now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -1310,7 +1613,7 @@ class Annotation(object):
             bbox = [top, left, width, height]
 
             # Cropping the tile from original ortho
-            img_tile = genutils.cropQImage(channel.qimage, bbox)
+            img_tile = channel.readRegionAsQImage(bbox)
 
             # Naming convention
             plot_idx = 0
@@ -1342,7 +1645,7 @@ class Annotation(object):
                     bbox = [yoff, xoff, w_size, h_size]
 
                     # Cropping the tile from original ortho
-                    img_tile = genutils.cropQImage(channel.qimage, bbox)
+                    img_tile = channel.readRegionAsQImage(bbox)
 
                     # Naming convention
                     plot_idx = i + j * w_step
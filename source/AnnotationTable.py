@@ -0,0 +1,211 @@
+# TagLab
+# A semi-automatic segmentation tool
+#
+# Copyright(C) 2020
+# Visual Computing Lab
+# ISTI - Italian National Research Council
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License (http://www.gnu.org/licenses/gpl.txt)
+# for more details.
+
+import numpy as np
+
+
+class AnnotationTable(object):
+    """
+    Columnar table of the attributes of the annotations (regions or points) of an image.
+    Each object has a row (the rows of the removed objects are reused), each attribute is a NumPy column,
+    so the attributes of all the objects can be processed at once (masks, per-class statistics).
+    The class of an object is stored as an integer code (see classCode).
+    """
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self):
+
+        # id(object) -> row
+        self.rows = {}
+        self.free_rows = []
+        self.size = 0
+        self.capacity = AnnotationTable.INITIAL_CAPACITY
+
+        # rows in use
+        self.valid = np.zeros(self.capacity, dtype=bool)
+
+        self.columns = {}
+        self.defaults = {}
+
+        # class name <-> class code
+        self.class_names = []
+        self.class_codes = {}
+
+        self.addColumn("class", np.int32, -1)
+        # per-object visibility flag (the class visibility is handled by the Annotation)
+        self.addColumn("visible", bool, True)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, obj):
+        return id(obj) in self.rows
+
+    def addColumn(self, name, dtype, default, shape=()):
+        """
+        Add a column, the existing rows are set to the default value.
+        """
+        self.columns[name] = np.full((self.capacity,) + tuple(shape), default, dtype=dtype)
+        self.defaults[name] = default
+
+    def column(self, name):
+        """
+        The column over all the rows (also the not valid ones, see valid).
+        """
+        return self.columns[name][:self.size]
+
+    def validRows(self):
+        return self.valid[:self.size]
+
+    def classCode(self, class_name):
+        """
+        The code of the given class, a new code is allocated for an unknown class.
+        """
+        code = self.class_codes.get(class_name)
+        if code is None:
+            code = len(self.class_names)
+            self.class_names.append(class_name)
+            self.class_codes[class_name] = code
+        return code
+
+    def classValues(self, values, default, dtype=None):
+        """
+        Per-class array from a dictionary class name -> value (default for the classes not in the dictionary),
+        indexed by class code.
+        """
+        return np.array([values.get(name, default) for name in self.class_names], dtype=dtype)
+
+    def renameClass(self, old_name, new_name):
+        """
+        Rename a class. If the new class already exists the two classes are merged.
+        """
+        code = self.class_codes.pop(old_name, None)
+        if code is None:
+            return
+
+        new_code = self.class_codes.get(new_name)
+        if new_code is None:
+            self.class_names[code] = new_name
+            self.class_codes[new_name] = code
+        else:
+            # the old code stays allocated but it is no longer used
+            self.class_names[code] = None
+            classes = self.column("class")
+            classes[classes == code] = new_code
+
+    def grow(self):
+
+        capacity = self.capacity * 2
+        self.valid = np.concatenate([self.valid, np.zeros(capacity - self.capacity, dtype=bool)])
+        for name, column in self.columns.items():
+            extra = np.full((capacity - self.capacity,) + column.shape[1:], self.defaults[name], dtype=column.dtype)
+            self.columns[name] = np.concatenate([column, extra])
+        self.capacity = capacity
+
+    def insert(self, obj, class_name):
+
+        key = id(obj)
+        if key in self.rows:
+            self.setClass(obj, class_name)
+            return self.rows[key]
+
+        if len(self.free_rows) > 0:
+            row = self.free_rows.pop()
+        else:
+            if self.size == self.capacity:
+                self.grow()
+            row = self.size
+            self.size += 1
+
+        for name, column in self.columns.items():
+            column[row] = self.defaults[name]
+        self.columns["class"][row] = self.classCode(class_name)
+
+        self.valid[row] = True
+        self.rows[key] = row
+        return row
+
+    def remove(self, obj):
+
+        row = self.rows.pop(id(obj), None)
+        if row is not None:
+            self.valid[row] = False
+            self.free_rows.append(row)
+
+    def row(self, obj):
+        """
+        Row of the given object, -1 if the object is not in the table.
+        """
+        return self.rows.get(id(obj), -1)
+
+    def rowsOf(self, objs):
+        """
+        Rows of the given objects, -1 for the objects not in the table.
+        """
+        rows = self.rows
+        return np.fromiter((rows.get(id(obj), -1) for obj in objs), dtype=np.int64, count=len(objs))
+
+    def gather(self, objs, name):
+        """
+        Values of a column for the given objects (in the same order), the objects must be in the table.
+        """
+        return self.columns[name][self.rowsOf(objs)]
+
+    def classNames(self, codes):
+        """
+        Class names of the given class codes, as a list.
+        """
+        names = np.array(self.class_names + [None], dtype=object)
+        return names[codes].tolist()
+
+    def classTotals(self, weights=None):
+        """
+        Number of objects of each class or, if weights is given, sum of the weights column of each class.
+        It returns a dictionary class name -> value.
+        """
+        valid = self.validRows()
+        classes = self.column("class")[valid]
+        if weights is not None:
+            weights = self.column(weights)[valid]
+
+        totals = np.bincount(classes, weights=weights, minlength=len(self.class_names))
+        return {name: total for name, total in zip(self.class_names, totals.tolist()) if name is not None}
+
+    def get(self, obj, name, default=None):
+
+        row = self.rows.get(id(obj))
+        if row is None:
+            return default
+        return self.columns[name][row]
+
+    def set(self, obj, name, value):
+
+        row = self.rows.get(id(obj))
+        if row is not None:
+            self.columns[name][row] = value
+
+    def setClass(self, obj, class_name):
+        self.set(obj, "class", self.classCode(class_name))
+
+    def fill(self, name, value):
+        """
+        Set the given value in all the rows of a column.
+        """
+        self.columns[name][:] = value
@@ -0,0 +1,140 @@
+# TagLab
+# A semi-automatic segmentation tool
+#
+# Copyright(C) 2020
+# Visual Computing Lab
+# ISTI - Italian National Research Council
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License (http://www.gnu.org/licenses/gpl.txt)
+# for more details.
+
+import numpy as np
+
+
+class AreaMetrics(object):
+    """
+    Landscape metrics (number of colonies, coverage and Patch Size Coefficient of Variation of each class)
+    of many rectangular areas of the map, evaluated in batches (see NewDataset.findAreas).
+
+    The coverage is given by an integral image (summed-area table) of each class of the label map, so it costs O(1)
+    for each area. The number of colonies and the PSCV are computed with vectorized bounding box tests between
+    a batch of areas and the blobs of each class; a blob is counted if its bounding box is inside the area for 3/4.
+    Only the non-background classes are evaluated, in the order of the target classes.
+    """
+
+    # maximum number of (area, blob) pairs tested at once
+    BATCH_PAIRS = 1 << 22
+
+    def __init__(self, labels, blobs, target_classes, frequencies):
+
+        self.labels = labels
+        self.class_names = [key for key in target_classes.keys() if key != "Background"]
+        self.label_codes = [target_classes[key] for key in self.class_names]
+
+        # bounding boxes (top, left, width, height) and areas of the blobs of each class,
+        # the classes not present in the map have no blobs
+        self.boxes = []
+        self.areas = []
+        for key in self.class_names:
+            class_blobs = []
+            if frequencies[key] > 0.0:
+                class_blobs = [blob for blob in blobs if blob.class_name == key]
+
+            self.boxes.append(np.array([blob.bbox for blob in class_blobs], dtype=float).reshape(-1, 4))
+            self.areas.append(np.array([blob.area for blob in class_blobs], dtype=float))
+
+    def integralImage(self, label_code):
+        """
+        Summed-area table of the pixels with the given label code, with a leading row and column of zeros.
+        """
+        (h, w) = self.labels.shape
+        dtype = np.int32 if h * w < 2**31 else np.int64
+
+        integral = np.zeros((h + 1, w + 1), dtype=dtype)
+        np.cumsum(self.labels == label_code, axis=0, dtype=dtype, out=integral[1:, 1:])
+        np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+        return integral
+
+    def coverage(self, integral, areas):
+        """
+        Fraction of the pixels of each area counted by the given integral image.
+        """
+        (h, w) = self.labels.shape
+        top = np.clip(areas[:, 0], 0, h).astype(int)
+        left = np.clip(areas[:, 1], 0, w).astype(int)
+        bottom = np.clip(areas[:, 0] + areas[:, 3], 0, h).astype(int)
+        right = np.clip(areas[:, 1] + areas[:, 2], 0, w).astype(int)
+
+        count = integral[bottom, right] - integral[top, right] - integral[bottom, left] + integral[top, left]
+        return count / (areas[:, 2] * areas[:, 3])
+
+    def insideMatrix(self, areas, boxes, threshold):
+        """
+        Boolean matrix (areas x blobs), True if the bounding box of the blob is inside the area
+        more than the given threshold (see NewDataset.checkBlobInside).
+        """
+        x_left = np.maximum(areas[:, 1, None], boxes[None, :, 1])
+        y_top = np.maximum(areas[:, 0, None], boxes[None, :, 0])
+        x_right = np.minimum(areas[:, 1, None] + areas[:, 2, None], boxes[None, :, 1] + boxes[None, :, 2])
+        y_bottom = np.minimum(areas[:, 0, None] + areas[:, 3, None], boxes[None, :, 0] + boxes[None, :, 3])
+
+        intersection = (x_right - x_left) * (y_bottom - y_top)
+        intersection[(x_right < x_left) | (y_bottom < y_top)] = 0.0
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return intersection / (boxes[None, :, 2] * boxes[None, :, 3]) > threshold
+
+    def evaluate(self, areas):
+        """
+        Metrics of a list of areas [top, left, width, height]. It returns the number of colonies, the coverage
+        and the PSCV as arrays of shape (number of areas, number of classes).
+        """
+
+        areas = np.array(areas, dtype=float).reshape(-1, 4)
+        shape = (areas.shape[0], len(self.class_names))
+
+        number = np.zeros(shape, dtype=int)
+        coverage = np.zeros(shape)
+        PSCV = np.zeros(shape)
+
+        for c, label_code in enumerate(self.label_codes):
+
+            # one integral image at a time
+            integral = self.integralImage(label_code)
+            coverage[:, c] = self.coverage(integral, areas)
+            del integral
+
+            boxes = self.boxes[c]
+            blob_areas = self.areas[c]
+            if len(blob_areas) == 0:
+                continue
+
+            # the areas are centered to compute the variance without loss of precision
+            offset = blob_areas.mean()
+            centered = blob_areas - offset
+
+            batch = max(1, self.BATCH_PAIRS // len(blob_areas))
+            for start in range(0, areas.shape[0], batch):
+                inside = self.insideMatrix(areas[start:start + batch], boxes, 3.0 / 4.0).astype(float)
+
+                n = inside.sum(axis=1)
+                s1 = inside @ centered
+                s2 = inside @ (centered * centered)
+
+                number[start:start + batch, c] = n
+
+                valid = n > 0
+                mean = s1[valid] / n[valid]
+                std = np.sqrt(np.maximum(s2[valid] / n[valid] - mean * mean, 0.0))
+                PSCV[start:start + batch, c][valid] = (100.0 * std) / (mean + offset)
+
+        return number, coverage, PSCV
@@ -23,8 +23,7 @@ import numpy as np
 
 from skimage import measure
 from scipy import ndimage as ndi
-from PyQt5.QtGui import QPainterPath, QPolygonF
-from PyQt5.QtCore import QPointF
+from PyQt5.QtGui import QPainterPath
 
 from skimage.morphology import square, binary_dilation, binary_erosion
 from skimage.measure import points_in_poly
@@ -41,8 +40,13 @@ class Blob(object):
     Blob data. A blob is a group of pixels.
     It can be tagged with the class and other information.
     It is stored as an outer contour (the border) plus a list of inner contours (holes).
+    The contours can be views of the contiguous buffer of the annotations (see Annotation.compactContours).
     """
 
+    __slots__ = ("version", "id", "id_item", "instance_name", "blob_name", "class_name", "genet", "note", "data",
+                 "area", "surface_area", "perimeter", "centroid", "bbox", "contour", "inner_contours",
+                 "qpath", "qpath_gitem", "correspondence_to_check", "dirty")
+
     def __init__(self, region, offset_x, offset_y, id):
         self.version = 0
         self.id = int(id)
@@ -70,6 +74,9 @@ class Blob(object):
 
         self.correspondence_to_check = False
 
+        # attributes modified in place since the last save (see Annotation.isDirty)
+        self.dirty = False
+
         if region:
 
             # extract properties
@@ -138,28 +145,14 @@ class Blob(object):
         return blob
 
     def __deepcopy__(self, memo):
-        #avoid recursion!
-        deepcopy_method = self.__deepcopy__
-        self.__deepcopy__ = None
-        #save and later restore qobjects
-        path = self.qpath
-        pathitem = self.qpath_gitem
-        #no deep copy for qobjects
-        self.qpath = None
-        self.qpath_gitem = None
-
-        blob = copy.deepcopy(self)
-        blob.contour = self.contour.copy()
-        blob.inner_contours.clear()
-        for inner in self.inner_contours:
-            blob.inner_contours.append(inner.copy())
-
-        blob.qpath = None
-        blob.qpath_gitem = None
-        self.qpath = path
-        self.qpath_gitem = pathitem
-        #restore deepcopy (also to the newly created Blob!
-        blob.__deepcopy__ = self.__deepcopy__ = deepcopy_method
+        blob = Blob.__new__(Blob)
+        memo[id(self)] = blob
+        for name in Blob.__slots__:
+            #no deep copy for qobjects
+            if name == "qpath" or name == "qpath_gitem":
+                setattr(blob, name, None)
+            else:
+                setattr(blob, name, copy.deepcopy(getattr(self, name), memo))
         return blob
 
     def setId(self, id):
@@ -275,31 +268,18 @@ class Blob(object):
 
             # adjust the coordinates of the outer contour
             # (NOTE THAT THE COORDINATES OF THE BBOX ARE IN THE GLOBAL MAP COORDINATES SYSTEM)
-            for i in range(self.contour.shape[0]):
-                ycoor = self.contour[i, 0]
-                xcoor = self.contour[i, 1]
-                self.contour[i, 0] = xcoor - PADDED_SIZE + bbox[1]
-                self.contour[i, 1] = ycoor - PADDED_SIZE + bbox[0]
+            self.contour = self.contourToMap(self.contour, bbox, PADDED_SIZE)
 
             # adjust coordinates of the INNER contours
-            for j, contour in enumerate(self.inner_contours):
-                for i in range(contour.shape[0]):
-                    ycoor = contour[i, 0]
-                    xcoor = contour[i, 1]
-                    self.inner_contours[j][i, 0] = xcoor - PADDED_SIZE + bbox[1]
-                    self.inner_contours[j][i, 1] = ycoor - PADDED_SIZE + bbox[0]
+            self.inner_contours = [self.contourToMap(contour, bbox, PADDED_SIZE) for contour in self.inner_contours]
+
         elif number_of_contours == 1:
 
             coords = measure.approximate_polygon(contours[0], tolerance=0.2)
-            self.contour = np.array(coords)
 
             # adjust the coordinates of the outer contour
             # (NOTE THAT THE COORDINATES OF THE BBOX ARE IN THE GLOBAL MAP COORDINATES SYSTEM)
-            for i in range(self.contour.shape[0]):
-                ycoor = self.contour[i, 0]
-                xcoor = self.contour[i, 1]
-                self.contour[i, 0] = xcoor - PADDED_SIZE + bbox[1]
-                self.contour[i, 1] = ycoor - PADDED_SIZE + bbox[0]
+            self.contour = self.contourToMap(coords, bbox, PADDED_SIZE)
         else:
             raise Exception("Empty contour")
         #TODO optimize the bbox
@@ -375,29 +355,39 @@ class Blob(object):
 
 
 
+    def contourToMap(self, contour, bbox, padding):
+        """
+        Convert a contour returned by find_contours, (row, col) in the padded mask, to the (x, y) map coordinates.
+        """
+        contour = np.asarray(contour, dtype=float)
+        offset = np.array([bbox[1], bbox[0]], dtype=float)
+        return (contour[:, ::-1] - padding) + offset
+
     def setupForDrawing(self):
         """
         Create the QPolygon and the QPainterPath according to the blob's contours.
         """
 
+        self.qpath = self.createQPath()
+
+    def createQPath(self):
+        """
+        QPainterPath of the blob's contours.
+        """
+
         # QPolygon to draw the blob
         #working with mask the center of the pixels is in 0, 0
         #if drawing the center of the pixel is 0.5, 0.5
-        qpolygon = QPolygonF()
-        for i in range(self.contour.shape[0]):
-            qpolygon << QPointF(self.contour[i, 0] + 0.5, self.contour[i, 1] + 0.5)
-
-        self.qpath = QPainterPath()
-        self.qpath.addPolygon(qpolygon)
+        qpath = QPainterPath()
+        qpath.addPolygon(genutils.numpyToQPolygonF(self.contour, 0.5))
+        qpath.closeSubpath()
 
+        # the holes are added as sub-paths, the odd-even fill rule of the path leaves them empty
         for inner_contour in self.inner_contours:
-            qpoly_inner = QPolygonF()
-            for i in range(inner_contour.shape[0]):
-                qpoly_inner << QPointF(inner_contour[i, 0] + 0.5, inner_contour[i, 1] + 0.5)
+            qpath.addPolygon(genutils.numpyToQPolygonF(inner_contour, 0.5))
+            qpath.closeSubpath()
 
-            path_inner = QPainterPath()
-            path_inner.addPolygon(qpoly_inner)
-            self.qpath = self.qpath.subtracted(path_inner)
+        return qpath
 
     #bbox is used to place the mask!
     def calculateCentroid(self, mask, bbox):
@@ -412,25 +402,17 @@ class Blob(object):
 
         #self.perimeter = measure.perimeter(mask) instead?
 
+        # the contours can be float32 views of the contour store (see Annotation.compactContours)
+        contour = np.asarray(contour, dtype=np.float64)
 
-        # perimeter of the outer contour
-        px1 = contour[0, 0]
-        py1 = contour[0, 1]
-        N = contour.shape[0]
-        pxlast = contour[N-1, 0]
-        pylast = contour[N-1, 1]
-        perim = math.sqrt((px1-pxlast)*(px1-pxlast) + (py1-pylast)*(py1-pylast))
-        for i in range(1, contour.shape[0]):
-            px2 = contour[i, 0]
-            py2 = contour[i, 1]
-
-            d = math.sqrt((px1 - px2)*(px1-px2) + (py1-py2)*(py1-py2))
-            perim += d
+        if contour.shape[0] == 0:
+            return 0.0
 
-            px1 = px2
-            py1 = py2
+        # length of the closing segment first, then the others (the sum is accumulated in this order)
+        d = contour - np.roll(contour, 1, axis=0)
+        lengths = np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1])
 
-        return perim
+        return float(np.cumsum(lengths)[-1])
 
     def calculatePerimeter(self):
         #tole = 2
@@ -485,10 +467,19 @@ class Blob(object):
     def save(self):
         return self.toDict()
 
+    def toFixedPoint(self, c):
+        """
+        Contour in tenths of pixel, as saved in the projects. The float32 contours of the contiguous buffer
+        are already on this grid and are rounded, the others are truncated.
+        """
+        if c.dtype == np.float32:
+            return np.rint(c.astype(float) * 10).astype(int)
+        return (c * 10).astype(int)
+
     def toPoints(self, c):
 
         #return c.tolist()
-        d = (c * 10).astype(int)
+        d = self.toFixedPoint(c)
         d = np.diff(d, axis=0, prepend=[[0, 0]])
         d = np.reshape(d, -1)
         d = np.char.mod('%d', d)
@@ -513,9 +504,10 @@ class Blob(object):
         return c
 
 
-    def toDict(self):
+    def toDict(self, contours=True):
         """
         Get the blob information as a dictionary.
+        If contours is False the outer and the inner contours are not included (see ProjectArchive).
         """
 
         dic = dict()
@@ -526,13 +518,14 @@ class Blob(object):
         dic["area"] = self.area
         dic["perimeter"] = math.trunc(10 *self.perimeter)/10
 
-        #dic["contour"] = self.contour.tolist()
-        dic["contour"] = self.toPoints(self.contour)
+        if contours:
+            #dic["contour"] = self.contour.tolist()
+            dic["contour"] = self.toPoints(self.contour)
 
-        dic["inner contours"] = []
-        for c in self.inner_contours:
-            #dic["inner contours"].append(c.tolist())
-            dic["inner contours"].append(self.toPoints(c))
+            dic["inner contours"] = []
+            for c in self.inner_contours:
+                #dic["inner contours"].append(c.tolist())
+                dic["inner contours"].append(self.toPoints(c))
 
 #       dic["genet"] = self.genet
         dic["class name"] = self.class_name
@@ -20,9 +20,11 @@
 from PyQt5.QtGui import QImage
 from PyQt5.QtGui import QImageReader
 import rasterio as rio
+from rasterio.windows import Window
 from source import genutils
 import numpy as np
 import os
+from collections import OrderedDict
 
 class Channel(object):
     def __init__(self, filename = None, type = None):
@@ -33,7 +35,13 @@ class Channel(object):
         self.float_map = None         # map of 32-bit floating point (e.g. to store high precision depth values)
         self.nodata = None            # invalid value
 
-    def loadData(self, taglab_dir):
+        # windowed access (the image data are read on demand, tile by tile)
+        self.raster = None            # rasterio dataset, opened on the first access
+        self.tile_size = 512          # size of the cached tiles (in pixels)
+        self.cache_size = 256         # max number of cached tiles
+        self.tile_cache = OrderedDict()  # (row, col) -> numpy array (LRU order)
+
+    def loadData(self, taglab_dir = ""):
         """
         Load the image data. The QImage is cached to speed up visualization.
         """
@@ -60,5 +68,139 @@ class Channel(object):
 
         return self.qimage
 
+    def open(self):
+        """
+        Open the raster (without reading the data) and return the rasterio dataset.
+        """
+
+        if self.raster is None:
+            self.raster = rio.open(self.filename)
+            if self.type == "DEM":
+                self.nodata = self.raster.nodata
+
+        return self.raster
+
+    def close(self):
+        """
+        Close the raster and free the tiles cache.
+        """
+
+        if self.raster is not None:
+            self.raster.close()
+            self.raster = None
+
+        self.tile_cache.clear()
+
+    def size(self):
+        """
+        It returns the size (width, height) of the image, without loading it.
+        """
+
+        if self.qimage is not None:
+            return (self.qimage.width(), self.qimage.height())
+
+        raster = self.open()
+        return (raster.width, raster.height)
+
+    def readTile(self, row, col):
+        """
+        Read a tile of the image (using the LRU cache). The tiles on the border can be smaller than tile_size.
+        """
+
+        key = (row, col)
+        tile = self.tile_cache.get(key)
+        if tile is not None:
+            self.tile_cache.move_to_end(key)
+            return tile
+
+        raster = self.open()
+
+        left = col * self.tile_size
+        top = row * self.tile_size
+        w = min(self.tile_size, raster.width - left)
+        h = min(self.tile_size, raster.height - top)
+        window = Window(left, top, w, h)
+
+        if self.type == "DEM":
+            tile = raster.read(1, window=window).astype(np.float32)
+        else:
+            if raster.count >= 3:
+                data = raster.read([1, 2, 3], window=window)
+            else:
+                data = np.repeat(raster.read([1], window=window), 3, axis=0)
+            tile = np.moveaxis(data, 0, -1).astype(np.uint8)  # Since Rasterio is channel first shape=(c, h, w)
+
+        self.tile_cache[key] = tile
+        if len(self.tile_cache) > self.cache_size:
+            self.tile_cache.popitem(last=False)
+
+        return tile
+
+    def readRegion(self, bbox):
+        """
+        Read the region [top, left, width, height] of the image without loading the whole image.
+        It returns an H x W x 3 uint8 array for RGB channels and an H x W float32 array for DEM channels.
+        The part of the region outside the image is filled with zeros (nodata for DEM).
+        """
+
+        top = int(bbox[0])
+        left = int(bbox[1])
+        w = int(bbox[2])
+        h = int(bbox[3])
+
+        if self.type == "DEM":
+            fill = self.nodata if self.nodata is not None else 0.0
+            region = np.full((h, w), fill, dtype=np.float32)
+        else:
+            region = np.zeros((h, w, 3), dtype=np.uint8)
+
+        (width, height) = self.size()
+
+        # intersection between the region and the image
+        x1 = max(left, 0)
+        y1 = max(top, 0)
+        x2 = min(left + w, width)
+        y2 = min(top + h, height)
+        if x2 <= x1 or y2 <= y1:
+            return region
+
+        if self.qimage is not None and self.type == "RGB":
+            # the image is already in memory
+            crop = genutils.qimageToNumpyArray(self.qimage.copy(x1, y1, x2 - x1, y2 - y1))
+            region[y1 - top:y2 - top, x1 - left:x2 - left] = crop
+            return region
+
+        if self.float_map is not None and self.type == "DEM":
+            region[y1 - top:y2 - top, x1 - left:x2 - left] = self.float_map[y1:y2, x1:x2]
+            return region
+
+        ts = self.tile_size
+        for row in range(y1 // ts, (y2 - 1) // ts + 1):
+            for col in range(x1 // ts, (x2 - 1) // ts + 1):
+                tile = self.readTile(row, col)
+
+                # intersection between the tile and the region (in image coordinates)
+                tx1 = max(x1, col * ts)
+                ty1 = max(y1, row * ts)
+                tx2 = min(x2, col * ts + tile.shape[1])
+                ty2 = min(y2, row * ts + tile.shape[0])
+
+                region[ty1 - top:ty2 - top, tx1 - left:tx2 - left] = \
+                    tile[ty1 - row * ts:ty2 - row * ts, tx1 - col * ts:tx2 - col * ts]
+
+        return region
+
+    def readRegionAsQImage(self, bbox):
+        """
+        Read the region [top, left, width, height] of the image as a QImage (see readRegion).
+        """
+
+        region = self.readRegion(bbox)
+
+        if self.type == "DEM":
+            return genutils.floatmapToQImage(region, self.nodata)
+
+        return genutils.rgbToQImage(region)
+
     def save(self):
         return { "filename": self.filename, "type": self.type }
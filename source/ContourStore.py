@@ -0,0 +1,80 @@
+# TagLab
+# A semi-automatic segmentation tool
+#
+# Copyright(C) 2020
+# Visual Computing Lab
+# ISTI - Italian National Research Council
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License (http://www.gnu.org/licenses/gpl.txt)
+# for more details.
+
+import numpy as np
+
+
+class ContourStore(object):
+    """
+    Contiguous storage of the contours of a list of blobs. The vertices of all the contours are kept
+    in a single float32 array, on the grid of 1/10 of pixel used to save the projects (see Blob.toFixedPoint),
+    so the compaction does not change the saved data. The blobs reference their contours as views of it.
+
+       vertices   - all the vertices (N x 2), outer contour first and then its inner contours
+       offsets    - vertices[offsets[k]:offsets[k+1]] is the k-th contour
+       first      - contours first[i]..first[i+1]-1 belong to the i-th blob, the first one is the outer contour
+    """
+
+    def __init__(self, blobs=[]):
+
+        contours = []
+        self.first = np.zeros(len(blobs) + 1, dtype=np.int64)
+        for i, blob in enumerate(blobs):
+            contours.append(blob.toFixedPoint(blob.contour))
+            contours.extend([blob.toFixedPoint(inner) for inner in blob.inner_contours])
+            self.first[i + 1] = len(contours)
+
+        self.offsets = np.zeros(len(contours) + 1, dtype=np.int64)
+        if len(contours) > 0:
+            np.cumsum([len(c) for c in contours], out=self.offsets[1:])
+            self.vertices = (np.concatenate(contours, axis=0) / 10.0).astype(np.float32)
+        else:
+            self.vertices = np.zeros((0, 2), dtype=np.float32)
+
+    def blobsCount(self):
+        return len(self.first) - 1
+
+    def contoursCount(self):
+        return len(self.offsets) - 1
+
+    def nbytes(self):
+        return self.vertices.nbytes + self.offsets.nbytes + self.first.nbytes
+
+    def contourView(self, k):
+        return self.vertices[self.offsets[k]:self.offsets[k + 1]]
+
+    def contour(self, index):
+        """
+        Outer contour of the index-th blob (a view of the buffer).
+        """
+        return self.contourView(self.first[index])
+
+    def innerContours(self, index):
+        """
+        Inner contours of the index-th blob (views of the buffer).
+        """
+        return [self.contourView(k) for k in range(self.first[index] + 1, self.first[index + 1])]
+
+    def assign(self, blobs):
+        """
+        Replace the contours of the blobs (the same list used to build the store) with the views of the buffer.
+        """
+        for i, blob in enumerate(blobs):
+            blob.contour = self.contour(i)
+            blob.inner_contours = self.innerContours(i)
@@ -0,0 +1,149 @@
+# TagLab
+# A semi-automatic segmentation tool
+#
+# Copyright(C) 2020
+# Visual Computing Lab
+# ISTI - Italian National Research Council
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License (http://www.gnu.org/licenses/gpl.txt)
+# for more details.
+
+import pandas as pd
+
+COLUMNS = ['Genet', 'Blob1', 'Blob2', 'Area1', 'Area2', 'Class', 'Action', 'Split\Fuse']
+
+GENET = 0
+BLOB1 = 1
+BLOB2 = 2
+
+
+class CorrespondenceStore(object):
+    """
+    Rows of a table of correspondences, indexed by the blob ids of both the images (adjacency maps
+    blob id -> rows), so the rows of a blob are found in O(degree). Each row is a list with the values
+    of COLUMNS and it is identified by a key that does not change when other rows are added or removed.
+    The keys are the index of the DataFrame returned by toDataFrame().
+    """
+
+    def __init__(self, rows=[]):
+
+        # key -> row
+        self.rows = {}
+
+        # blob id -> set of keys, for the source (Blob1) and the target (Blob2) image
+        self.by_source = {}
+        self.by_target = {}
+
+        self.next_key = 0
+
+        # blob ids whose rows have been added or removed since the last takeTouched() (see Genet.update)
+        self.touched_source = set()
+        self.touched_target = set()
+
+        for row in rows:
+            self.add(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def items(self):
+        return list(self.rows.items())
+
+    def get(self, key):
+        return self.rows.get(key)
+
+    def link(self, index, id, key):
+        keys = index.get(id)
+        if keys is None:
+            keys = set()
+            index[id] = keys
+        keys.add(key)
+
+    def unlink(self, index, id, key):
+        keys = index.get(id)
+        if keys is not None:
+            keys.discard(key)
+            if len(keys) == 0:
+                del index[id]
+
+    def add(self, row):
+        """
+        Add a row, it returns its key.
+        """
+        key = self.next_key
+        self.next_key += 1
+
+        row = list(row)
+        self.rows[key] = row
+        self.link(self.by_source, row[BLOB1], key)
+        self.link(self.by_target, row[BLOB2], key)
+        self.touched_source.add(row[BLOB1])
+        self.touched_target.add(row[BLOB2])
+        return key
+
+    def remove(self, key):
+        """
+        Remove a row, it returns the row (None if the key does not exist).
+        """
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self.unlink(self.by_source, row[BLOB1], key)
+            self.unlink(self.by_target, row[BLOB2], key)
+            self.touched_source.add(row[BLOB1])
+            self.touched_target.add(row[BLOB2])
+        return row
+
+    def setValue(self, key, column, value):
+
+        row = self.rows[key]
+        if column == BLOB1:
+            self.unlink(self.by_source, row[BLOB1], key)
+            self.link(self.by_source, value, key)
+            self.touched_source.update([row[BLOB1], value])
+        elif column == BLOB2:
+            self.unlink(self.by_target, row[BLOB2], key)
+            self.link(self.by_target, value, key)
+            self.touched_target.update([row[BLOB2], value])
+        row[column] = value
+
+    def takeTouched(self):
+        """
+        It returns the source and the target blob ids whose rows changed since the last call.
+        """
+        touched = (self.touched_source, self.touched_target)
+        self.touched_source = set()
+        self.touched_target = set()
+        return touched
+
+    def sourceRows(self, blob_id):
+        """
+        Keys of the rows with the given source blob (Blob1).
+        """
+        return sorted(self.by_source.get(blob_id, ()))
+
+    def targetRows(self, blob_id):
+        """
+        Keys of the rows with the given target blob (Blob2).
+        """
+        return sorted(self.by_target.get(blob_id, ()))
+
+    def toDataFrame(self):
+        """
+        The table as a DataFrame indexed by the keys of the rows, sorted by action and blob ids.
+        """
+        keys = list(self.rows.keys())
+        data = pd.DataFrame(data=[self.rows[key] for key in keys], index=keys, columns=COLUMNS)
+        data.sort_values(by=['Action', 'Blob1', 'Blob2'], inplace=True)
+        return data
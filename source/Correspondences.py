@@ -1,11 +1,20 @@
 from source.Blob import Blob
 import numpy as np
+from collections import Counter, OrderedDict
 from source.Blob import Blob
 from source.Mask import intersectMask
+from source.SpatialIndex import SpatialIndex
+from source.CorrespondenceStore import CorrespondenceStore, COLUMNS
 import pandas as pd
 
 
 class Correspondences(object):
+    """
+    Table of correspondences between the regions of two images. The rows are kept in a CorrespondenceStore,
+    indexed by the blob ids; the DataFrame (data) is built from it when needed, for display and export.
+    The row indexes used by findCluster(), deleteRows() and blobClassChanged() are the keys of the rows,
+    i.e. the index of the DataFrame, not the positions in it.
+    """
 
     def __init__(self, img_source, img_target, correspondences = None):
 
@@ -15,9 +24,46 @@ class Correspondences(object):
         self.dead = []
         self.born = []
         self.threshold = 1.05
-        self.data = pd.DataFrame(data = correspondences, columns=['Genet', 'Blob1', 'Blob2', 'Area1', 'Area2', 'Class', 'Action', 'Split\Fuse'])
+        self.data = pd.DataFrame(data = correspondences, columns=COLUMNS)
         self.area_type_shown = False  # True means that the surface area is currently shown
 
+        # modified since the last save (see Project.saveArchive), the last encoded chunk is kept
+        self.dirty = True
+        self.chunk = None
+
+    @property
+    def data(self):
+        # the DataFrame is rebuilt only after the rows have been added or removed
+        if self._data is None:
+            self._data = self.store.toDataFrame()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self.store = CorrespondenceStore(data.values.tolist())
+        self._data = None
+
+    def addRow(self, row):
+        self._data = None
+        return self.store.add(row)
+
+    def removeRow(self, key):
+        self._data = None
+        return self.store.remove(key)
+
+    def setValue(self, key, column, value):
+        """
+        Change a value of the given row (column is the name or the position of the column).
+        The DataFrame already built is updated in place, so the order of its rows does not change.
+        """
+        if not isinstance(column, int):
+            column = COLUMNS.index(column)
+
+        self.dirty = True
+        self.store.setValue(key, column, value)
+        if self._data is not None:
+            self._data.at[key, COLUMNS[column]] = value
+
     def area_in_sq_cm(self, area, is_source):
 
         if is_source:
@@ -29,10 +75,10 @@ class Correspondences(object):
 
     def isGenetInfoAvailable(self):
 
-        if len(self.data.index) < 2:
+        if len(self.store) < 2:
             return False
 
-        if self.data.loc[1, 'Genet'] >= 0:
+        if self.data['Genet'].iloc[1] >= 0:
             return True
         else:
             return False
@@ -59,12 +105,28 @@ class Correspondences(object):
 #                if blob2.genet is not None:
 #                    self.data.loc[index, 'Genet'] = blob2.genet
 
+    def updateAction(self, key, area1, area2):
+
+        # update grow/shrink information
+        action = self.store.get(key)[6]
+        if action == "grow" or action == "shrink" or action == "same":
+            if area2 > area1*self.threshold:
+                self.setValue(key, 'Action', "grow")
+            elif area2 < area1 / self.threshold:
+                self.setValue(key, 'Action', "shrink")
+            else:
+                self.setValue(key, 'Action', "same")
+
     def updateAreas(self, use_surface_area=False):
 
-        for index, row in self.data.iterrows():
-            id1 = int(row['Blob1'])
-            id2 = int(row['Blob2'])
-            action = row['Action']
+        self.dirty = True
+
+        # all the rows change, the DataFrame is rebuilt afterwards
+        self._data = None
+
+        for key, row in self.store.items():
+            id1 = int(row[1])
+            id2 = int(row[2])
             blob1 = self.source.annotations.blobById(id1)
             blob2 = self.target.annotations.blobById(id2)
 
@@ -80,7 +142,7 @@ class Correspondences(object):
                 if use_surface_area:
                     area_pixel = blob1.surface_area
                 area1 = self.area_in_sq_cm(area_pixel, True)
-            self.data.loc[index, 'Area1'] = area1
+            self.setValue(key, 'Area1', area1)
 
             area2 = 0
             if blob2 is not None:
@@ -88,16 +150,9 @@ class Correspondences(object):
                 if use_surface_area:
                     area_pixel = blob2.surface_area
                 area2 = self.area_in_sq_cm(area_pixel, False)
-            self.data.loc[index, 'Area2'] = area2
-
-            # update grow/shrink information
-            if action == "grow" or action == "shrink" or action == "same":
-                if area2 > area1*self.threshold:
-                    self.data.loc[index, 'Action'] = "grow"
-                elif area2 < area1 / self.threshold:
-                    self.data.loc[index, 'Action'] = "shrink"
-                else:
-                    self.data.loc[index, 'Action'] = "same"
+            self.setValue(key, 'Area2', area2)
+
+            self.updateAction(key, area1, area2)
 
         self.area_shown = use_surface_area
 
@@ -106,56 +161,57 @@ class Correspondences(object):
         Update the id of a region
         """
 
+        self.dirty = True
+
         if self.source == img:
-            rows_index = self.data[self.data['Blob1'] == blob_id].index
-            self.data.loc[rows_index, 'Blob1'] = new_id
+            for key in self.store.sourceRows(blob_id):
+                self.setValue(key, 'Blob1', new_id)
         else:
-            rows_index = self.data[self.data['Blob2'] == blob_id].index
-            self.data.loc[rows_index, 'Blob2'] = new_id
+            for key in self.store.targetRows(blob_id):
+                self.setValue(key, 'Blob2', new_id)
 
     def updateBlobArea(self, img, blob_id, new_area, new_surface_area):
 
+        self.dirty = True
+
         if self.source == img:
-            rows = self.data[self.data['Blob1'] == blob_id]
+            keys = self.store.sourceRows(blob_id)
             column_name = 'Area1'
             is_source = True
         else:
-            rows = self.data[self.data['Blob2'] == blob_id]
+            keys = self.store.targetRows(blob_id)
             column_name = 'Area2'
             is_source = False
 
-        for index, row in rows.iterrows():
+        for key in keys:
+
+            # the action is updated with the areas before the change
+            row = list(self.store.get(key))
 
             area = self.area_in_sq_cm(new_area, is_source)
-            self.data.loc[index, column_name] = area
+            self.setValue(key, column_name, area)
 
             try:
-                area1 = float(row['Area1'])
+                area1 = float(row[3])
             except:
                 area1 = 0.0
 
             try:
-                area2 = float(row['Area2'])
+                area2 = float(row[4])
             except:
                 area2 = 0.0
 
-            action = row['Action']
-
-            # update grow/shrink information
-            if action == "grow" or action == "shrink" or action == "same":
-                if area2 > area1*self.threshold:
-                    self.data.loc[index, 'Action'] = "grow"
-                elif area2 < area1 / self.threshold:
-                    self.data.loc[index, 'Action'] = "shrink"
-                else:
-                    self.data.loc[index, 'Action'] = "same"
+            self.updateAction(key, area1, area2)
 
     def save(self):
         return { "source": self.source.id, "target": self.target.id, "correspondences": self.data.values.tolist() }
 
     def sort_data(self):
 
-        self.data.sort_values(by=['Action', 'Blob1', 'Blob2'], inplace=True, ignore_index=True)
+        self.dirty = True
+
+        # the DataFrame is always built sorted by 'Action', 'Blob1', 'Blob2'
+        self._data = None
 
     def checkTable(self):
         """
@@ -163,15 +219,15 @@ class Correspondences(object):
         """
 
         inconsistencies = False
-        current_table = self.data.copy()
-        for index, row in current_table.iterrows():
-            id1 = int(row['Blob1'])
-            id2 = int(row['Blob2'])
+        for key, row in self.store.items():
+            id1 = int(row[1])
+            id2 = int(row[2])
             blob1 = self.source.annotations.blobById(id1)
             blob2 = self.target.annotations.blobById(id2)
 
             if blob1 is None and blob2 is None:
-                self.data.drop(index, inplace=True)
+                self.removeRow(key)
+                self.dirty = True
                 inconsistencies = True
 
         return inconsistencies
@@ -181,6 +237,8 @@ class Correspondences(object):
         Fill the table from a list of correspondences.
         """
 
+        self.dirty = True
+
         if not lst:
             return
 
@@ -189,8 +247,7 @@ class Correspondences(object):
             for ll in lst:
                 ll.insert(0, -1)
 
-        columns = self.data.columns
-        self.data = pd.DataFrame(lst, columns=columns)
+        self.data = pd.DataFrame(lst, columns=COLUMNS)
 
         self.checkTable()
 
@@ -202,6 +259,8 @@ class Correspondences(object):
 
     def addBlob(self, image, blob):
 
+        self.dirty = True
+
         if self.source == image:
             self.set([blob], [])
         elif self.target == image:
@@ -210,17 +269,19 @@ class Correspondences(object):
             pass
 
     def removeBlob(self, image, blob):
+        self.dirty = True
+
         if self.source == image:
             self.set([blob], [])
-            self.data = self.data[self.data['Blob1'] != blob.id]
+            for key in self.store.sourceRows(blob.id):
+                self.removeRow(key)
         elif self.target == image:
             self.set([], [blob])
-            self.data = self.data[self.data['Blob2'] != blob.id]
+            for key in self.store.targetRows(blob.id):
+                self.removeRow(key)
         else:
             pass
 
-        self.data.reset_index(drop=True, inplace=True)
-
     def remove(self, img, blob_id):
         """
         Remove the rows with the given blob id.
@@ -249,6 +310,8 @@ class Correspondences(object):
 
     def updateBlob(self, image, old_blob, new_blob):
 
+        self.dirty = True
+
         # check if the class name has changed
         if old_blob.class_name != new_blob.class_name:
             if self.source == image:
@@ -259,36 +322,40 @@ class Correspondences(object):
                 pass
             return
 
+        # the rows are collected before changing the ids, they are found by the old id
         if self.source == image:
-            self.data.loc[self.data["Blob1"] == old_blob.id, "Blob1"] = new_blob.id
-            self.data.loc[self.data["Blob1"] == old_blob.id, "Area1"] = self.area_in_sq_cm(new_blob.area, False)
+            for key in self.store.sourceRows(old_blob.id):
+                self.setValue(key, 'Blob1', new_blob.id)
+                self.setValue(key, 'Area1', self.area_in_sq_cm(new_blob.area, True))
         elif self.target == image:
-            self.data.loc[self.data["Blob2"] == old_blob.id, "Blob2"] = new_blob.id
-            self.data.loc[self.data["Blob2"] == old_blob.id, "Area2"] = self.area_in_sq_cm(new_blob.area, False)
+            for key in self.store.targetRows(old_blob.id):
+                self.setValue(key, 'Blob2', new_blob.id)
+                self.setValue(key, 'Area2', self.area_in_sq_cm(new_blob.area, False))
         else:
             pass
 
     def blobClassChanged(self, img, blob, class_name):
 
+        self.dirty = True
+
         blob_ids = []
 
         if self.source == img:
             sourceids, targetids, rows = self.findCluster(blob.id, is_source=True)
-            for row in rows:
-                self.data.loc[row, "Class"] = class_name
-                blob_ids.append(self.data.loc[row, "Blob1"])
-                blob_ids.append(self.data.loc[row, "Blob2"])
         elif self.target == img:
             sourceids, targetids, rows = self.findCluster(blob.id, is_source=False)
-            for row in rows:
-                self.data.loc[row, "Class"] = class_name
-                blob_ids.append(self.data.loc[row, "Blob1"])
-                blob_ids.append(self.data.loc[row, "Blob2"])
         else:
             return
 
+        for row in rows:
+            self.setValue(row, "Class", class_name)
+            blob_ids.append(self.store.get(row)[1])
+            blob_ids.append(self.store.get(row)[2])
+
     def set(self, sourceblobs, targetblobs):
 
+        self.dirty = True
+
         #assumes one oth the two list has 1 blob only.
         type = "n/s"
         action = "n/s"
@@ -310,53 +377,50 @@ class Correspondences(object):
             action = "same"
             #TODO consider morph!
 
+        sourceids = set([b.id for b in sourceblobs])
+        targetids = set([b.id for b in targetblobs])
+
+        sourcerows = set()
+        for id in sourceids:
+            sourcerows.update(self.store.sourceRows(id))
+        targetrows = set()
+        for id in targetids:
+            targetrows.update(self.store.targetRows(id))
+
         #orphaned nodes: not in sourceblob, but had some connections in  targetblobs (dead now) and viceversa
         #they will become born or dead
-        targetorphaned = self.data[self.data['Blob1'].isin([b.id for b in sourceblobs])]['Blob2']
-        sourceorphaned = self.data[self.data['Blob2'].isin([b.id for b in targetblobs])]['Blob1']
-
-        targetorphaned = list(set(targetorphaned) - set([b.id for b in targetblobs]))
-        sourceorphaned = list(set(sourceorphaned) - set([b.id for b in sourceblobs]))
+        targetorphaned = set([self.store.get(key)[2] for key in sourcerows]) - targetids
+        sourceorphaned = set([self.store.get(key)[1] for key in targetrows]) - sourceids
 
         #remove all correspondences where orphaned
-        self.data = self.data[self.data['Blob1'].isin([b.id for b in sourceblobs]) == False]
-        self.data = self.data[self.data['Blob2'].isin([b.id for b in targetblobs]) == False]
+        for key in sourcerows | targetrows:
+            self.removeRow(key)
 
         for id in targetorphaned:
             if id < 0: # born and dead result in orphaned
                 continue
             #we need to check if the orphaned has other relationships.
-            relatives = self.data[self.data['Blob2'] == id]
-            if len(relatives):
+            if len(self.store.targetRows(id)) > 0:
                 continue
             target = self.target.annotations.blobById(id)
-            row = [-1, -1, target.id, 0.0, self.area_in_sq_cm(target.area, False), target.class_name, "born", type]
-            df = pd.DataFrame([row], columns=self.data.columns)
-            self.data = pd.concat([self.data, df])
+            self.addRow([-1, -1, target.id, 0.0, self.area_in_sq_cm(target.area, False), target.class_name, "born", type])
 
         for id in sourceorphaned:
             if id < 0:
                 continue
             #we need to check if the orphaned has other relationships.
-            relatives = self.data[self.data['Blob1'] == id]
-            if len(relatives):
+            if len(self.store.sourceRows(id)) > 0:
                 continue
             source = self.source.annotations.blobById(id)
-            row = [-1, source.id, -1, self.area_in_sq_cm(source.area, True), 0.0, source.class_name, "dead", type]
-            df = pd.DataFrame([row], columns=self.data.columns)
-            self.data = pd.concat([self.data, df])
+            self.addRow([-1, source.id, -1, self.area_in_sq_cm(source.area, True), 0.0, source.class_name, "dead", type])
 
         if len(sourceblobs) == 0:
             for target in targetblobs:
-                row = [-1, -1, target.id, 0.0, self.area_in_sq_cm(target.area, False), target.class_name, action, type]
-                df = pd.DataFrame([row], columns=self.data.columns)
-                self.data = pd.concat([self.data, df])
+                self.addRow([-1, -1, target.id, 0.0, self.area_in_sq_cm(target.area, False), target.class_name, action, type])
 
         elif len(targetblobs) == 0:
             for source in sourceblobs:
-                row = [-1, source.id, -1, self.area_in_sq_cm(source.area, True), 0.0, source.class_name, action, type]
-                df = pd.DataFrame([row], columns=self.data.columns)
-                self.data = pd.concat([self.data, df])
+                self.addRow([-1, source.id, -1, self.area_in_sq_cm(source.area, True), 0.0, source.class_name, action, type])
 
         else:
             # place new correspondences
@@ -370,9 +434,7 @@ class Correspondences(object):
                         target_area = self.area_in_sq_cm(target.area, False)
 
                     class_name = source.class_name if source.id >= 0 else target.class_name
-                    row = [-1, source.id, target.id, source_area, target_area, class_name, action, type]
-                    df = pd.DataFrame([row], columns=self.data.columns)
-                    self.data = pd.concat([self.data, df])
+                    self.addRow([-1, source.id, target.id, source_area, target_area, class_name, action, type])
 
         self.sort_data()
 
@@ -380,30 +442,32 @@ class Correspondences(object):
     # starting for a blob id will find the cluster both in source and target
     def findCluster(self, blobid, is_source):
         # so we want source to be blob and target to be the other viewerplus
-        source = "Blob1"
-        target = "Blob2"
+        source = 1
+        target = 2
+        sourceRows = self.store.sourceRows
+        targetRows = self.store.targetRows
         if not is_source:
             source, target = target, source
+            sourceRows, targetRows = targetRows, sourceRows
 
         sourcecluster = [blobid] # source ids
         targetcluster = []       # target ids
         rows = []                # involved rows
 
         # find all blobs in the target connected to the blob
-        linked = self.data[self.data[source] == blobid]
-        for index, row in linked.iterrows():
-            targetid = row[target]
+        for key in sourceRows(blobid):
+            targetid = self.store.get(key)[target]
             if targetid >= 0:
                 targetcluster.append(targetid)
-            rows.append(index)
+            rows.append(key)
 
         # find all the connected in the source connected to the selected targets
-        linked = self.data.loc[self.data[target].isin(targetcluster)]
-        for index, row in linked.iterrows():
-            sourceid = row[source]
-            if sourceid >= 0:
-                sourcecluster.append(sourceid)
-            rows.append(index)
+        for targetid in set(targetcluster):
+            for key in targetRows(targetid):
+                sourceid = self.store.get(key)[source]
+                if sourceid >= 0:
+                    sourcecluster.append(sourceid)
+                rows.append(key)
 
         if not is_source:
             sourcecluster, targetcluster = targetcluster, sourcecluster
@@ -414,79 +478,130 @@ class Correspondences(object):
         return sourcecluster, targetcluster, rows
 
     def deleteCluster(self, indexes):
+        """
+        Delete the rows at the given positions of the DataFrame (i.e. the rows selected in the table).
+        """
 
-        born = []
-        dead = []
-        for i in indexes:
-            row = self.data.iloc[i]
-            if row["Blob1"] >= 0:
-                dead.append(row["Blob1"])
-            if row["Blob2"] >= 0:
-                born.append(row["Blob2"])
+        self.dirty = True
 
-        # delete rows from the dataframe
-        self.data.drop(indexes, inplace=True)
+        keys = [self.data.index[i] for i in indexes]
 
-        # reindexing
-        self.data.reset_index(drop=True, inplace=True)
+        born = []
+        dead = []
+        for key in keys:
+            row = self.store.get(key)
+            if row[1] >= 0:
+                dead.append(row[1])
+            if row[2] >= 0:
+                born.append(row[2])
 
-        count = len(self.data.index)
+        # delete rows
+        for key in set(keys):
+            self.removeRow(key)
 
         for i in set(dead):
             blob = self.source.annotations.blobById(i)
-            row = [-1, blob.id, -1, self.area_in_sq_cm(blob.area, True), 0.0, blob.class_name, "dead", "none"]
-            df = pd.DataFrame([row], columns=self.data.columns)
-            self.data = pd.concat([self.data, df])
+            self.addRow([-1, blob.id, -1, self.area_in_sq_cm(blob.area, True), 0.0, blob.class_name, "dead", "none"])
 
         for i in set(born):
             blob = self.target.annotations.blobById(i)
-            row = [-1, -1, blob.id, 0.0, self.area_in_sq_cm(blob.area, False), blob.class_name, "dead", "none"]
-            df = pd.DataFrame([row], columns=self.data.columns)
-            self.data = pd.concat([self.data, df])
+            self.addRow([-1, -1, blob.id, 0.0, self.area_in_sq_cm(blob.area, False), blob.class_name, "dead", "none"])
 
         self.sort_data()
 
     def deleteRows(self, rows_indexes):
 
-        # delete rows from the dataframe
-        self.data.drop(rows_indexes, inplace=True)
+        self.dirty = True
 
-        # reindexing
-        self.data.reset_index(drop=True, inplace=True)
+        # delete rows (the keys returned by findCluster)
+        for key in set(rows_indexes):
+            self.removeRow(key)
 
-    def autoMatch(self, blobs1, blobs2):
-        self.correspondences.clear()
+    # maximum number of masks of the target blobs kept in memory during an automatic match
+    MASK_CACHE_SIZE = 2048
+
+    def bboxIntersectionArea(self, blob1, blob2):
+        # use bb to quickly calculate intersection
+        x1 = max(blob1.bbox[0], blob2.bbox[0])
+        y1 = max(blob1.bbox[1], blob2.bbox[1])
+        x2 = min(blob1.bbox[0] + blob1.bbox[3], blob2.bbox[0] + blob2.bbox[3])
+        y2 = min(blob1.bbox[1] + blob1.bbox[2], blob2.bbox[1] + blob2.bbox[2])
+        # compute the area of intersection rectangle
+        return abs(max((x2 - x1, 0)) * max((y2 - y1), 0))
+
+    def overlappingBlobs(self, blobs1, blobs2, min_overlap, same_class):
+        """
+        It returns the pairs (blob1, blob2, size1, size2) of overlapping blobs whose intersection is at least
+        min_overlap times the size of the smaller one, in the order of blobs1 and then of blobs2.
+        Only the blobs2 with an intersecting bounding box are tested (they are found with a SpatialIndex),
+        and the mask of each blob is computed once (the most recent masks of blobs2 are cached).
+        """
+
+        index = SpatialIndex()
+        for blob2 in blobs2:
+            index.insert(blob2, blob2.bbox)
+
+        sizes2 = {}
+        masks2 = OrderedDict()
+
+        pairs = []
         for blob1 in blobs1:
-            for blob2 in blobs2:
-                # use bb to quickly calculate intersection
-                x1 = max(blob1.bbox[0], blob2.bbox[0])
-                y1 = max(blob1.bbox[1], blob2.bbox[1])
-                x2 = min(blob1.bbox[0] + blob1.bbox[3], blob2.bbox[0] + blob2.bbox[3])
-                y2 = min(blob1.bbox[1] + blob1.bbox[2], blob2.bbox[1] + blob2.bbox[2])
-                # compute the area of intersection rectangle
-                interArea = abs(max((x2 - x1, 0)) * max((y2 - y1), 0))
-
-                if interArea != 0 and blob2.class_name == blob1.class_name and blob1.class_name != 'Empty':
-                    # this is the get mask function for the outer contours, I put it here using two different if conditions so getMask just runs just on intersections
+
+            if blob1.class_name == 'Empty':
+                continue
+
+            mask1 = None
+            for blob2 in index.query(blob1.bbox):
+
+                if self.bboxIntersectionArea(blob1, blob2) == 0:
+                    continue
+
+                if same_class and blob2.class_name != blob1.class_name:
+                    continue
+
+                if mask1 is None:
                     mask1 = Blob.getMask(blob1)
                     sizeblob1 = np.count_nonzero(mask1)
+
+                key = id(blob2)
+                mask2 = masks2.get(key)
+                if mask2 is None:
                     mask2 = Blob.getMask(blob2)
-                    sizeblob2 = np.count_nonzero(mask2)
-                    minblob = min(sizeblob1, sizeblob2)
-                    mask, bbox = intersectMask(mask1, blob1.bbox, mask2, blob2.bbox)
-                    intersectionArea = np.count_nonzero(mask)
+                    sizes2[key] = np.count_nonzero(mask2)
+                    masks2[key] = mask2
+                    if len(masks2) > self.MASK_CACHE_SIZE:
+                        masks2.popitem(last=False)
+                else:
+                    masks2.move_to_end(key)
+                sizeblob2 = sizes2[key]
+
+                minblob = min(sizeblob1, sizeblob2)
+                mask, bbox = intersectMask(mask1, blob1.bbox, mask2, blob2.bbox)
+                intersectionArea = np.count_nonzero(mask)
 
-                    if (intersectionArea < (0.6 * minblob)):
-                        continue
-                    if (sizeblob2 > sizeblob1 * self.threshold):
-                        self.correspondences.append([-1, blob1.id, blob2.id, blob1.area, blob2.area, blob1.class_name, 'grow', 'none'])
+                if (intersectionArea < (min_overlap * minblob)):
+                    continue
 
-                    elif (sizeblob2 < sizeblob1 / self.threshold):
-                        self.correspondences.append([-1, blob1.id, blob2.id, blob1.area, blob2.area, blob1.class_name, 'shrink', 'none'])
+                pairs.append((blob1, blob2, sizeblob1, sizeblob2))
 
-                    else:
-                        self.correspondences.append([-1, blob1.id, blob2.id, blob1.area, blob2.area, blob1.class_name, 'same', 'none'])
+        return pairs
 
+    def matchAction(self, sizeblob1, sizeblob2):
+
+        if (sizeblob2 > sizeblob1 * self.threshold):
+            return 'grow'
+        elif (sizeblob2 < sizeblob1 / self.threshold):
+            return 'shrink'
+        else:
+            return 'same'
+
+    def autoMatch(self, blobs1, blobs2):
+        self.dirty = True
+
+        self.correspondences.clear()
+        for (blob1, blob2, sizeblob1, sizeblob2) in self.overlappingBlobs(blobs1, blobs2, 0.6, same_class=True):
+            action = self.matchAction(sizeblob1, sizeblob2)
+            self.correspondences.append([-1, blob1.id, blob2.id, blob1.area, blob2.area, blob1.class_name, action, 'none'])
 
         # operates on the correspondences found and update them
         self.assignSplit()
@@ -498,41 +613,13 @@ class Correspondences(object):
 
 
     def autoMatchM(self, blobs1, blobs2):
-        self.correspondences.clear()
-        for blob1 in blobs1:
-            for blob2 in blobs2:
-                # use bb to quickly calculate intersection
-                x1 = max(blob1.bbox[0], blob2.bbox[0])
-                y1 = max(blob1.bbox[1], blob2.bbox[1])
-                x2 = min(blob1.bbox[0] + blob1.bbox[3], blob2.bbox[0] + blob2.bbox[3])
-                y2 = min(blob1.bbox[1] + blob1.bbox[2], blob2.bbox[1] + blob2.bbox[2])
-                # compute the area of intersection rectangle
-                interArea = abs(max((x2 - x1, 0)) * max((y2 - y1), 0))
-
-                if interArea != 0 and blob1.class_name != 'Empty':
-                    # this is the get mask function for the outer contours, I put it here using two different if conditions so getMask just runs just on intersections
-                    mask1 = Blob.getMask(blob1)
-                    sizeblob1 = np.count_nonzero(mask1)
-                    mask2 = Blob.getMask(blob2)
-                    sizeblob2 = np.count_nonzero(mask2)
-                    minblob = min(sizeblob1, sizeblob2)
-                    mask, bbox = intersectMask(mask1, blob1.bbox, mask2, blob2.bbox)
-                    intersectionArea = np.count_nonzero(mask)
-
-                    class_name = blob1.class_name + "-" + blob2.class_name
-
-                    if (intersectionArea < (0.2 * minblob)):
-                        continue
-
-                    if (sizeblob2 > sizeblob1 * self.threshold):
-                        self.correspondences.append([-1, blob1.id, blob2.id, blob1.area, blob2.area, class_name, 'grow', 'none'])
-
-                    elif (sizeblob2 < sizeblob1 / self.threshold):
-                        self.correspondences.append([-1, blob1.id, blob2.id, blob1.area, blob2.area, class_name, 'shrink', 'none'])
-
-                    else:
-                        self.correspondences.append([-1, blob1.id, blob2.id, blob1.area, blob2.area, class_name, 'same', 'none'])
+        self.dirty = True
 
+        self.correspondences.clear()
+        for (blob1, blob2, sizeblob1, sizeblob2) in self.overlappingBlobs(blobs1, blobs2, 0.2, same_class=False):
+            class_name = blob1.class_name + "-" + blob2.class_name
+            action = self.matchAction(sizeblob1, sizeblob2)
+            self.correspondences.append([-1, blob1.id, blob2.id, blob1.area, blob2.area, class_name, action, 'none'])
 
         # operates on the correspondences found and update them
         self.assignSplit()
@@ -762,72 +849,62 @@ class Correspondences(object):
 
     def assignSplit(self):
 
-        mylist = []
-        for i in range(0, len(self.correspondences)):
-            mylist.append(int(self.correspondences[i][1]))
-        splitted = sorted(set([i for i in mylist if mylist.count(i) > 1]))
+        self.dirty = True
+
+        counts = Counter(int(corr[1]) for corr in self.correspondences)
 
         for i in range(0, len(self.correspondences)):
-            if int(self.correspondences[i][1]) in splitted:
+            if counts[int(self.correspondences[i][1])] > 1:
                 self.correspondences[i][7] = 'split'
 
 
     def assignFuse(self):
 
-        mylist = []
-        for i in range(0, len(self.correspondences)):
-            mylist.append(int(self.correspondences[i][2]))
-        fused = sorted(set([i for i in mylist if mylist.count(i) > 1]))
+        self.dirty = True
+
+        counts = Counter(int(corr[2]) for corr in self.correspondences)
 
         for i in range(0, len(self.correspondences)):
-            if int(self.correspondences[i][2]) in fused:
+            if counts[int(self.correspondences[i][2])] > 1:
                 self.correspondences[i][7] = 'fuse'
 
 
     def assignDead(self, blobs1):
 
+        self.dirty = True
+
         # """
         # Deads are all the blobs that are in project 1 but don't match with any blobs of project 2
         # """
-        all_blobs = []
-        existing = []
-        missing = []
-
-        for i in range(0, len(blobs1)):
-            all_blobs.append(int(blobs1[i].id))
-
-        for j in range(0, len(self.correspondences)):
-            existing.append(int(self.correspondences[j][1]))
+        existing = set(int(corr[1]) for corr in self.correspondences)
 
-        missing = [i for i in all_blobs if i not in existing]
+        # first blob with each id
+        first = {}
+        for blob in blobs1:
+            first.setdefault(int(blob.id), blob)
 
-        for id in missing:
-            index = all_blobs.index(id)
-            if blobs1[index].class_name != 'Empty':
-                self.dead.append([-1, id, -1,  blobs1[index].area, 0.0, blobs1[index].class_name, 'dead', 'none'])
+        for blob in blobs1:
+            id = int(blob.id)
+            if id not in existing and first[id].class_name != 'Empty':
+                self.dead.append([-1, id, -1,  first[id].area, 0.0, first[id].class_name, 'dead', 'none'])
 
 
     def assignBorn(self, blobs2):
 
+        self.dirty = True
+
         # """
         # Borns are all the blobs that are in project 2 but don't match with any blobs of project 1
         # MAYBE NOW MOVED MIGHT BE EXCHANGED FOR NEW BORN
         # """
+        existing = set(int(corr[2]) for corr in self.correspondences)
 
-        all_blobs = []
-        existing = []
-        missing = []
-
-        for i in range(0, len(blobs2)):
-            all_blobs.append(int(blobs2[i].id))
-
-        for j in range(0, len(self.correspondences)):
-            existing.append(int(self.correspondences[j][2]))
-
-        missing = [i for i in all_blobs if i not in existing]
-
-        for id in missing:
-            index = all_blobs.index(id)
-            if blobs2[index].class_name != 'Empty':
-                self.born.append([-1, -1, id, 0.0, blobs2[index].area, blobs2[index].class_name, 'born', 'none'])
+        # first blob with each id
+        first = {}
+        for blob in blobs2:
+            first.setdefault(int(blob.id), blob)
 
+        for blob in blobs2:
+            id = int(blob.id)
+            if id not in existing and first[id].class_name != 'Empty':
+                self.born.append([-1, -1, id, 0.0, first[id].area, first[id].class_name, 'born', 'none'])
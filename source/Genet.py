@@ -16,6 +16,10 @@ class Genet:
 
     def __init__(self, project):
         self.project = project
+
+        # the next genet id assigned by the incremental update
+        self.next_genet = 0
+
         self.updateGenets()
         pass
 
@@ -48,9 +52,9 @@ class Genet:
             parents[r1] = r0
 
         for corrs in self.project.correspondences.values():
-            for index, row in corrs.data.iterrows():
-                id1 = int(row['Blob1'])
-                id2 = int(row['Blob2'])
+            for key, row in corrs.store.items():
+                id1 = int(row[1])
+                id2 = int(row[2])
                 if id1 == -1 or id2 == -1:  #born or dead corals
                     continue
                 blob1 = corrs.source.annotations.blobById(id1)
@@ -71,19 +75,96 @@ class Genet:
         for img in self.project.images:
             for blob in img.annotations.seg_blobs:
                 blob.genet = remap[blob.genet]
+            img.annotations.updateBlobAttributes()
 
          #update corrs genets.
         for corrs in self.project.correspondences.values():            
-            for index, row in corrs.data.iterrows():
-                id1 = int(row['Blob1'])
-                id2 = int(row['Blob2'])
+            # all the rows change, the DataFrame is rebuilt afterwards
+            corrs.sort_data()
+            for key, row in corrs.store.items():
+                id1 = int(row[1])
+                id2 = int(row[2])
                 
                 if id1 != -1:
                     blob1 = corrs.source.annotations.blobById(id1)
-                    corrs.data.loc[index, 'Genet'] = blob1.genet
+                    corrs.setValue(key, 'Genet', blob1.genet)
                 else:
                     blob2 = corrs.target.annotations.blobById(id2)
-                    corrs.data.loc[index, 'Genet'] = blob2.genet
+                    corrs.setValue(key, 'Genet', blob2.genet)
+
+        self.next_genet = count
+        for corrs in self.project.correspondences.values():
+            corrs.store.takeTouched()
+
+    def linkedBlobs(self, img, blob):
+        """
+        Blobs of the other images connected to the given blob by a correspondence, as (image, blob).
+        """
+        linked = []
+        for corrs in self.project.findCorrespTables(img):
+            if corrs.source == img:
+                keys = corrs.store.sourceRows(blob.id)
+                other_column = 2
+                other = corrs.target
+            else:
+                keys = corrs.store.targetRows(blob.id)
+                other_column = 1
+                other = corrs.source
+
+            for key in keys:
+                other_id = int(corrs.store.get(key)[other_column])
+                if other_id >= 0:
+                    other_blob = other.annotations.blobById(other_id)
+                    if other_blob is not None:
+                        linked.append((other, other_blob))
+
+        return linked
+
+    def update(self):
+        """
+        Incremental version of updateGenets(). Only the genets of the blobs whose correspondences changed since
+        the last update are recomputed: each connected component reached from them gets a new genet id.
+        The other genets are not changed, so the ids are not consecutive until the next updateGenets().
+        """
+
+        seeds = []
+        for corrs in self.project.correspondences.values():
+            (source_ids, target_ids) = corrs.store.takeTouched()
+            seeds += [(corrs.source, blob) for blob in corrs.sourceBlobsById([id for id in source_ids if id >= 0])]
+            seeds += [(corrs.target, blob) for blob in corrs.targetBlobsById([id for id in target_ids if id >= 0])]
+
+        visited = set()
+        for (img, blob) in seeds:
+            if id(blob) in visited:
+                continue
+
+            # connected component of the blob
+            visited.add(id(blob))
+            component = [(img, blob)]
+            i = 0
+            while i < len(component):
+                for (other, other_blob) in self.linkedBlobs(*component[i]):
+                    if id(other_blob) not in visited:
+                        visited.add(id(other_blob))
+                        component.append((other, other_blob))
+                i += 1
+
+            genet = self.next_genet
+            self.next_genet += 1
+
+            for (img, blob) in component:
+                blob.genet = genet
+                img.annotations.updateBlobAttributes([blob])
+
+            # update the genet of the rows of the component
+            for (img, blob) in component:
+                for corrs in self.project.findCorrespTables(img):
+                    if corrs.source == img:
+                        keys = corrs.store.sourceRows(blob.id)
+                    else:
+                        keys = corrs.store.targetRows(blob.id)
+                    for key in keys:
+                        corrs.setValue(key, 'Genet', genet)
 
 
 
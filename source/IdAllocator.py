@@ -0,0 +1,90 @@
+# TagLab
+# A semi-automatic segmentation tool
+#
+# Copyright(C) 2020
+# Visual Computing Lab
+# ISTI - Italian National Research Council
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License (http://www.gnu.org/licenses/gpl.txt)
+# for more details.
+
+import heapq
+
+
+class IdAllocator(object):
+    """
+    Map id -> object of the annotations, which also keeps track of the free ids.
+    The free id returned is always the smallest non-negative integer not in use.
+    All ids lower than next_id are in use or they are in the heap of the released ids (which
+    can also contain ids re-used in the meantime, they are discarded lazily).
+    """
+
+    def __init__(self):
+
+        self.objects = {}
+        self.released = []
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __contains__(self, id):
+        return id in self.objects
+
+    def get(self, id):
+        return self.objects.get(id)
+
+    def add(self, id, obj):
+        self.objects[id] = obj
+
+    def remove(self, id, obj):
+        """
+        Release the id, if it is still assigned to the given object.
+        """
+        if self.objects.get(id) is obj:
+            del self.objects[id]
+            if 0 <= id < self.next_id:
+                heapq.heappush(self.released, id)
+
+    def freeId(self):
+        """
+        Smallest id not in use. The id is not reserved, it is taken when an object is added with it.
+        """
+        while self.released and self.released[0] in self.objects:
+            heapq.heappop(self.released)
+
+        if self.released:
+            return self.released[0]
+
+        while self.next_id in self.objects:
+            self.next_id += 1
+
+        return self.next_id
+
+    def freeIds(self, count):
+        """
+        The given number of smallest ids not in use (in increasing order). The ids are not reserved.
+        """
+        ids = []
+        for id in sorted(set(self.released)):
+            if len(ids) == count:
+                return ids
+            if id not in self.objects:
+                ids.append(id)
+
+        id = self.next_id
+        while len(ids) < count:
+            if id not in self.objects:
+                ids.append(id)
+            id += 1
+
+        return ids
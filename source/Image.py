@@ -57,6 +57,8 @@ class Image(object):
                         point.fromDict(data)
                         self.annotations.addPoint(point)
 
+            self.annotations.compactContours()
+
         self.layers = list()
         for layer_data in layers:
             layer = Layer(layer_data["type"])
@@ -155,15 +157,15 @@ class Image(object):
                 'Coverage': np.zeros(len(labels),dtype=np.float32)
             }
 
+            counts, coverage, point_counts = self.annotations.perclassStatistics(self.map_px_to_mm_factor)
+
             for i, label in enumerate(labels):
                 dict['Visibility'][i] = np.int32(label.visible)
                 dict['Color'].append(str(label.fill))
                 dict['Class'].append(label.name)
-                count, new_area = self.annotations.calculate_perclass_blobs_value(label, self.map_px_to_mm_factor)
-                countP = self.annotations.countPoints(label)
-                dict['#R'][i] = count
-                dict['#P'][i] = countP
-                dict['Coverage'][i] = new_area
+                dict['#R'][i] = counts.get(label.name, 0)
+                dict['#P'][i] = point_counts.get(label.name, 0)
+                dict['Coverage'][i] = coverage.get(label.name, 0.0)
 
 
             # create dataframe
@@ -172,9 +174,10 @@ class Image(object):
             self.annotations.table_needs_update = False
             return df
 
-    def create_data_table(self):
+    def create_data_table(self, labels=None):
         '''
-        This create a data table only for the data panel view
+        This create a data table only for the data panel view. If labels (name -> Label) is given
+        the visibility of the classes is updated from it, otherwise the current one is used.
         '''
 
         if self.annotations.table_needs_update is False:
@@ -182,52 +185,30 @@ class Image(object):
         else:
             scale_factor = self.pixelSize()
 
-            # create a list of instances
-            name_list = []
-            visible_blobs = []
+            if labels is not None:
+                self.annotations.setClassVisibility(labels)
+
             # select ONLY visible blobs
-            for blob in self.annotations.seg_blobs:
-                if blob.qpath_gitem is not None:
-                    if blob.qpath_gitem.isVisible():
-                        index = blob.blob_name
-                        name_list.append(index)
-                        visible_blobs.append(blob)
+            visible_blobs = self.annotations.visibleBlobs()
 
             number_of_seg = len(visible_blobs)
 
-            annpoint_list = []
-            visible_annpoints = []
-            for annpoint in self.annotations.annpoints:
-                if annpoint.cross1_gitem is not None:
-                    if annpoint.cross1_gitem.isVisible():
-                        index = annpoint.id
-                        annpoint_list.append(index)
-                        visible_annpoints.append(annpoint)
+            visible_annpoints = self.annotations.visiblePoints()
 
             number_of_points = len(visible_annpoints)
 
+            regions = self.annotations.regionsColumns(visible_blobs, scale_factor)
+            points_table = self.annotations.points_table
+            point_codes = points_table.gather(visible_annpoints, "class")
+
             dict = {
-                'Id': np.zeros(number_of_seg + number_of_points, dtype=int),
-                'Type': [],
-                'Class': [],
-                'Area': np.zeros(number_of_seg + number_of_points),
-                #'Surf. area': np.zeros(number_of_seg)
+                'Id': np.concatenate([regions["id"], points_table.gather(visible_annpoints, "id")]).astype(int),
+                'Type': ['R'] * number_of_seg + ['P'] * number_of_points,
+                'Class': regions["class"] + points_table.classNames(point_codes),
+                'Area': np.concatenate([regions["area"], np.zeros(number_of_points)]),
+                #'Surf. area': regions["surface_area"]
             }
 
-            for i, blob in enumerate(visible_blobs):
-                dict['Id'][i] = blob.id
-                dict['Type'].append('R')
-                dict['Class'].append(blob.class_name)
-                dict['Area'][i] = round(blob.area * (scale_factor) * (scale_factor) / 100, 2)
-            #            if blob.surface_area > 0.0:
-            #                dict['Surf. area'][i] = round(blob.surface_area * (scale_factor) * (scale_factor) / 100, 2)
-
-            for i, annpoint in enumerate(visible_annpoints):
-                dict['Id'][i + number_of_seg] = annpoint.id
-                dict['Type'].append('P')
-                dict['Class'].append(annpoint.class_name)
-                dict['Area'][i + number_of_seg] = 0.0
-
 
             df = pd.DataFrame(dict, columns=['Id','Type', 'Class', 'Area'])
             self.cache_data_table = df
@@ -0,0 +1,315 @@
+# TagLab
+# A semi-automatic segmentation tool
+#
+# Copyright(C) 2020
+# Visual Computing Lab
+# ISTI - Italian National Research Council
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License (http://www.gnu.org/licenses/gpl.txt)
+# for more details.
+
+import os
+import json
+import math
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QRect
+from PyQt5.QtGui import QImage, QPixmap, QPainter
+
+from source.Channel import Channel
+
+
+class ImagePyramid(object):
+    """
+    Multi-resolution representation of a map used for the visualization.
+    The level 0 is the full resolution image, each following level halves the size of the previous one,
+    until the whole map fits a single tile. The overview levels are generated once and, if a cache folder
+    is given, they are stored on disk as tiles (<cache_dir>/<level>/<row>_<col>.png) and re-used
+    the next time the map is opened.
+    The image can be a QImage or a Channel: in this case the map is never loaded as a whole, the full
+    resolution tiles are read from the file and the overview levels are generated tile by tile.
+    """
+
+    VERSION = 1
+
+    def __init__(self, image, cache_dir=None, source=None, tile_size=512, cache_size=128):
+
+        if isinstance(image, Channel):
+            self.channel = image
+            self.image = None
+            (self.width, self.height) = image.size()
+        else:
+            self.channel = None
+            self.image = image.convertToFormat(QImage.Format_ARGB32)
+            self.width = self.image.width()
+            self.height = self.image.height()
+
+        self.cache_dir = cache_dir
+        self.source = source      # file the image comes from, used to invalidate the cache on disk
+        self.tile_size = tile_size
+
+        # size of each level
+        self.levels = [(self.width, self.height)]
+        w = self.width
+        h = self.height
+        while max(w, h) > tile_size:
+            w = int(math.ceil(w / 2.0))
+            h = int(math.ceil(h / 2.0))
+            self.levels.append((w, h))
+
+        # overview levels (or tiles of them, (level, row, col) -> QImage) kept in memory,
+        # only when they are not cached on disk
+        self.level_images = {}
+        self.level_tiles = {}
+
+        # LRU cache of the tiles converted to QPixmap, (level, row, col) -> QPixmap
+        self.cache_size = cache_size
+        self.tile_cache = OrderedDict()
+
+        self.overview = None
+
+    def levelsCount(self):
+        return len(self.levels)
+
+    def levelForScale(self, scale):
+        """
+        Coarsest level whose resolution is still greater or equal than the one displayed at the given scale.
+        """
+        if scale <= 0.0 or scale >= 1.0:
+            return 0
+
+        level = int(math.floor(math.log2(1.0 / scale)))
+        return max(0, min(level, len(self.levels) - 1))
+
+    def tileGrid(self, level):
+        """
+        Number of rows and columns of tiles of the given level.
+        """
+        (w, h) = self.levels[level]
+        rows = int(math.ceil(h / self.tile_size))
+        cols = int(math.ceil(w / self.tile_size))
+        return (rows, cols)
+
+    def tileRect(self, level, row, col):
+        """
+        Tile region in the coordinates of its level.
+        """
+        (w, h) = self.levels[level]
+        x = col * self.tile_size
+        y = row * self.tile_size
+        return QRect(x, y, min(self.tile_size, w - x), min(self.tile_size, h - y))
+
+    def tileFilename(self, level, row, col):
+        return os.path.join(self.cache_dir, str(level), str(row) + "_" + str(col) + ".png")
+
+    def signature(self):
+        """
+        Description of the pyramid stored with the tiles, a mismatch means the cache on disk is outdated.
+        """
+        signature = {"version": ImagePyramid.VERSION, "width": self.width, "height": self.height,
+                     "tile_size": self.tile_size, "levels": len(self.levels)}
+
+        if self.source is not None and os.path.exists(self.source):
+            stat = os.stat(self.source)
+            signature["source_size"] = stat.st_size
+            signature["source_mtime"] = int(stat.st_mtime)
+
+        return signature
+
+    def isCached(self):
+
+        if self.cache_dir is None:
+            return False
+
+        manifest = os.path.join(self.cache_dir, "pyramid.json")
+        if not os.path.exists(manifest):
+            return False
+
+        try:
+            with open(manifest, "r") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return False
+
+        return data == self.signature()
+
+    def build(self):
+        """
+        Generate the overview levels, if they are not already available on disk.
+        """
+
+        last = len(self.levels) - 1
+
+        if self.isCached():
+            self.overview = QImage(self.tileFilename(last, 0, 0))
+            if not self.overview.isNull():
+                return
+
+        if self.cache_dir is not None:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                manifest = os.path.join(self.cache_dir, "pyramid.json")
+                if os.path.exists(manifest):
+                    os.remove(manifest)
+            except OSError:
+                self.cache_dir = None
+
+        save = self.cache_dir is not None
+
+        if self.image is None:
+            save = self.buildTiles(save)
+        else:
+            save = self.buildLevels(save)
+
+        if save:
+            with open(os.path.join(self.cache_dir, "pyramid.json"), "w") as f:
+                json.dump(self.signature(), f)
+
+    def buildLevels(self, save):
+        """
+        Each level is obtained by scaling the previous one, only two levels are in memory at the same time
+        when the tiles are saved on disk. It returns True if all the levels have been saved.
+        """
+
+        img = self.image
+        for level in range(1, len(self.levels)):
+            (w, h) = self.levels[level]
+            img = img.scaled(w, h, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+            if save and self.saveLevel(level, img):
+                continue
+
+            # the level cannot be written, it stays in memory
+            save = False
+            self.level_images[level] = img
+
+        self.overview = img
+
+        return save
+
+    def buildTiles(self, save):
+        """
+        Each tile is obtained by scaling the region of the previous level it covers, so the whole map is never
+        in memory (the map is read from its channel). It returns True if all the tiles have been saved.
+        """
+
+        for level in range(1, len(self.levels)):
+
+            if save:
+                try:
+                    os.makedirs(os.path.join(self.cache_dir, str(level)), exist_ok=True)
+                except OSError:
+                    save = False
+
+            (rows, cols) = self.tileGrid(level)
+            for row in range(rows):
+                for col in range(cols):
+                    tile = self.downsampleTile(level, row, col)
+
+                    if save and tile.save(self.tileFilename(level, row, col)):
+                        continue
+
+                    # the tile cannot be written, it stays in memory
+                    save = False
+                    self.level_tiles[(level, row, col)] = tile
+
+        self.overview = self.tileImage(len(self.levels) - 1, 0, 0)
+
+        return save
+
+    def downsampleTile(self, level, row, col):
+
+        rect = self.tileRect(level, row, col)
+
+        # region of the previous level covered by the tile
+        (w, h) = self.levels[level - 1]
+        x = 2 * rect.x()
+        y = 2 * rect.y()
+        region = self.levelRegion(level - 1, QRect(x, y, min(2 * rect.width(), w - x), min(2 * rect.height(), h - y)))
+
+        return region.scaled(rect.width(), rect.height(), Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+    def levelRegion(self, level, rect):
+        """
+        Region of the given level (in the coordinates of the level), composed from its tiles.
+        """
+
+        if level == 0 and self.image is None:
+            bbox = [rect.y(), rect.x(), rect.width(), rect.height()]
+            return self.channel.readRegionAsQImage(bbox).convertToFormat(QImage.Format_ARGB32)
+
+        region = QImage(rect.width(), rect.height(), QImage.Format_ARGB32)
+        region.fill(Qt.black)
+
+        painter = QPainter(region)
+        ts = self.tile_size
+        for row in range(rect.top() // ts, rect.bottom() // ts + 1):
+            for col in range(rect.left() // ts, rect.right() // ts + 1):
+                painter.drawImage(col * ts - rect.x(), row * ts - rect.y(), self.tileImage(level, row, col))
+        painter.end()
+
+        return region
+
+    def saveLevel(self, level, img):
+
+        try:
+            os.makedirs(os.path.join(self.cache_dir, str(level)), exist_ok=True)
+        except OSError:
+            return False
+
+        (rows, cols) = self.tileGrid(level)
+        for row in range(rows):
+            for col in range(cols):
+                tile = img.copy(self.tileRect(level, row, col))
+                if not tile.save(self.tileFilename(level, row, col)):
+                    return False
+
+        return True
+
+    def tileImage(self, level, row, col):
+
+        if level == 0:
+            if self.image is None:
+                return self.levelRegion(0, self.tileRect(level, row, col))
+            return self.image.copy(self.tileRect(level, row, col))
+
+        tile = self.level_tiles.get((level, row, col))
+        if tile is not None:
+            return tile
+
+        img = self.level_images.get(level)
+        if img is not None:
+            return img.copy(self.tileRect(level, row, col))
+
+        if level == len(self.levels) - 1 and self.overview is not None:
+            return self.overview
+
+        return QImage(self.tileFilename(level, row, col))
+
+    def tilePixmap(self, level, row, col):
+        """
+        Tile of the given level as a QPixmap. The most recently used tiles are cached.
+        """
+
+        key = (level, row, col)
+        pixmap = self.tile_cache.get(key)
+        if pixmap is not None:
+            self.tile_cache.move_to_end(key)
+            return pixmap
+
+        pixmap = QPixmap.fromImage(self.tileImage(level, row, col))
+
+        self.tile_cache[key] = pixmap
+        if len(self.tile_cache) > self.cache_size:
+            self.tile_cache.popitem(last=False)
+
+        return pixmap
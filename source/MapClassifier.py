@@ -37,6 +37,7 @@ from PyQt5.QtCore import QCoreApplication, Qt, QObject, pyqtSlot, pyqtSignal
 from PyQt5.QtGui import QPainter, QImage, QColor, QPixmap, qRgb, qRed, qGreen, qBlue
 
 from source import genutils
+from source.Channel import Channel
 
 
 class MapClassifier(QObject):
@@ -58,16 +59,8 @@ class MapClassifier(QObject):
         self.labels_code_dict = classifier_info['Classes']
 
         self.background_index = -1
-
-        self.label_colors = [[0,0,0]] * len(self.labels_code_dict)
-        for key in self.labels_code_dict.keys():
-            if key == "Background":
-                self.background_index = self.labels_code_dict[key]
-                self.label_colors[self.background_index] = [0,0,0]
-            else:
-                color = labels_dictionary[key].fill
-                index = self.labels_code_dict[key]
-                self.label_colors[index] = color
+        self.label_colors = []
+        self.setLabels(labels_dictionary)
 
         self.average_norm = classifier_info['Average Norm.']
         self.net = self._load_classifier(classifier_info['Weights'])
@@ -87,6 +80,27 @@ class MapClassifier(QObject):
 
         self.temp_dir = "temp"
 
+        # rasters written by the streaming output mode (memory-mapped)
+        self.label_raster = None
+        self.scores_raster = None
+
+
+    def setLabels(self, labels_dictionary):
+        """
+        Assign the colors of the labels dictionary to the classes of the classifier.
+        """
+
+        self.background_index = -1
+
+        self.label_colors = [[0,0,0]] * len(self.labels_code_dict)
+        for key in self.labels_code_dict.keys():
+            if key == "Background":
+                self.background_index = self.labels_code_dict[key]
+                self.label_colors[self.background_index] = [0,0,0]
+            else:
+                color = labels_dictionary[key].fill
+                index = self.labels_code_dict[key]
+                self.label_colors[index] = color
 
     def _load_classifier(self, modelName):
 
@@ -107,12 +121,18 @@ class MapClassifier(QObject):
 
     def setup(self, img_map, pixel_size, target_pixel_size, working_area=[], padding=0):
         """
-        Initialize the image to classify.
+        Initialize the image to classify. The map can be given as a QImage or as a Channel; in the second case
+        only the working area is read from the disk.
         """
 
         self.scale_factor = target_pixel_size / pixel_size
         if not working_area:
-            working_area = [0, 0, img_map.width(), img_map.height()]
+            if isinstance(img_map, Channel):
+                (map_width, map_height) = img_map.size()
+            else:
+                map_width = img_map.width()
+                map_height = img_map.height()
+            working_area = [0, 0, map_width, map_height]
 
         # padding the working area (taking into account the scaling factor)
         self.padding = round(padding * self.scale_factor)
@@ -122,16 +142,19 @@ class MapClassifier(QObject):
         height = int(max(513, working_area[3]) + 2*self.padding)
 
         # crop the input image
-        crop_image = img_map.copy(left, top, width, height)
-        self.input_image = genutils.qimageToNumpyArray(crop_image)
+        if isinstance(img_map, Channel):
+            self.input_image = img_map.readRegion([top, left, width, height])
+        else:
+            crop_image = img_map.copy(left, top, width, height)
+            self.input_image = genutils.qimageToNumpyArray(crop_image)
 
         # IMPORTNAT NOTE 1:
         # The following information, together with the scale_factor, are used to put the results on the orthoimage
         self.offset = [working_area[0], working_area[1]]
 
         # scale the input image
-        w_target = round(crop_image.width() / self.scale_factor)
-        h_target = round(crop_image.height() / self.scale_factor)
+        w_target = round(width / self.scale_factor)
+        h_target = round(height / self.scale_factor)
 
         self.input_image = cv2.resize(self.input_image, dsize=(w_target, h_target), interpolation=cv2.INTER_CUBIC)
 
@@ -146,17 +169,28 @@ class MapClassifier(QObject):
 
 
     def run(self, TILE_SIZE, AGGREGATION_WINDOW_SIZE, AGGREGATION_STEP, prediction_threshold=0.5,
-            save_scores = False, autocolor = False,  autolevel = False):
+            save_scores = False, autocolor = False,  autolevel = False, batch_size = 1, streaming = False,
+            keep_network = False):
         """
         :param TILE_SIZE: Base tile. This corresponds to the INPUT SIZE of the network.
         :param AGGREGATION_WINDOW_SIZE: Size of the center window considered for the aggregation.
         :param AGGREGATION_STEP: Step, in pixels, to calculate the different scores.
+        :param batch_size: Number of crops classified with a single forward pass. The 9 shifted crops of a tile
+                           are stacked together, when the batch size is larger than 9 several tiles are stacked.
+        :param streaming: If True the predictions are written directly in a memory-mapped raster of class indices
+                          (see label_raster and scores_raster) instead of passing through temporary PNG tiles.
+        :param keep_network: If True the network is not released at the end, so the classifier can be run again.
         :return:
         """
 
+        # release the rasters of a previous run (their files are removed below)
+        self.label_raster = None
+        self.scores_raster = None
+        self.scores = None
+
         # create a temporary folder to store the processing
         if not os.path.exists(self.temp_dir):
-            os.mkdir(self.temp_dir)
+            os.makedirs(self.temp_dir)
         else:
             # if the folder exists, remove all files
             files = glob.glob(os.path.join(self.temp_dir, "*"))
@@ -168,6 +202,7 @@ class MapClassifier(QObject):
         tile_cols = int(self.wa_width / AGGREGATION_WINDOW_SIZE) + 1
         tile_rows = int(self.wa_height / AGGREGATION_WINDOW_SIZE) + 1
 
+        device = torch.device("cpu")
         if torch.cuda.is_available():
             device = torch.device("cuda")
             self.net.to(device)
@@ -181,132 +216,209 @@ class MapClassifier(QObject):
         self.processing_step = 0
         self.total_processing_steps = 19 * tiles_number
 
-        for row in range(tile_rows):
+        batch_size = max(1, int(batch_size))
+        tiles_per_batch = max(1, batch_size // 9)
 
-            if self.flagStopProcessing is True:
-                break
+        tiles = [(row, col) for row in range(tile_rows) for col in range(tile_cols)]
 
-            for col in range(tile_cols):
+        if streaming is True:
+            self.createRasters(save_scores)
 
-                if self.flagStopProcessing is True:
-                    break
+        for first_tile in range(0, tiles_number, tiles_per_batch):
 
-                scores = np.zeros((9, self.nclasses, TILE_SIZE, TILE_SIZE))
+            if self.flagStopProcessing is True:
+                break
 
-                k = 0
+            group = tiles[first_tile:first_tile + tiles_per_batch]
+
+            # the 9 shifted crops of each tile of the group
+            crops = []
+            for (row, col) in group:
                 for i in range(-1,2):
                     for j in range(-1,2):
-
                         top = self.wa_top - DELTA_CROP + row * AGGREGATION_WINDOW_SIZE + i * AGGREGATION_STEP
                         left = self.wa_left - DELTA_CROP + col * AGGREGATION_WINDOW_SIZE + j * AGGREGATION_STEP
-                        img_np = genutils.cropImage(self.input_image, [top, left, TILE_SIZE, TILE_SIZE])
+                        crops.append(self.prepareTile(top, left, TILE_SIZE, autocolor, autolevel))
 
-                        if autocolor is True and autolevel is False:
-                            img_np = genutils.whiteblance(img_np)
+            scores = np.zeros((len(crops), self.nclasses, TILE_SIZE, TILE_SIZE), dtype=np.float32)
 
-                        if autolevel is True and autocolor is False:
-                            img_np = genutils.autolevel(img_np, 1.0)
+            for first_crop in range(0, len(crops), batch_size):
 
-                        if autolevel is True and autocolor is True:
-                            white = genutils.whiteblance(img_np)
-                            white = white.astype(np.uint8)
-                            img_np = genutils.autolevel(white, 1.0)
-
-                        # if i == 0 and j == 0:
-                        # tilename = "RGB_r=" + str(row) + "_c=" + str(col) + "_i=" + str(i) + "_j=" + str(j) + ".png"
-                        # filename = os.path.join(self.temp_dir, tilename)
-                        # tile = genutils.rgbToQImage(img_np)
-                        # tile.save(filename)
-
-                        img_np = img_np.astype(np.float32)
-                        img_np = img_np / 255.0
+                if self.flagStopProcessing is True:
+                    break
 
-                        # H x W x C --> C x H x W
-                        img_np = img_np.transpose(2, 0, 1)
+                batch = np.stack(crops[first_crop:first_crop + batch_size])
 
-                        # Normalization (average subtraction)
-                        img_np[0] = img_np[0] - self.average_norm[0]
-                        img_np[1] = img_np[1] - self.average_norm[1]
-                        img_np[2] = img_np[2] - self.average_norm[2]
+                with torch.no_grad():
 
-                        with torch.no_grad():
+                    input = torch.from_numpy(batch)
 
-                            img_tensor = torch.from_numpy(img_np)
-                            input = img_tensor.unsqueeze(0)
+                    if torch.cuda.is_available():
+                        input = input.to(device)
 
-                            if torch.cuda.is_available():
-                                input = input.to(device)
+                    outputs = self.net(input)
 
-                            outputs = self.net(input)
+                    scores[first_crop:first_crop + batch.shape[0]] = outputs.cpu().numpy()
 
-                            scores[k] = outputs[0].cpu().numpy()
-                            k = k + 1
+                self.processing_step += batch.shape[0]
+                self.updateProgress.emit( (100.0 * self.processing_step) / self.total_processing_steps )
+                QCoreApplication.processEvents()
 
-                            self.processing_step += 1
-                            self.updateProgress.emit( (100.0 * self.processing_step) / self.total_processing_steps )
-                            QCoreApplication.processEvents()
+            if self.flagStopProcessing is True:
+                break
 
-                if self.flagStopProcessing is True:
-                    break
+            for n, (row, col) in enumerate(group):
 
-                # import matplotlib.pyplot as plt
-                # for k in range(9):
-                #     plt.imshow(scores[k,0,513-256:513+256, 513-256:513+256])
-                #     filename = "C:\\temp\\predPorite_r=" + str(row) + "_c=" + str(col) + "-" + str(k) + ".png"
-                #     plt.savefig(filename)
-                #     plt.close('all')
-                #     plt.imshow(scores[k,1,513-256:513+256, 513-256:513+256])
-                #     filename = "C:\\temp\\predBack_r=" + str(row) + "_c=" + str(col) + "-" + str(k) + ".png"
-                #     plt.savefig(filename)
-                #     plt.close('all')
-                #
-                # por = scores[:,0,513-256:513+256, 513-256:513+256]
-                # por = np.average(por, axis=0)
-                # plt.imshow(por)
-                # filename = "C:\\temp\\por_r=" + str(row) + "_c=" + str(col) + ".png"
-                # plt.savefig(filename)
-                #
-                # back = scores[:,1,513-256:513+256, 513-256:513+256]
-                # back = np.average(back, axis=0)
-                # plt.imshow(back)
-                # filename = "C:\\temp\\backg_r=" + str(row) + "_c=" + str(col) + ".png"
-                # plt.savefig(filename)
-
-                preds_avg = self.aggregateScores(scores, tile_sz=TILE_SIZE,
-                                                     center_window_size=AGGREGATION_WINDOW_SIZE, step=AGGREGATION_STEP)
-
-                values_t, predictions_t = torch.max(torch.from_numpy(preds_avg), 0)
-                preds = predictions_t.cpu().numpy()
-                values_t = values_t.cpu().numpy()
-                unc_matrix = values_t < prediction_threshold
-                preds[unc_matrix] = self.background_index  # assign background
-
-                resimg = np.zeros((preds.shape[0], preds.shape[1], 3), dtype='uint8')
-                for label_index in range(self.nclasses):
-                    resimg[preds == label_index, :] = self.label_colors[label_index]
-
-                tilename = str(row) + "_" + str(col) + ".png"
-                filename = os.path.join(self.temp_dir, tilename)
-                genutils.rgbToQImage(resimg).save(filename)
+                preds_avg = self.aggregateScores(scores[9*n:9*(n+1)], tile_sz=TILE_SIZE,
+                                                 center_window_size=AGGREGATION_WINDOW_SIZE, step=AGGREGATION_STEP)
 
-                if save_scores is True:
-                    tilename = str(row) + "_" + str(col) + ".dat"
-                    filename = os.path.join(self.temp_dir, tilename)
-                    fileobject = open(filename, 'wb')
-                    pkl.dump(preds_avg, fileobject)
-                    fileobject.close()
+                if streaming is True:
+                    self.writeTile(row, col, preds_avg, prediction_threshold, save_scores)
+                else:
+                    self.saveTile(row, col, preds_avg, prediction_threshold, save_scores)
 
                 self.processing_step += 1
                 self.updateProgress.emit( (100.0 * self.processing_step) / self.total_processing_steps )
                 QCoreApplication.processEvents()
 
-        self.assembleTiles(tile_rows, tile_cols, AGGREGATION_WINDOW_SIZE, ass_scores= save_scores)
+        if streaming is True:
+            self.label_raster.flush()
+            if self.scores_raster is not None:
+                self.scores_raster.flush()
+        else:
+            self.assembleTiles(tile_rows, tile_cols, AGGREGATION_WINDOW_SIZE, ass_scores= save_scores)
+
         torch.cuda.empty_cache()
-        del self.net
-        self.net = None
+        if keep_network is False:
+            del self.net
+            self.net = None
+
+    def prepareTile(self, top, left, tile_size, autocolor, autolevel):
+        """
+        Crop a tile from the input image and prepare it for the network (C x H x W, normalized).
+        """
+
+        img_np = genutils.cropImage(self.input_image, [top, left, tile_size, tile_size])
+
+        if autocolor is True and autolevel is False:
+            img_np = genutils.whiteblance(img_np)
+
+        if autolevel is True and autocolor is False:
+            img_np = genutils.autolevel(img_np, 1.0)
+
+        if autolevel is True and autocolor is True:
+            white = genutils.whiteblance(img_np)
+            white = white.astype(np.uint8)
+            img_np = genutils.autolevel(white, 1.0)
+
+        img_np = img_np.astype(np.float32)
+        img_np = img_np / 255.0
+
+        # H x W x C --> C x H x W
+        img_np = img_np.transpose(2, 0, 1)
+
+        # Normalization (average subtraction)
+        img_np[0] = img_np[0] - self.average_norm[0]
+        img_np[1] = img_np[1] - self.average_norm[1]
+        img_np[2] = img_np[2] - self.average_norm[2]
+
+        return img_np
+
+    def predictTile(self, preds_avg, prediction_threshold):
+        """
+        Given the aggregated scores of a tile it returns the map of the class indices.
+        """
+
+        values_t, predictions_t = torch.max(torch.from_numpy(preds_avg), 0)
+        preds = predictions_t.cpu().numpy()
+        values_t = values_t.cpu().numpy()
+        unc_matrix = values_t < prediction_threshold
+        preds[unc_matrix] = self.background_index  # assign background
+
+        return preds
+
+    def saveTile(self, row, col, preds_avg, prediction_threshold, save_scores):
+        """
+        Compute the labels of a classified tile and store them (and the scores, if requested) in the temp folder.
+        """
+
+        preds = self.predictTile(preds_avg, prediction_threshold)
+
+        resimg = np.zeros((preds.shape[0], preds.shape[1], 3), dtype='uint8')
+        for label_index in range(self.nclasses):
+            resimg[preds == label_index, :] = self.label_colors[label_index]
+
+        tilename = str(row) + "_" + str(col) + ".png"
+        filename = os.path.join(self.temp_dir, tilename)
+        genutils.rgbToQImage(resimg).save(filename)
+
+        if save_scores is True:
+            tilename = str(row) + "_" + str(col) + ".dat"
+            filename = os.path.join(self.temp_dir, tilename)
+            fileobject = open(filename, 'wb')
+            pkl.dump(preds_avg, fileobject)
+            fileobject.close()
+
+    def createRasters(self, save_scores):
+        """
+        Preallocate the memory-mapped rasters (working area size) used by the streaming output mode.
+        The label raster stores the class index of each pixel, the scores raster the aggregated scores.
+        """
+
+        filename = os.path.join(self.temp_dir, "labelmap.npy")
+        self.label_raster = np.lib.format.open_memmap(filename, mode="w+", dtype=np.uint8,
+                                                      shape=(self.wa_height, self.wa_width))
+        if self.background_index >= 0:
+            self.label_raster[:] = self.background_index
+
+        self.scores_raster = None
+        if save_scores is True:
+            filename = os.path.join(self.temp_dir, "scores.npy")
+            self.scores_raster = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float32,
+                                                           shape=(self.nclasses, self.wa_height, self.wa_width))
+
+    def writeTile(self, row, col, preds_avg, prediction_threshold, save_scores):
+        """
+        Write the labels of a classified tile (and the scores, if requested) into the memory-mapped rasters.
+        """
+
+        AWS = preds_avg.shape[1]
+
+        yoffset = row * AWS
+        xoffset = col * AWS
+
+        # the classified area can exceed the working area
+        h = min(AWS, self.wa_height - yoffset)
+        w = min(AWS, self.wa_width - xoffset)
+        if h <= 0 or w <= 0:
+            return
+
+        preds = self.predictTile(preds_avg, prediction_threshold)
+        self.label_raster[yoffset:yoffset + h, xoffset:xoffset + w] = preds[0:h, 0:w]
+
+        if save_scores is True:
+            self.scores_raster[:, yoffset:yoffset + h, xoffset:xoffset + w] = preds_avg[:, 0:h, 0:w]
+
+    def classNames(self):
+        """
+        It returns the class name corresponding to each index of the label raster (None for the background).
+        """
+
+        names = [None] * len(self.labels_code_dict)
+        for key in self.labels_code_dict.keys():
+            if key != "Background":
+                names[self.labels_code_dict[key]] = key
+
+        return names
 
     def loadScores(self):
 
+        filename = os.path.join(self.temp_dir, "scores.npy")
+        if os.path.exists(filename):
+            # scores written by the streaming output mode
+            self.scores = np.load(filename, mmap_mode="r")
+            return
+
         filename = os.path.join(self.temp_dir, "assembled_scores.dat")
         fileobject = open(filename, 'rb')
         self.scores = pkl.load(fileobject)
@@ -321,7 +433,7 @@ class MapClassifier(QObject):
 
         if ass_scores is True:
             AWS = AGGREGATION_WINDOW_SIZE
-            assembled_scores = np.zeros((self.nclasses, H, W))
+            assembled_scores = np.zeros((self.nclasses, H, W), dtype=np.float32)
             for r in range(tile_rows):
                 for c in range(tile_cols):
                     tilename = str(r) + "_" + str(c) + ".dat"
@@ -401,7 +513,8 @@ class MapClassifier(QObject):
         nscores = scores.shape[0]
         nclasses = scores.shape[1]
 
-        classification_scores = np.zeros((nscores, nclasses, center_window_size, center_window_size))
+        # running sum of the softmax of the shifted scores
+        classification_scores_avg = np.zeros((nclasses, center_window_size, center_window_size), dtype=np.float32)
         scores_counter = np.zeros((center_window_size, center_window_size), dtype=np.int8)
 
         # aggregation limits
@@ -437,7 +550,17 @@ class MapClassifier(QObject):
                 x2src = x1src + x2dest - x1dest
                 y2src = y1src + y2dest - y1dest
 
-                classification_scores[k, :, y1dest:y2dest, x1dest:x2dest] = scores[k, :, y1src:y2src, x1src:x2src]
+                #####   AGGREGATE SCORES BY AVERAGING THEM   ##################################################
+
+                # NOTE: SOME APPROACHES AVERAGE THE SCORES DIRECTLY, OTHER ONES AVERAGE THE OUTPUT OF THE SOFTMAX
+                #       HERE, WE AVERAGE THE OUTPUT OF THE SOFTMAX
+
+                prob = scores[k, :, y1src:y2src, x1src:x2src].astype(np.float32)
+                np.subtract(prob, prob.max(axis=0), out=prob)
+                np.exp(prob, out=prob)
+                prob /= prob.sum(axis=0)
+
+                classification_scores_avg[:, y1dest:y2dest, x1dest:x2dest] += prob
                 scores_counter[y1dest:y2dest, x1dest:x2dest] += 1
 
                 k = k + 1
@@ -446,19 +569,10 @@ class MapClassifier(QObject):
                 self.updateProgress.emit( (100.0 * self.processing_step) / self.total_processing_steps )
                 QCoreApplication.processEvents()
 
-        #####   AGGREGATE SCORES BY AVERAGING THEM   ##################################################
-
-        # NOTE: SOME APPROACHES AVERAGE THE SCORES DIRECTLY, OTHER ONES AVERAGE THE OUTPUT OF THE SOFTMAX
-        #       HERE, WE AVERAGE THE OUTPUT OF THE SOFTMAX
-
-        softmax = torch.nn.Softmax(dim=0)
-
-        classification_scores_avg = np.zeros((nclasses, center_window_size, center_window_size))
-        for i in range(nscores):
-            prob = softmax(torch.from_numpy(classification_scores[i]))
-            classification_scores_avg = classification_scores_avg + prob.numpy()
-
-        classification_scores_avg = classification_scores_avg / nscores
+        # the pixels not covered by a shifted score have null scores, i.e. their softmax is uniform
+        uncovered = (nscores - scores_counter).astype(np.float32)
+        classification_scores_avg += uncovered / nclasses
+        classification_scores_avg /= nscores
 
         #classification_scores = np.average(classification_scores, axis=0)
         #classification_scores_avg = softmax(torch.from_numpy(classification_scores)).cpu().numpy()
@@ -35,9 +35,12 @@ import sys
 import json
 from cv2 import fillPoly
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from skimage.measure import label, regionprops
 from source.Blob import Blob
 from source.Label import Label
+from source.AreaMetrics import AreaMetrics
+from source.SampleGrid import SampleGrid
 
 
 class NewDataset(object):
@@ -311,7 +314,7 @@ class NewDataset(object):
 		PSCV = []
 
 		# a coral is counted if and only if it is inside the given area for 3/4
-		for key in enumerate(target_classes.keys()):
+		for key in target_classes.keys():
 
 			if key != "Background":
 
@@ -332,8 +335,9 @@ class NewDataset(object):
 				else:
 					PSCV.append(0.0)
 
-		# coverage evaluation
-		coverage = self.computeExactCoverage(area, target_classes)
+		# coverage evaluation (same order of the other metrics)
+		coverage_per_class = self.computeExactCoverage(area, target_classes)
+		coverage = [coverage_per_class[key] for key in target_classes.keys() if key != "Background"]
 
 		return number, coverage, PSCV
 
@@ -422,16 +426,17 @@ class NewDataset(object):
 		area_w = int(math.sqrt(0.15) * map_w)
 		area_h = int(math.sqrt(0.15) * map_h)
 
-		landscape_number, landscape_coverage, landscape_PSCV = self.calculateMetrics([0, 0, map_w, map_h], target_classes)
+		# the metrics of all the candidate areas are evaluated together (see AreaMetrics)
+		metrics = AreaMetrics(self.labels, self.blobs, target_classes, self.frequencies)
 
-		# calculate normalization factor
-		numbers = []
-		coverages = []
-		PSCVs = []
-		sn = []
-		sc = []
-		sP = []
-		for i in range(5000):
+		number, coverage, PSCV = metrics.evaluate([[0, 0, map_w, map_h]])
+		landscape_number = number[0].tolist()
+		landscape_coverage = coverage[0].tolist()
+		landscape_PSCV = PSCV[0].tolist()
+
+		# candidate areas, 5000 to calculate the normalization factors and 10000 to choose from
+		candidates = []
+		for i in range(15000):
 
 			aspect_ratio_factor = factor = rnd.uniform(0.4, 2.5)
 			w = int(area_w / aspect_ratio_factor)
@@ -439,21 +444,23 @@ class NewDataset(object):
 			px = rnd.randint(0, map_w - w - 1)
 			py = rnd.randint(0, map_h - h - 1)
 
-			area_bbox = [py, px, w, h]
-			area_number, area_coverage, area_PSCV = self.calculateMetrics(area_bbox, target_classes)
-			s1, s2, s3 = self.rangeScore(area_number, area_coverage, area_PSCV, landscape_number, landscape_coverage, landscape_PSCV)
+			candidates.append([py, px, w, h])
+
+		sys.stdout.write("\rFinding biologically representative areas...")
+		numbers, coverages, PSCVs = metrics.evaluate(candidates)
+
+		# calculate normalization factor
+		sn = []
+		sc = []
+		sP = []
+		for i in range(5000):
 
-			numbers.append(area_number)
-			coverages.append(area_coverage)
-			PSCVs.append(area_PSCV)
+			s1, s2, s3 = self.rangeScore(numbers[i], coverages[i], PSCVs[i], landscape_number, landscape_coverage, landscape_PSCV)
 
 			sn.append(s1)
 			sc.append(s2)
 			sP.append(s3)
 
-			if i % 50 == 0:
-				sys.stdout.write("\rFinding biologically representative areas (pass 1/2)... %.2f %%" % ((i * 100.0) / 5000.0))
-
 		sn = np.array(sn)
 		sc = np.array(sc)
 		sP = np.array(sP)
@@ -464,31 +471,19 @@ class NewDataset(object):
 		self.sP_min = np.min(sP, axis=0)
 		self.sP_max = np.max(sP, axis=0)
 
-		for i in range(10000):
-
-			aspect_ratio_factor = factor = rnd.uniform(0.4, 2.5)
-			w = int(area_w / aspect_ratio_factor)
-			h = int(area_h * aspect_ratio_factor)
-
-			px = rnd.randint(0, map_w - w - 1)
-			py = rnd.randint(0, map_h - h - 1)
-
-			area_bbox = [py, px, w, h]
-
-			area_number, area_coverage, area_PSCV = self.calculateMetrics(area_bbox, target_classes)
-			scores = self.calculateNormalizedScore(area_number, area_coverage, area_PSCV, landscape_number, landscape_coverage, landscape_PSCV)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			for i in range(5000, 15000):
 
-			for jj, score in enumerate(scores):
-				if math.isnan(score):
-					scores[jj] = 0.0
+				area_bbox = candidates[i]
+				scores = self.calculateNormalizedScore(numbers[i], coverages[i], PSCVs[i], landscape_number, landscape_coverage, landscape_PSCV)
 
-			aggregated_score = sum(scores) / len(scores)
+				for jj, score in enumerate(scores):
+					if math.isnan(score):
+						scores[jj] = 0.0
 
-			area_info.append((area_bbox, scores, aggregated_score))
-
-			if i % 50 == 0:
-				sys.stdout.write("\rFinding biologically representative areas (pass 2/2)... %.2f %%" % ((i * 100.0) / 10000.0))
+				aggregated_score = sum(scores) / len(scores)
 
+				area_info.append((area_bbox, scores, aggregated_score))
 
 		area_info.sort(key=lambda x:x[2])
 		val_area = area_info[0][0]
@@ -554,19 +549,23 @@ class NewDataset(object):
 
 		painter = QPainter(labelimg)
 
-		# CREATE LABEL IMAGE
-		for i, blob in enumerate(self.blobs):
+		# only the regions of the visible classes are exported
+		annotations = self.image_info.annotations
+		annotations.setClassVisibility(labels_dictionary)
+		visible_blobs = annotations.visibleBlobs(self.blobs)
 
-			if blob.qpath_gitem.isVisible():
+		# CREATE LABEL IMAGE
+		for i, blob in enumerate(visible_blobs):
 
-				if blob.class_name == "Empty":
-					rgb = qRgb(0, 0, 0)
-				else:
-					class_color = labels_dictionary[blob.class_name].fill
-					rgb = qRgb(class_color[0], class_color[1], class_color[2])
+			if blob.class_name == "Empty":
+				rgb = qRgb(0, 0, 0)
+			else:
+				class_color = labels_dictionary[blob.class_name].fill
+				rgb = qRgb(class_color[0], class_color[1], class_color[2])
 
-				painter.setBrush(QBrush(QColor(rgb)))
-				painter.drawPath(blob.qpath_gitem.path())
+			painter.setBrush(QBrush(QColor(rgb)))
+			# the regions out of view have no graphics item, the path is created from the contours
+			painter.drawPath(blob.createQPath())
 
 		painter.end()
 		self.label_image = labelimg
@@ -574,15 +573,14 @@ class NewDataset(object):
 		if self.data_format == "COCO" or self.data_format == "YOLO-v5":
 			self.id_image = np.zeros((h, w), dtype=np.int32)
 
-			for i, blob in enumerate(self.blobs):
+			for i, blob in enumerate(visible_blobs):
 
-				if blob.qpath_gitem.isVisible():
-					if blob.class_name != "Empty":
-						points = blob.contour.round().astype(np.int32)
-						fillPoly(self.id_image, pts=[points], color = blob.id)
-						for inner_contour in blob.inner_contours:
-							points = inner_contour.round().astype(np.int32)
-							fillPoly(self.id_image, pts=[points], color=0)
+				if blob.class_name != "Empty":
+					points = blob.contour.round().astype(np.int32)
+					fillPoly(self.id_image, pts=[points], color = blob.id)
+					for inner_contour in blob.inner_contours:
+						points = inner_contour.round().astype(np.int32)
+						fillPoly(self.id_image, pts=[points], color=0)
 
 			self.id_image = genutils.integerMapToQImage(self.id_image)
 
@@ -903,7 +901,34 @@ class NewDataset(object):
 		self.radius_map = gaussian(self.radius_map, sigma=60.0, mode='reflect')
 
 
-	def sampleBlobWimportanceSampling(self, blob, current_samples):
+	def importanceSamplingGrid(self, current_samples):
+		"""
+		Grid of the given samples for the importance sampling (the radius of each sample is taken from the radius map).
+		"""
+
+		grid = SampleGrid(cell_size=np.min(self.radius_map), variable_radius=True)
+		for (px, py) in current_samples:
+			grid.add(px, py, self.radius_map[py, px])
+
+		return grid
+
+
+	def poissonDiskGrid(self, current_samples, r):
+		"""
+		Grid of the given samples for the Poisson disk sampling with (minimum) radius r.
+		"""
+
+		grid = SampleGrid(cell_size=2.0*r)
+		for (px, py) in current_samples:
+			grid.add(px, py)
+
+		return grid
+
+
+	def sampleBlobWimportanceSampling(self, blob, current_samples, grid=None):
+
+		if grid is None:
+			grid = self.importanceSamplingGrid(current_samples)
 
 		offset_x = blob.bbox[1]
 		offset_y = blob.bbox[0]
@@ -924,26 +949,22 @@ class NewDataset(object):
 
 				r1 = self.radius_map[py, px]
 
-				flag = True
-				for sample in current_samples:
-					r2 = self.radius_map[sample[1], sample[0]]
-					d = math.sqrt((sample[0] - px) * (sample[0] - px) + (sample[1] - py) * (sample[1] - py))
-					if d < (r1 + r2) / 2.0:
-						flag = False
-						break
-
-				if flag is True:
+				if grid.isFree(px, py, r1):
 					current_samples.append((px, py))
+					grid.add(px, py, r1)
 
 		return current_samples
 
 
-	def sampleSubAreaWImportanceSampling(self, area, current_samples):
+	def sampleSubAreaWImportanceSampling(self, area, current_samples, grid=None):
 		"""
 		Sample the given area using the Poisson Disk sampling according to the given radius map.
 		The area is stored as (top, left, width, height).
 		"""
 
+		if grid is None:
+			grid = self.importanceSamplingGrid(current_samples)
+
 		top = area[0]
 		left = area[1]
 		w = area[2]
@@ -955,21 +976,17 @@ class NewDataset(object):
 
 			r1 = self.radius_map[py, px]
 
-			flag = True
-			for sample in current_samples:
-				r2 = self.radius_map[sample[1], sample[0]]
-				d = math.sqrt((sample[0] - px) * (sample[0] - px) + (sample[1] - py) * (sample[1] - py))
-				if d < (r1+r2)/2.0:
-					flag = False
-					break
-
-			if flag is True:
+			if grid.isFree(px, py, r1):
 				current_samples.append((px, py))
+				grid.add(px, py, r1)
 
 		return current_samples
 
 
-	def sampleBlobWPoissonDisk(self, blob, current_samples, r):
+	def sampleBlobWPoissonDisk(self, blob, current_samples, r, grid=None):
+
+		if grid is None:
+			grid = self.poissonDiskGrid(current_samples, r)
 
 		map_w = self.ortho_image.width()
 		map_h = self.ortho_image.height()
@@ -993,20 +1010,17 @@ class NewDataset(object):
 
 				if px > self.crop_size and px < map_w - self.crop_size and py > self.crop_size and py < map_h - self.crop_size:
 
-					flag = True
-					for sample in current_samples:
-						d = math.sqrt((sample[0] - px) * (sample[0] - px) + (sample[1] - py) * (sample[1] - py))
-						if d < 2.0*r:
-							flag = False
-							break
-
-					if flag is True:
+					if grid.isFree(px, py, r):
 						current_samples.append((px, py))
+						grid.add(px, py)
 
 		return current_samples
 
 
-	def sampleBackgroundWPoissonDisk(self, area, current_samples, r):
+	def sampleBackgroundWPoissonDisk(self, area, current_samples, r, grid=None):
+
+		if grid is None:
+			grid = self.poissonDiskGrid(current_samples, r)
 
 		offset_x = int(area[1])
 		offset_y = int(area[0])
@@ -1022,15 +1036,9 @@ class NewDataset(object):
 				px = px + offset_x
 				py = py + offset_y
 
-				flag = True
-				for sample in current_samples:
-					d = math.sqrt((sample[0] - px) * (sample[0] - px) + (sample[1] - py) * (sample[1] - py))
-					if d < 2.0*r:
-						flag = False
-						break
-
-				if flag is True:
+				if grid.isFree(px, py, r):
 					current_samples.append((px, py))
+					grid.add(px, py)
 
 		return current_samples
 
@@ -1042,17 +1050,22 @@ class NewDataset(object):
 		The functions returns a list of (x,y) coordinates.
 		"""
 
-		# minority classes are sampled before majority classes
+		background_radius = 280.0
+
+		# the grid of the samples is shared by all the classes
 		samples = []
+		grid = self.poissonDiskGrid(samples, min(list(radii) + [background_radius]))
+
+		# minority classes are sampled before majority classes
 		for i, class_name in enumerate(classes_to_sample):
 			radius = radii[i]
 			for blob in self.blobs:
 				if blob.class_name == class_name:
-					samples = self.sampleBlobWPoissonDisk(blob, samples, radius)
+					samples = self.sampleBlobWPoissonDisk(blob, samples, radius, grid)
 					txt = str(len(samples)) + "\r"
 					sys.stdout.write(txt)
 
-		samples = self.sampleBackgroundWPoissonDisk(area=area, current_samples=samples, r=280.0)
+		samples = self.sampleBackgroundWPoissonDisk(area=area, current_samples=samples, r=background_radius, grid=grid)
 
 		return samples
 
@@ -1064,12 +1077,15 @@ class NewDataset(object):
 		The functions returns a list of (x,y) coordinates.
 		"""
 
-		# minority classes are sampled before majority classes
+		# the grid of the samples is shared by the blobs and the sub-areas
 		samples = []
+		grid = self.importanceSamplingGrid(samples)
+
+		# minority classes are sampled before majority classes
 		for class_name in classes_to_sample:
 			for blob in self.blobs:
 				if blob.class_name == class_name:
-					samples = self.sampleBlobWimportanceSampling(blob, samples)
+					samples = self.sampleBlobWimportanceSampling(blob, samples, grid)
 					txt = str(len(samples)) + "\r"
 					sys.stdout.write(txt)
 
@@ -1093,7 +1109,7 @@ class NewDataset(object):
 
 				sub_area = [top, left, tile_size, tile_size]
 
-				samples = self.sampleSubAreaWImportanceSampling(sub_area, samples)
+				samples = self.sampleSubAreaWImportanceSampling(sub_area, samples, grid)
 
 		return samples
 
@@ -1336,70 +1352,49 @@ class NewDataset(object):
 
 			jsondata = {'info': info, 'categories': categorieslist}
 
-		half_tile_size = self.tile_size / 2
+		# the maps are accessed through NumPy views of their pixels, so the tiles are cropped without copying
+		# the maps; a pool of threads crops, encodes and saves the tiles, the annotations are then collected
+		# in the order of the tiles, so the ids and the class codes do not depend on the scheduling
+		ortho_image = self.ortho_image.convertToFormat(QImage.Format_RGB32)
+		label_image = self.label_image.convertToFormat(QImage.Format_RGB32)
+		ortho_view = genutils.qimageToNumpyView(ortho_image)
+		label_view = genutils.qimageToNumpyView(label_image)
 
-		for i, sample in enumerate(tiles):
-
-			cx = sample[0]
-			cy = sample[1]
-			top = cy - half_tile_size
-			left = cx - half_tile_size
-
-			# RGB image
-			cropimg = genutils.cropQImage(self.ortho_image, [top, left, self.tile_size, self.tile_size])
-			filenameRGB = os.path.join(basenameim, tilename + str.format("_{0:04d}", (i)) + ".png")
-			cropimg.save(filenameRGB)
+		id_view = None
+		if self.data_format == "COCO" or self.data_format == "YOLO-v5":
+			id_image = self.id_image.convertToFormat(QImage.Format_RGB32)
+			id_view = genutils.qimageToNumpyView(id_image)
 
-			# image label
-			croplabel = genutils.cropQImage(self.label_image, [top, left, self.tile_size, self.tile_size])
-			filenameLabel = os.path.join(basenamelab, tilename + str.format("_{0:04d}", (i)) + ".png")
-			croplabel.save(filenameLabel)
+		if self.data_format != "COCO":
+			color_to_category_id = None
 
-			if self.data_format == "COCO" or self.data_format == "YOLO-v5":
+		def exportTile(i):
+			return self.exportTile(i, tiles[i], tilename, basenameim, basenamelab, ortho_view, label_view, id_view, color_to_category_id)
 
-				cropidlabel = genutils.cropQImage(self.id_image, [top, left, self.tile_size, self.tile_size])
-				cropidlabel = genutils.qimageToNumpyArray(cropidlabel)
+		with ThreadPoolExecutor() as executor:
 
-				# decode ids
-				regions_map = np.zeros((cropidlabel.shape[0], cropidlabel.shape[1]), dtype=np.int32)
-				regions_map = cropidlabel[:,:,0] + cropidlabel[:,:,1] * 256 + cropidlabel[:,:,2] * 65536
-				regions = measure.regionprops(regions_map)
+			for i, annotations in enumerate(executor.map(exportTile, range(len(tiles)))):
 
 				if self.data_format == "YOLO-v5":
 
 					filenameLabel = os.path.join(basenamelab, tilename + str.format("_{0:04d}", (i)) + ".txt")
 					fp = open(filenameLabel, "wt")
 
-					for region in regions:
-						blob = Blob(region,0,0,0)
-						n = blob.contour.shape[0]
-						row = region.centroid[0]
-						col = region.centroid[1]
-						rgb = croplabel.pixel(int(col), int(row))
-						color_key = Label.convertColorToKey(qRed(rgb), qGreen(rgb), qBlue(rgb))
-						if color_key != "000-000-000":
-							class_code = self.yolo_class_mapper.get(color_key)
-							if class_code is None:
-								self.yolo_class_mapper[color_key] = self.yolo_class_counter
-								class_code = self.yolo_class_counter
-								self.yolo_class_counter += 1
-
-							txt = "{:d} ".format(class_code)
-							for i in range(n):
-								x = blob.contour[i, 0] / self.tile_size
-								y = blob.contour[i, 1] / self.tile_size
-								value = "{:.6f} {:.6f}".format(x,y)
-								txt += value
-								txt += " "
-
-							txt = txt[:-1]
-							txt += "\n"
-							fp.write(txt)
+					for (color_key, points) in annotations:
+						class_code = self.yolo_class_mapper.get(color_key)
+						if class_code is None:
+							self.yolo_class_mapper[color_key] = self.yolo_class_counter
+							class_code = self.yolo_class_counter
+							self.yolo_class_counter += 1
+
+						fp.write("{:d} ".format(class_code) + points + "\n")
 
 					fp.close()
 
 				if self.data_format == "COCO":
 
+					filenameRGB = os.path.join(basenameim, tilename + str.format("_{0:04d}", (i)) + ".png")
+
 					image_dict = {"license": 2,
 							 "file_name": tilename + str.format("_{0:04d}", (i)) + ".png",
 							 "coco_url": filenameRGB,
@@ -1408,32 +1403,12 @@ class NewDataset(object):
 							 "date_captured": self.image_info.acquisition_date,
 							 "id": imagecount_id }
 
-					for region in regions:
-
-						tilemask = np.zeros_like(regions_map).astype(np.uint8)
-						tilemask[region.coords[:, 1], region.coords[:, 0]] = 1
-						#segmentation = genutils.binaryMaskToRle(tilemask)
-						segmentation = maskcoco.encode(np.asfortranarray(np.transpose(tilemask)))
-
-						segmentation["counts"] = segmentation["counts"].decode("utf-8")
-
-						category_id = -1
-						for jj in range(10):
-							N = int((jj * region.coords.shape[0]) / 10)
-							rgb = croplabel.pixel(region.coords[N, 1], region.coords[N, 0])
-							color_key = Label.convertColorToKey(qRed(rgb), qGreen(rgb), qBlue(rgb))
-							if color_key != "000-000-000":
-								category_id = color_to_category_id[color_key]
-
-						# COCO format for BBOX -> [x,y,width,height]
-						bbox = [region.bbox[1], region.bbox[0], region.bbox[3] - region.bbox[1], region.bbox[2] - region.bbox[0]]
+					for (category_id, segmentation, area, bbox) in annotations:
 
-						infos = {'segmentation': {}, 'area' : int(region.area), 'iscrowd' : 0,'image_id': imagecount_id, 'bbox': bbox, 'category_id': category_id, "id": segcount_id}
+						infos = {'segmentation': segmentation, 'area' : area, 'iscrowd' : 0,'image_id': imagecount_id, 'bbox': bbox, 'category_id': category_id, "id": segcount_id}
 
 						segcount_id = segcount_id + 1
 
-						infos["segmentation"] = segmentation
-
 						if category_id >= 0:
 							segmentationList.append(infos)
 
@@ -1451,6 +1426,109 @@ class NewDataset(object):
 				json.dump(jsondata, f)
 
 
+	def cropTile(self, view, top, left):
+		"""
+		Crop a tile from the view of a map, the part of the tile outside the map is black.
+		"""
+
+		size = int(self.tile_size)
+		h = view.shape[0]
+		w = view.shape[1]
+
+		if top >= 0 and left >= 0 and top + size <= h and left + size <= w:
+			return view[top:top+size, left:left+size]
+
+		tile = np.zeros((size, size, view.shape[2]), dtype=view.dtype)
+
+		y0 = max(top, 0)
+		y1 = min(top + size, h)
+		x0 = max(left, 0)
+		x1 = min(left + size, w)
+		if y1 > y0 and x1 > x0:
+			tile[y0-top:y1-top, x0-left:x1-left] = view[y0:y1, x0:x1]
+
+		return tile
+
+	def exportTile(self, i, sample, tilename, basenameim, basenamelab, ortho_view, label_view, id_view, color_to_category_id):
+		"""
+		Crop and save the i-th tile (the views are in BGRA order, see genutils.qimageToNumpyView).
+		It returns the annotations of the regions inside the tile, as a list of (color key, points) for
+		the YOLO format and of (category id, segmentation, area, bbox) for the COCO format.
+		"""
+
+		half_tile_size = self.tile_size / 2
+
+		cx = sample[0]
+		cy = sample[1]
+		top = int(cy - half_tile_size)
+		left = int(cx - half_tile_size)
+
+		# RGB image
+		cropimg = self.cropTile(ortho_view, top, left)
+		filenameRGB = os.path.join(basenameim, tilename + str.format("_{0:04d}", (i)) + ".png")
+		cv2.imwrite(filenameRGB, np.ascontiguousarray(cropimg[:, :, :3]))
+
+		# image label
+		croplabel = self.cropTile(label_view, top, left)
+		filenameLabel = os.path.join(basenamelab, tilename + str.format("_{0:04d}", (i)) + ".png")
+		cv2.imwrite(filenameLabel, np.ascontiguousarray(croplabel[:, :, :3]))
+
+		annotations = []
+
+		if id_view is None:
+			return annotations
+
+		# decode ids
+		cropidlabel = self.cropTile(id_view, top, left).astype(np.int32)
+		regions_map = cropidlabel[:,:,2] + cropidlabel[:,:,1] * 256 + cropidlabel[:,:,0] * 65536
+		regions = measure.regionprops(regions_map)
+
+		# label colors as 0xRRGGBB
+		colors = croplabel[:,:,2].astype(np.int32) * 65536 + croplabel[:,:,1].astype(np.int32) * 256 + croplabel[:,:,0]
+
+		if self.data_format == "YOLO-v5":
+
+			for region in regions:
+				row = region.centroid[0]
+				col = region.centroid[1]
+				rgb = int(colors[int(row), int(col)])
+				if rgb != 0:
+					color_key = Label.convertColorToKey(rgb >> 16, (rgb >> 8) & 255, rgb & 255)
+					blob = Blob(region,0,0,0)
+					points = blob.contour / self.tile_size
+					txt = " ".join(["{:.6f} {:.6f}".format(x, y) for (x, y) in points])
+					annotations.append((color_key, txt))
+
+		if self.data_format == "COCO":
+
+			# the masks are encoded in column-major order
+			fregions_map = np.asfortranarray(regions_map)
+			samples = np.arange(10)
+
+			for region in regions:
+
+				tilemask = np.asfortranarray(fregions_map == region.label, dtype=np.uint8)
+				segmentation = maskcoco.encode(tilemask)
+				segmentation["counts"] = segmentation["counts"].decode("utf-8")
+
+				# the class is the one of the last not black pixel among 10 pixels of the region
+				coords = region.coords[(samples * region.coords.shape[0]) // 10]
+				rgb = colors[coords[:, 0], coords[:, 1]]
+				rgb = rgb[rgb != 0]
+				category_id = -1
+				if rgb.shape[0] > 0:
+					rgb = int(rgb[-1])
+					color_key = Label.convertColorToKey(rgb >> 16, (rgb >> 8) & 255, rgb & 255)
+					category_id = color_to_category_id[color_key]
+
+				# COCO format for BBOX -> [x,y,width,height]
+				bbox = [region.bbox[1], region.bbox[0], region.bbox[3] - region.bbox[1], region.bbox[2] - region.bbox[0]]
+
+				annotations.append((category_id, segmentation, int(region.area), bbox))
+
+		return annotations
+
+
 	##### VISUALIZATION FUNCTIONS - FOR DEBUG PURPOSES
 
 	def save_samples(self, filename, show_tiles=False, show_areas=True, radii=None):
@@ -8,6 +8,9 @@ class Point(object):
     The visualization can change from settings widget.
     """
 
+    __slots__ = ("version", "id", "id_item", "class_name", "note", "data", "coordx", "coordy", "dirty",
+                 "cross1_gitem", "cross2_gitem", "ellipse_gitem")
+
     def __init__(self, coordx, coordy, classname, id):
 
         self.version = 0
@@ -19,6 +22,9 @@ class Point(object):
         self.coordx= coordx
         self.coordy= coordy
 
+        # attributes modified in place since the last save (see Annotation.isDirty)
+        self.dirty = False
+
         self.cross1_gitem = None
         self.cross2_gitem = None
         self.ellipse_gitem = None
@@ -2,6 +2,7 @@ import datetime
 import json
 import csv
 import os
+import threading
 
 import numpy as np
 import pandas as pd
@@ -10,6 +11,7 @@ from PyQt5.QtGui import QBrush, QColor
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
 
 from source import genutils
+from source import ProjectArchive
 from source.Annotation import Annotation
 from source.Blob import Blob
 from source.Channel import Channel
@@ -47,14 +49,36 @@ def replacePaths(old_path, new_path, images, taglab_dir):
                 image.georef_filename = taglab_dir.relativeFilePath(filename)
 
 
+def loadProjectData(filename):
+    """
+    Read the project data, the file can be a JSON project or a compressed project (see ProjectArchive).
+    """
+    if ProjectArchive.isArchive(filename):
+        try:
+            return ProjectArchive.readArchive(filename)
+        except (KeyError, ValueError) as e:
+            raise Exception(str(e))
+
+    with open(filename, "r") as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError as e:
+            raise Exception(str(e))
+
+
+def convertProject(input_filename, output_filename):
+    """
+    Convert a project between the JSON and the compressed format. The output format is chosen by the extension.
+    """
+    data = loadProjectData(input_filename)
+    project = Project(**data)
+    project.save(output_filename)
+
+
 def loadProject(taglab_working_dir, filename, default_dict):
     dir = QDir(taglab_working_dir)
     abspath = os.path.join(taglab_working_dir, dir.relativeFilePath(filename))
-    f = open(abspath, "r")
-    try:
-        data = json.load(f)
-    except json.JSONDecodeError as e:
-        raise Exception(str(e))
+    data = loadProjectData(abspath)
 
     if "Map File" in data:
         project = loadOldProject(taglab_working_dir, data)
@@ -63,8 +87,6 @@ def loadProject(taglab_working_dir, filename, default_dict):
     else:
         project = Project(**data)
 
-    f.close()
-
     if project.dictionary_name == "":
         project.dictionary_name = "My dictionary"
 
@@ -179,6 +201,21 @@ class ProjectEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+class ArchiveEncoder(ProjectEncoder):
+    """
+    Encoder of the compressed projects. The annotations and the correspondences are stored
+    in separate chunks, the contours of the regions are stored as arrays.
+    """
+    def default(self, obj):
+        if isinstance(obj, Blob):
+            return obj.toDict(contours=False)
+        elif isinstance(obj, Annotation):
+            return None
+        elif isinstance(obj, Correspondences):
+            return { "source": obj.source.id, "target": obj.target.id }
+        return ProjectEncoder.default(self, obj)
+
+
 class Project(QObject):
 
     # custom signals
@@ -243,6 +280,8 @@ class Project(QObject):
 
         self.markers = markers  # Store alignment markers with 'ref' & 'coreg' images
 
+        self.save_thread = None  # background save in progress (not saved)
+
     def importLabelsFromConfiguration(self, dictionary):
         """
         This function should be removed when the Labels Panel will be finished.
@@ -298,12 +337,23 @@ class Project(QObject):
         else:
             return list(class_names)
 
-    def save(self, filename=None):
+    def save(self, filename=None, incremental=False, background=False):
+        """
+        Save the project. The format is chosen by the extension of the file (JSON or compressed project).
+        For the compressed projects, an incremental save re-encodes only the annotations and the correspondences
+        modified since the previous save, and the file can be written in a background thread.
+        """
+
+        self.waitSave()
 
         # check inconsistencies. They can be caused by bugs during the regions update/editing
         if self.correspondences is not None:
             for key in self.correspondences.keys():
-                if self.correspondences[key].checkTable() is True:
+                table = self.correspondences[key]
+                if incremental and not (table.dirty or table.source.annotations.isDirty() or
+                                        table.target.annotations.isDirty()):
+                    continue
+                if table.checkTable() is True:
                     # there are inconsistencies, THIS MUST BE NOTIFIED
                     msgBox = QMessageBox()
                     msgBox.setWindowTitle("INCONSISTENT CORRESPONDENCES")
@@ -311,15 +361,64 @@ class Project(QObject):
                         "Inconsistent correspondences has been found !!\nPlease, Notify this problem to the TagLab developers.")
                     msgBox.exec()
 
-        data = self.__dict__
-        str = json.dumps(data, cls=ProjectEncoder, indent=1)
-
         if filename is None:
             filename = self.filename
+
+        if ProjectArchive.isArchiveFilename(filename):
+            self.saveArchive(filename, incremental, background)
+            return
+
+        data = self.__dict__.copy()
+        del data["save_thread"]
+        str = json.dumps(data, cls=ProjectEncoder, indent=1)
+
         f = open(filename, "w")
         f.write(str)
         f.close()
 
+    def saveArchive(self, filename, incremental=False, background=False):
+        """
+        Save the project in the compressed format (see ProjectArchive).
+        The encoded chunks are kept, so the next incremental save re-uses the ones not modified.
+        """
+        data = self.__dict__.copy()
+        del data["save_thread"]
+        data["archive_version"] = ProjectArchive.ARCHIVE_VERSION
+        manifest = json.dumps(data, cls=ArchiveEncoder)
+
+        chunks = []
+        for i, image in enumerate(self.images):
+            annotations = image.annotations
+            if annotations.chunk is None or not incremental or annotations.isDirty():
+                text = json.dumps(annotations.save(), cls=ArchiveEncoder)
+                arrays = ProjectArchive.packContours(annotations.seg_blobs)
+                annotations.chunk = ProjectArchive.encodeChunk(text, arrays)
+                annotations.setClean()
+            chunks.append((ProjectArchive.annotationsName(i), annotations.chunk))
+
+        correspondences = self.correspondences if self.correspondences is not None else {}
+        for i, table in enumerate(correspondences.values()):
+            if table.chunk is None or not incremental or table.dirty:
+                text = json.dumps(table.data.values.tolist())
+                table.chunk = ProjectArchive.encodeChunk(text)
+                table.dirty = False
+            chunks.append((ProjectArchive.correspondencesName(i), table.chunk))
+
+        # from here on the project is not accessed anymore
+        if background:
+            self.save_thread = threading.Thread(target=ProjectArchive.writeArchive, args=(filename, manifest, chunks))
+            self.save_thread.start()
+        else:
+            ProjectArchive.writeArchive(filename, manifest, chunks)
+
+    def waitSave(self):
+        """
+        Wait for the end of the background save (if any).
+        """
+        if self.save_thread is not None:
+            self.save_thread.join()
+            self.save_thread = None
+
     # def loadDictionary(self, filename):
     #     """
     #     It returns True if the dictionary is opened correctly, otherwise it returns False.
@@ -515,9 +614,10 @@ class Project(QObject):
     def updateGenets(self):
         """
         Update the genets information in the regions and in the correspondences' tables.
+        Only the genets involved by the changes of the correspondences since the last update are recomputed.
         """
 
-        self.genet.updateGenets()
+        self.genet.update()
 
     def assignClassByGenet(self, class_name, genet_id):
         """
@@ -525,28 +625,35 @@ class Project(QObject):
         """
 
         for key, table in self.correspondences.items():
-            rows = table.data[table.data['Genet'] == genet_id]
-            for index, row in rows.iterrows():
-                blob1_id = row['Blob1']
-                blob2_id = row['Blob2']
+            # the rows of the genet are the ones of its regions, looked up through the index of the store
+            row_keys = set()
+            for blob in table.source.annotations.blobByGenet(genet_id):
+                row_keys.update(table.store.sourceRows(blob.id))
+            for blob in table.target.annotations.blobByGenet(genet_id):
+                row_keys.update(table.store.targetRows(blob.id))
+
+            rows = [(row_key, table.store.get(row_key)) for row_key in sorted(row_keys)]
+            rows = [(row_key, row) for (row_key, row) in rows if row[0] == genet_id]
+            for row_key, row in rows:
+                blob1_id = row[1]
+                blob2_id = row[2]
                 blob1 = table.sourceBlobsById([blob1_id])
                 if len(blob1) > 0:
                     old_class_name = blob1[0].class_name
-                    blob1[0].class_name = class_name
+                    table.source.annotations.setBlobClass(blob1[0], class_name)
                     self.blobClassChanged.emit(table.source, old_class_name, blob1[0])
                     self.blobClassChangedByGenet.emit(table.source, old_class_name, blob1[0])
-                    table.source.annotations.table_needs_update = True
 
                 blob2 = table.targetBlobsById([blob2_id])
                 if len(blob2) > 0:
                     old_class_name = blob2[0].class_name
-                    blob2[0].class_name = class_name
+                    table.target.annotations.setBlobClass(blob2[0], class_name)
                     self.blobClassChanged.emit(table.target, old_class_name, blob2[0])
                     self.blobClassChangedByGenet.emit(table.target, old_class_name, blob2[0])
-                    table.target.annotations.table_needs_update = True
 
-            rows_index = rows.index
-            table.data.loc[rows_index, 'Class'] = class_name
+            for row_key, row in rows:
+                table.setValue(row_key, 'Class', class_name)
+            table.dirty = True
 
 
     def addBlob(self, img, blob, notify=True):
@@ -856,7 +963,7 @@ class Project(QObject):
             blob.correspondence_to_check = False
 
         corresp_table.set(blobs1, blobs2)
-        self.genet.updateGenets()
+        self.genet.update()
 
     def updatePixelSizeInCorrespondences(self, image, flag_surface_area):
 
@@ -903,6 +1010,7 @@ class Project(QObject):
 
         if len(lines) > 0:
             corr.data = pd.DataFrame(lines, columns=corr.data.columns)
+            corr.dirty = True
             corr.sort_data()
             corr.correspondence = []
             corr.dead = []
@@ -926,23 +1034,20 @@ class Project(QObject):
             'Coverage': np.zeros(len(self.labels),dtype=float)
         }
 
+        if image is None:
+            counts, coverage, point_counts = {}, {}, {}
+        else:
+            counts, coverage, point_counts = image.annotations.perclassStatistics(image.pixelSize())
+
         for i, key in enumerate(list(self.labels.keys())):
             label = self.labels[key]
             dict['Visibility'][i] = int(label.visible)
             dict['Color'].append(str(label.fill))
             dict['Class'].append(label.name)
 
-            if image is None:
-                count = 0
-                countP= 0
-                new_area = 0.0
-            else:
-                count, new_area = image.annotations.calculate_perclass_blobs_value(label, image.pixelSize())
-                countP = image.annotations.countPoints(label)
-
-            dict['#R'][i] = count
-            dict['#P'][i] = countP
-            dict['Coverage'][i] = new_area
+            dict['#R'][i] = counts.get(label.name, 0)
+            dict['#P'][i] = point_counts.get(label.name, 0)
+            dict['Coverage'][i] = coverage.get(label.name, 0.0)
 
 
 
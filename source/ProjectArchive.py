@@ -0,0 +1,178 @@
+# TagLab
+# A semi-automatic segmentation tool
+#
+# Copyright(C) 2020
+# Visual Computing Lab
+# ISTI - Italian National Research Council
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License (http://www.gnu.org/licenses/gpl.txt)
+# for more details.
+
+"""
+Compressed project container. The project is stored as a zip file with:
+
+   project.json              - the project, as in the JSON format, without annotations and correspondences
+   annotations/<i>.npz       - regions and points of the i-th image (chunk)
+   correspondences/<i>.npz   - the i-th table of correspondences (chunk)
+
+Each chunk is a compressed NumPy archive with the JSON data of the chunk plus, for the annotations,
+the contours of the regions as flat arrays. The contours are stored with the same precision of
+the JSON format (1/10 of pixel), so the two formats can be converted one into the other without losses.
+The chunks are encoded independently, so an incremental save re-encodes only the modified ones.
+"""
+
+import io
+import json
+import os
+import zipfile
+
+import numpy as np
+
+ARCHIVE_EXTENSION = ".tlz"
+ARCHIVE_VERSION = 1
+
+MANIFEST_NAME = "project.json"
+
+
+def isArchiveFilename(filename):
+    return os.path.splitext(filename)[1].lower() == ARCHIVE_EXTENSION
+
+
+def isArchive(filename):
+    return zipfile.is_zipfile(filename)
+
+
+def annotationsName(index):
+    return "annotations/" + str(index) + ".npz"
+
+
+def correspondencesName(index):
+    return "correspondences/" + str(index) + ".npz"
+
+
+def encodeChunk(text, arrays={}):
+    """
+    Encode a chunk given its JSON data (as a string) and an optional dictionary of arrays.
+    """
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, json=np.frombuffer(text.encode("utf-8"), dtype=np.uint8), **arrays)
+    return buffer.getvalue()
+
+
+def decodeChunk(chunk):
+    """
+    Decode a chunk, it returns the JSON data and the dictionary of the arrays.
+    """
+    with np.load(io.BytesIO(chunk)) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+
+    data = json.loads(arrays.pop("json").tobytes().decode("utf-8"))
+    return data, arrays
+
+
+def packContours(blobs):
+    """
+    Pack the contours of the given blobs into flat arrays:
+       vertices       - all the vertices (in tenths of pixel), outer contour first and then its inner contours
+       lengths        - number of vertices of each contour
+       inner_counts   - number of inner contours of each blob
+    """
+
+    contours = []
+    inner_counts = np.zeros(len(blobs), dtype=np.int32)
+    for i, blob in enumerate(blobs):
+        # same conversion of Blob.toPoints()
+        contours.append(blob.toFixedPoint(blob.contour))
+        contours.extend([blob.toFixedPoint(c) for c in blob.inner_contours])
+        inner_counts[i] = len(blob.inner_contours)
+
+    lengths = np.fromiter((len(c) for c in contours), dtype=np.int64, count=len(contours))
+
+    if len(contours) > 0:
+        vertices = np.concatenate(contours, axis=0).astype(np.int32)
+    else:
+        vertices = np.zeros((0, 2), dtype=np.int32)
+
+    return {"vertices": vertices, "lengths": lengths, "inner_counts": inner_counts}
+
+
+def unpackContours(arrays):
+    """
+    Inverse of packContours(). It returns a list of (contour, inner contours) one for each blob.
+    """
+
+    vertices = arrays["vertices"].astype(float) / 10.0
+    lengths = arrays["lengths"]
+    inner_counts = arrays["inner_counts"]
+
+    contours = np.split(vertices, np.cumsum(lengths)[:-1]) if len(lengths) > 0 else []
+
+    result = []
+    k = 0
+    for count in inner_counts:
+        result.append((contours[k], contours[k + 1:k + 1 + count]))
+        k += 1 + count
+
+    return result
+
+
+def writeArchive(filename, manifest, chunks):
+    """
+    Write the archive. manifest is the project encoded as a JSON string, chunks is a list of
+    (name, encoded chunk). It does not access the project, so it can run in a background thread.
+    """
+
+    # the file is written only when complete, so a failure does not corrupt the previous save
+    tmp_filename = filename + ".tmp"
+    with zipfile.ZipFile(tmp_filename, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(MANIFEST_NAME, manifest)
+        for (name, chunk) in chunks:
+            # the chunks are already compressed
+            archive.writestr(name, chunk, compress_type=zipfile.ZIP_STORED)
+
+    os.replace(tmp_filename, filename)
+
+
+def readArchive(filename):
+    """
+    Read the archive. It returns the project data, as the data loaded from a JSON project.
+    """
+
+    with zipfile.ZipFile(filename, "r") as archive:
+        data = json.loads(archive.read(MANIFEST_NAME).decode("utf-8"))
+
+        version = data.pop("archive_version", ARCHIVE_VERSION)
+        if version > ARCHIVE_VERSION:
+            raise Exception("The project has been saved by a newer version of TagLab.")
+
+        for i, image in enumerate(data.get("images", [])):
+
+            (annotations, arrays) = decodeChunk(archive.read(annotationsName(i)))
+            contours = unpackContours(arrays)
+
+            regions = annotations.get("regions", [])
+            if len(regions) != len(contours):
+                raise Exception("The contours of the image " + str(image.get("name")) + " are corrupted.")
+
+            for region, (contour, inner_contours) in zip(regions, contours):
+                region["contour"] = contour
+                region["inner contours"] = inner_contours
+
+            image["annotations"] = annotations
+
+        correspondences = data.get("correspondences")
+        if correspondences is not None:
+            for i, key in enumerate(correspondences.keys()):
+                (table, arrays) = decodeChunk(archive.read(correspondencesName(i)))
+                correspondences[key]["correspondences"] = table
+
+    return data
@@ -43,16 +43,16 @@ class QtBricksWidget(QWidget):
 
     closeBricksWidget = pyqtSignal()
 
-    def __init__(self, orthoimage, pixel_size, macroarea_blob, parent=None):
+    def __init__(self, orthoimage_cropped, pixel_size, macroarea_blob, parent=None):
         super(QtBricksWidget, self).__init__(parent)
 
         self.setStyleSheet("background-color: rgb(40,40,40); color: white")
 
         self.pixel_size = pixel_size  # in mm
 
+        # the image of the bounding box of the macroarea is given,
         # put the background outside the selected macroarea
-        self.orthoimage_cropped = cropQImage(orthoimage, macroarea_blob.bbox)
-        img = qimageToNumpyArray(self.orthoimage_cropped)
+        img = qimageToNumpyArray(orthoimage_cropped)
         mask = macroarea_blob.getMask()
         img[mask == 0] = [40, 40, 40]
         self.orthoimage_cropped = rgbToQImage(img)
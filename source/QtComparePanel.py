@@ -94,7 +94,7 @@ class TableModel(QAbstractTableModel):
 
         if index.isValid() and role == Qt.EditRole:
 
-            self._data.iloc[index.row(), index.column()] = value
+            self.correspondences.setValue(self._data.index[index.row()], index.column(), value)
         else:
             return False
 
@@ -128,7 +128,7 @@ class TableModel(QAbstractTableModel):
                 return head
 
             if orientation == Qt.Vertical:
-                return str(self._data.index[section])
+                return str(section)
 
     def flags(self, index):
 
@@ -473,7 +473,9 @@ height: 0px;
     def selectRows(self, rows):
         self.data_table.clearSelection()
 
-        indexes = [self.sortfilter.mapFromSource(self.model.index(r, 0)) for r in rows]
+        # from the keys of the rows to their positions in the table
+        positions = [r for r in self.model._data.index.get_indexer(rows) if r >= 0]
+        indexes = [self.sortfilter.mapFromSource(self.model.index(r, 0)) for r in positions]
         mode = QItemSelectionModel.Select | QItemSelectionModel.Rows
         for index in indexes:
             self.data_table.selectionModel().select(index, mode)
@@ -33,12 +33,13 @@ class QtCrackWidget(QWidget):
 
     closeCrackWidget = pyqtSignal()
 
-    def __init__(self, map, annotations, blob, x, y, parent=None):
+    def __init__(self, qimg_cropped, annotations, blob, x, y, parent=None):
         super(QtCrackWidget, self).__init__(parent)
 
         self.setStyleSheet("background-color: rgb(60,60,65); color: white")
 
-        self.qimg_cropped = genutils.cropQImage(map, blob.bbox)
+        # image of the bounding box of the blob
+        self.qimg_cropped = qimg_cropped
         arr = genutils.qimageToNumpyArray(self.qimg_cropped)
         self.input_arr = rgb2gray(arr) * 255
         self.tolerance = 20
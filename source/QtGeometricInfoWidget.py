@@ -22,7 +22,7 @@ import os
 from PyQt5.QtCore import Qt, pyqtSlot, pyqtSignal
 from PyQt5.QtGui import QImage, QPixmap, QIcon, qRgb, qRed, qGreen, qBlue
 from PyQt5.QtWidgets import QWidget, QTableWidget, QTableWidgetItem, QLabel, QPushButton, QHBoxLayout, QVBoxLayout,  QCheckBox, QRadioButton, QLayout, QFileDialog, QMessageBox
-from skimage import measure
+import numpy as np
 import math
 import csv
 
@@ -219,6 +219,14 @@ class QtGeometricInfoWidget(QWidget):
                       "label": "BBOX\nHEIGHT",
                       "calculable": True,
                       "round": 1},
+        "lengthRect": {"name": "Long side of minimum-area\nRectangle (mm)",
+                       "label": "RECT\nLENGTH",
+                       "calculable": True,
+                       "round": 1},
+        "widthRect": {"name": "Short side of minimum-area\nRectangle (mm)",
+                      "label": "RECT\nWIDTH",
+                      "calculable": True,
+                      "round": 1},
         "eccentricity": {"name": "Eccentricity of fitted ellipse\n(0=round, 1=elongated)",
                          "label": "ELLIPSE\nECCENTRICITY",
                          "calculable": True,
@@ -239,44 +247,59 @@ class QtGeometricInfoWidget(QWidget):
 
     # compute the measures
     def computeMeasures(self):
-        # get measurements for the selected blobs
-        self.geometricData = {}
-        for blob in self.parent.activeviewer.selected_blobs:
-            pxmm = self.parent.activeviewer.px_to_mm
-            pxmm2 = pxmm * pxmm
-            blobMeasure = measure.regionprops(blob.getMask())
-            self.geometricData[blob.id] = {}
-            # base properties
-            self.geometricData[blob.id]["class"] = blob.class_name
-            self.geometricData[blob.id]["centroidx"] = round(blob.centroid[0], self.properties["centroidx"]["round"])
-            self.geometricData[blob.id]["centroidy"] = round(self.parent.activeviewer.image.height - blob.centroid[1], self.properties["centroidy"]["round"]) # warning, image Y coordinate is inverted
-            self.geometricData[blob.id]["area"] = round(blob.area * pxmm2, self.properties["area"]["round"])            
-            self.geometricData[blob.id]["perimeter"] = round(blob.perimeter * pxmm, self.properties["perimeter"]["round"])
-            #self.geometricData[blob.id]["solidity"] = round(blobMeasure[0].solidity, self.properties["solidity"]["round"])  # see comment above about solidity and why is hidden
+        viewer = self.parent.activeviewer
+        blobs = viewer.selected_blobs
+        pxmm = viewer.px_to_mm
+        pxmm2 = pxmm * pxmm
+
+        # shape descriptors (in pixels), from the contours and cached until the regions change
+        descriptors = viewer.annotations.shape_descriptors.compute(blobs)
+
+        def column(values, scale=1.0):
+            return np.array(values, dtype=np.float64).reshape(-1) * scale
+
+        # measures of all the selected blobs, as columns
+        columns = {
+            "centroidx": column([blob.centroid[0] for blob in blobs]),
+            "centroidy": viewer.image.height - column([blob.centroid[1] for blob in blobs]), # warning, image Y coordinate is inverted
+            "area": column([blob.area for blob in blobs], pxmm2),
+            "perimeter": column([blob.perimeter for blob in blobs], pxmm),
             # convex hull
-            self.geometricData[blob.id]["areaConvex"] = round(blobMeasure[0].area_convex * pxmm2, self.properties["areaConvex"]["round"])
+            "areaConvex": column([d["area_convex"] for d in descriptors], pxmm2),
             # bbox fit
-            self.geometricData[blob.id]["areaBox"] = round(blobMeasure[0].area_bbox * pxmm2, self.properties["areaBox"]["round"])
-            self.geometricData[blob.id]["widthBox"] = round((blobMeasure[0].bbox[3] - blobMeasure[0].bbox[1]) * pxmm, self.properties["widthBox"]["round"]) #warning: bbox is in (min_row, min_col, max_row, max_col) format
-            self.geometricData[blob.id]["heightBox"] = round((blobMeasure[0].bbox[2] - blobMeasure[0].bbox[0]) * pxmm, self.properties["heightBox"]["round"]) #warning: bbox is in (min_row, min_col, max_row, max_col) format
-            #ellipse fit
-            self.geometricData[blob.id]["eccentricity"] = round(blobMeasure[0].eccentricity, self.properties["eccentricity"]["round"])
-            self.geometricData[blob.id]["orientation"] = round((blobMeasure[0].orientation * 180 / math.pi), self.properties["orientation"]["round"])
-            self.geometricData[blob.id]["major_axis_length"] = round(blobMeasure[0].major_axis_length * pxmm, self.properties["major_axis_length"]["round"])
-            self.geometricData[blob.id]["minor_axis_length"] = round(blobMeasure[0].minor_axis_length * pxmm, self.properties["minor_axis_length"]["round"])
+            "areaBox": column([d["area_bbox"] for d in descriptors], pxmm2),
+            "widthBox": column([d["width_bbox"] for d in descriptors], pxmm),
+            "heightBox": column([d["height_bbox"] for d in descriptors], pxmm),
             # rectangle fit
+            "lengthRect": column([d["length_rect"] for d in descriptors], pxmm),
+            "widthRect": column([d["width_rect"] for d in descriptors], pxmm),
+            # ellipse fit
+            "eccentricity": column([d["eccentricity"] for d in descriptors]),
+            "orientation": column([d["orientation"] for d in descriptors], 180 / math.pi),
+            "major_axis_length": column([d["major_axis_length"] for d in descriptors], pxmm),
+            "minor_axis_length": column([d["minor_axis_length"] for d in descriptors], pxmm)
+        }
+
+        for key in columns:
+            columns[key] = np.round(columns[key], self.properties[key]["round"])
+
+        self.geometricData = {}
+        for i, blob in enumerate(blobs):
+            self.geometricData[blob.id] = {"class": blob.class_name}
+            for key, values in columns.items():
+                self.geometricData[blob.id][key] = values[i].item()
 
         # compute the stats
         self.geometricStats = {}
         for key in self.properties:
-            if self.properties[key]["calculable"]:
-                values = [self.geometricData[blob.id][key] for blob in self.parent.activeviewer.selected_blobs]
+            if self.properties[key]["calculable"] and len(blobs) > 0:
+                values = columns[key]
                 self.geometricStats[key] = {
-                    "min": min(values),
-                    "max": max(values),
-                    "average": round(sum(values) / len(values), self.properties[key]["round"]),
-                    "std": round((sum((x - (sum(values) / len(values))) ** 2 for x in values) / len(values)) ** 0.5, self.properties[key]["round"]),
-                    "median": sorted(values)[len(values) // 2],
+                    "min": values.min().item(),
+                    "max": values.max().item(),
+                    "average": round(values.mean().item(), self.properties[key]["round"]),
+                    "std": round(values.std().item(), self.properties[key]["round"]),
+                    "median": np.sort(values)[len(values) // 2].item(),
                 }
             else:
                 self.geometricStats[key] = {
@@ -49,9 +49,6 @@ class QtHistogramWidget(QWidget):
         self.setMinimumHeight(600)
         self.blobs = []
 
-        # look for existing labels in annotations
-        labels_set = set()
-
         if working_area is None:
             # all the blobs are considered
             self.blobs = annotations.seg_blobs
@@ -59,8 +56,14 @@ class QtHistogramWidget(QWidget):
             # only the blobs inside the working area are considered
             self.blobs = annotations.calculate_inner_blobs(working_area)
 
-        for blob in self.blobs:
-            labels_set.add(blob.class_name)
+        # areas (in cm^2) and class codes of the blobs, as columns
+        table = annotations.blobs_table
+        self.class_codes = table.class_codes
+        self.blob_classes = table.gather(self.blobs, "class")
+        self.blob_areas = np.around(table.gather(self.blobs, "area") * self.scale_factor * self.scale_factor / 100, decimals=2)
+
+        # look for existing labels in annotations
+        labels_set = set(table.classNames(np.unique(self.blob_classes)))
 
         labels_set.discard('Empty')
         labels_layout = QGridLayout()
@@ -156,22 +159,16 @@ class QtHistogramWidget(QWidget):
 
         class_area = []
         for my_class in list_selected:
-            my_area = []
-            for blob in self.blobs:
-                if blob.class_name == my_class:
-                   blob_area = blob.area * self.scale_factor * self.scale_factor / 100
-                   blob_area = np.around(blob_area, decimals=2)
-                   my_area.append(blob_area)
-
-            class_area.append(my_area)
+            code = self.class_codes.get(my_class, -1)
+            class_area.append(self.blob_areas[self.blob_classes == code])
 
         max_area = np.zeros(len(list_selected))
         sum_area = np.zeros(len(list_selected))
 
         for i in range(0, len(list_selected)):
-            area_array = np.asarray(class_area[i])
-            max_area[i] = max(area_array)
-            sum_area[i] = sum(area_array)
+            area_array = class_area[i]
+            max_area[i] = area_array.max()
+            sum_area[i] = area_array.sum()
 
         # histogram plot
         total_coverage = sum(sum_area)
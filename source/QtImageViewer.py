@@ -3,6 +3,11 @@ from PyQt5.QtCore import Qt, QPointF, QRectF, QFileInfo, QDir, pyqtSlot, pyqtSig
 from PyQt5.QtGui import QImage, QPixmap, QPainter, QPainterPath, QPen, QImageReader, QMouseEvent
 from PyQt5.QtWidgets import QApplication, QGraphicsView, QGraphicsScene, QFileDialog, QGraphicsPixmapItem
 
+from source import genutils
+from source.Channel import Channel
+from source.ImagePyramid import ImagePyramid
+from source.QtTiledImageItem import QtTiledImageItem
+
 class QtImageViewer(QGraphicsView):
     """
     Basic PyQt image viewer with pan and zoom capabilities.
@@ -32,11 +37,21 @@ class QtImageViewer(QGraphicsView):
         self.pixmapitem.setZValue(0)
         self.scene.addItem(self.pixmapitem)
 
+        # large maps are displayed through a multi-resolution pyramid, drawing only the visible tiles
+        self.tileditem = QtTiledImageItem()
+        self.tileditem.setZValue(0)
+        self.scene.addItem(self.tileditem)
+        self.pyramid = None
+        self.PYRAMID_MIN_SIZE = 8192
+
         # OVERLAY
         self.scene_overlay = QGraphicsScene()
 
         self.img_map = None
 
+        # channel of the current image when it is not loaded in memory (the map is read on demand, see cropImage)
+        self.img_channel = None
+
         # current image size
         self.imgwidth = 0
         self.imgheight = 0
@@ -77,32 +92,51 @@ class QtImageViewer(QGraphicsView):
         self.setMouseTracking(True)
         self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
 
-    def setImg(self, img, zoomf=0.0):
+    def setImg(self, img, zoomf=0.0, pyramid_dir=None, source=None):
         """
-        Set the scene's current image (input image must be a QImage)
+        Set the scene's current image (input image must be a QImage or a Channel)
         For calculating the zoom factor automatically set it to 0.0.
+        Images larger than PYRAMID_MIN_SIZE are displayed using a tile pyramid, cached in pyramid_dir if given
+        (source is the file of the image, used to check if the cache is still valid).
+        If a Channel is given, the image is not loaded: it is displayed through the pyramid and read on demand.
         """
 
-        self.img_map = img
         if type(img) is QImage:
-            imageARGB32 = img.convertToFormat(QImage.Format_ARGB32)
-            self.pixmap = QPixmap.fromImage(imageARGB32)
-            self.thumb = None
+            self.img_map = img
+            self.img_channel = None
             self.imgwidth = img.width()
             self.imgheight = img.height()
-            if self.imgheight:
-                self.ZOOM_FACTOR_MIN = min(1.0 * self.width() / self.imgwidth, 1.0 * self.height() / self.imgheight)
+        elif isinstance(img, Channel):
+            self.img_map = None
+            self.img_channel = img
+            (self.imgwidth, self.imgheight) = img.size()
         else:
-            raise RuntimeError("Argument must be a QImage.")
+            raise RuntimeError("Argument must be a QImage or a Channel.")
+
+        self.thumb = None
+        if self.imgheight:
+            self.ZOOM_FACTOR_MIN = min(1.0 * self.width() / self.imgwidth, 1.0 * self.height() / self.imgheight)
 
-        self.pixmapitem.setPixmap(self.pixmap)
+        if self.img_channel is not None or max(self.imgwidth, self.imgheight) >= self.PYRAMID_MIN_SIZE:
+            self.pyramid = ImagePyramid(img, cache_dir=pyramid_dir, source=source)
+            self.pyramid.build()
+            # the full resolution pixmap is not created, the overview is enough for the thumbnail
+            self.pixmap = QPixmap.fromImage(self.pyramid.overview)
+            self.pixmapitem.setPixmap(QPixmap())
+            self.tileditem.setPyramid(self.pyramid)
+        else:
+            imageARGB32 = img.convertToFormat(QImage.Format_ARGB32)
+            self.pixmap = QPixmap.fromImage(imageARGB32)
+            self.pyramid = None
+            self.tileditem.setPyramid(None)
+            self.pixmapitem.setPixmap(self.pixmap)
 
         if zoomf < 0.0000001:
 
             # calculate zoom factor
 
             # Set scene size to image size (!)
-            self.setSceneRect(QRectF(self.pixmap.rect()))
+            self.setSceneRect(QRectF(0, 0, self.imgwidth, self.imgheight))
 
             # calculate zoom factor
             pixels_of_border = 10
@@ -146,7 +180,32 @@ class QtImageViewer(QGraphicsView):
 
     def clear(self):
         self.pixmapitem.setPixmap(QPixmap())
+        self.tileditem.setPyramid(None)
+        self.pyramid = None
         self.img_map = None
+        self.img_channel = None
+
+    def hasImage(self):
+        return self.img_map is not None or self.img_channel is not None
+
+    def imageSource(self):
+        """
+        The current image: the QImage or, if it is not loaded in memory, the Channel to read it from.
+        """
+        if self.img_map is not None:
+            return self.img_map
+
+        return self.img_channel
+
+    def cropImage(self, bbox):
+        """
+        Region [top, left, width, height] of the current image as a QImage.
+        If the image is not loaded in memory, only the region is read from the file.
+        """
+        if self.img_map is None and self.img_channel is not None:
+            return self.img_channel.readRegionAsQImage(bbox)
+
+        return genutils.cropQImage(self.img_map, bbox)
 
     def disableScrollBars(self):
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
@@ -178,9 +237,9 @@ class QtImageViewer(QGraphicsView):
 
     def clampCoords(self, x, y):
 
-        if self.img_map is not None:
-            xc = max(0, min(int(x), self.img_map.width()))
-            yc = max(0, min(int(y), self.img_map.height()))
+        if self.hasImage():
+            xc = max(0, min(int(x), self.imgwidth))
+            yc = max(0, min(int(y), self.imgheight))
         else:
             xc = 0
             yc = 0
@@ -196,7 +255,7 @@ class QtImageViewer(QGraphicsView):
 
     def drawOverlayImage(self):
 
-        if self.overlay_image.width() <= 1:
+        if self.overlay_image.width() <= 1 or self.pyramid is not None:
             return
 
         pxmap = self.pixmap.copy()
@@ -231,19 +290,19 @@ class QtImageViewer(QGraphicsView):
 
     @pyqtSlot(float, float)
     def center(self, x, y):
-        if self.img_map is None:
+        if not self.hasImage():
             return
         zf = self.zoom_factor
 
-        # NOTE: self.img_map is None if image is not loaded
-        # this will cause an exception when calling center() method as the object has no width/height
-        if self.img_map is None:
+        # NOTE: there is no image if it is not loaded
+        # this will cause an exception when calling center() method as the image has no width/height
+        if not self.hasImage():
             # We do not have access to the logging object.
             print("Warning: Image not loaded. Cannot center image.")
             return
         
-        xmap = float(self.img_map.width()) * x
-        ymap = float(self.img_map.height()) * y
+        xmap = float(self.imgwidth) * x
+        ymap = float(self.imgheight) * y
 
         view = self.viewportToScene()
         (w, h) = (view.width(), view.height())
@@ -251,8 +310,8 @@ class QtImageViewer(QGraphicsView):
         posx = max(0, xmap - w / 2)
         posy = max(0, ymap - h / 2)
 
-        posx = min(posx, self.img_map.width() - w / 2)
-        posy = min(posy, self.img_map.height() - h / 2)
+        posx = min(posx, self.imgwidth - w / 2)
+        posy = min(posy, self.imgheight - h / 2)
 
         self.horizontalScrollBar().setValue(int(posx * zf))
         self.verticalScrollBar().setValue(int(posy * zf))
@@ -22,9 +22,10 @@
 """
 
 import os.path
-from PyQt5.QtCore import Qt, QPoint, QPointF, QRectF, QLineF, QFileInfo, QDir, pyqtSlot, pyqtSignal, QT_VERSION_STR
-from PyQt5.QtGui import QPen, QColor, QFont, QBrush
+from PyQt5.QtCore import Qt, QPoint, QPointF, QRectF, QLineF, QFileInfo, QDir, QTimer, pyqtSlot, pyqtSignal, QT_VERSION_STR
+from PyQt5.QtGui import QPen, QColor, QFont, QBrush, QPainterPath
 from PyQt5.QtWidgets import QApplication, QGraphicsView, QGraphicsScene, QFileDialog, QGraphicsItem, QGraphicsSimpleTextItem, QPlainTextEdit,QSizePolicy
+from PyQt5.QtWidgets import QGraphicsPathItem, QStyleOptionGraphicsItem
 
 from source.Undo import Undo
 from source.Project import Project
@@ -39,6 +40,7 @@ import source.Mask as Mask
 from source.QtImageViewer import QtImageViewer
 
 from source.genutils import distance_point_AABB
+from source import genutils
 
 import math
 import time
@@ -72,6 +74,70 @@ class TextItem(QGraphicsSimpleTextItem):
         return QRectF(b.x()-b.width()/2.0, b.y()-b.height()/2.0, b.width(), b.height())
 
 
+class BlobItem(QGraphicsPathItem):
+    """
+    Graphics item of a region, drawn with a level of detail depending on the zoom. When zoomed out the outline
+    of the region is simplified, and the region is drawn as its bounding box if it covers a few pixels on the screen.
+    The id of the region is created the first time the region is drawn large enough to read it.
+    """
+
+    # size on the screen (in pixels) under which the region is drawn as its bounding box
+    MIN_SIZE = 4.0
+
+    # size on the screen (in pixels) from which the id of the region is shown
+    ID_SIZE = 24.0
+
+    def __init__(self, blob, viewer):
+        super(BlobItem, self).__init__(blob.qpath)
+
+        self.blob = blob
+        self.viewer = viewer
+        self.simplified_paths = {}
+
+    def setPath(self, path):
+        self.simplified_paths = {}
+        super(BlobItem, self).setPath(path)
+
+    def simplifiedPath(self, level):
+        """
+        Path simplified with a tolerance of 2^level / 2 pixels. The paths are cached for each level.
+        """
+
+        path = self.simplified_paths.get(level)
+        if path is None:
+            tolerance = (1 << level) * 0.5
+            path = QPainterPath()
+            for qpolygon in self.path().toSubpathPolygons():
+                points = measure.approximate_polygon(genutils.qpolygonFToNumpy(qpolygon), tolerance)
+                if points.shape[0] > 2:
+                    path.addPolygon(genutils.numpyToQPolygonF(points))
+                    path.closeSubpath()
+            self.simplified_paths[level] = path
+
+        return path
+
+    def paint(self, painter, option, widget=None):
+
+        lod = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        rect = self.path().boundingRect()
+        size = max(rect.width(), rect.height()) * lod
+
+        if size >= BlobItem.ID_SIZE and self.blob.id_item is None:
+            self.viewer.requestIdItem(self.blob)
+
+        if lod >= 1.0:
+            super(BlobItem, self).paint(painter, option, widget)
+            return
+
+        painter.setPen(self.pen())
+        painter.setBrush(self.brush())
+        if size < BlobItem.MIN_SIZE:
+            painter.drawRect(rect)
+        else:
+            level = int(math.floor(math.log2(1.0 / lod)))
+            painter.drawPath(self.simplifiedPath(level))
+
+
 class NoteWidget(QPlainTextEdit):
 
     editFinishing = pyqtSignal()
@@ -158,7 +224,10 @@ class QtImageViewerPlus(QtImageViewer):
         # DRAWING SETTINGS
         self.fill_enabled = True
         self.border_enabled = True
-        self.ids_enable = True
+        self.ids_enabled = True
+
+        # regions whose id item has to be created (see BlobItem)
+        self.pending_id_blobs = []
 
         self.show_grid = False
 
@@ -218,6 +287,18 @@ class QtImageViewerPlus(QtImageViewer):
         # sampling areas
         self.sampling_rect_items = []
 
+        # the graphics items are created only for the annotations inside the viewport (enlarged by CULLING_MARGIN
+        # on each side), and removed when the annotations leave it (see updateLiveItems)
+        self.CULLING_MARGIN = 0.5
+        self.live_blobs = {}
+        self.live_annpoints = {}
+        self.show_regions = True
+        self.show_points = True
+        self.culling_timer = QTimer(self)
+        self.culling_timer.setSingleShot(True)
+        self.culling_timer.setInterval(30)
+        self.culling_timer.timeout.connect(self.updateLiveItems)
+
         # tools - additional initialization
         self.tools.tools["SELECTAREA"].setWorkingAreaStyle(self.working_area_pen)
 
@@ -231,6 +312,7 @@ class QtImageViewerPlus(QtImageViewer):
         """
 
         self.undrawAllLayers()
+        self.undrawLiveItems()
         self.image = image
         self.annotations = image.annotations
         self.selected_blobs = []
@@ -238,10 +320,10 @@ class QtImageViewerPlus(QtImageViewer):
         self.selectionChanged.emit()
         #clear existing layers
 
-        # draw all the annotations
+        # draw the annotations (only the visible ones have graphics items)
+        self.updateVisibility()
         self.drawAllBlobs()
         self.drawAllPoints()
-        self.updateVisibility()
 
         # draw the layers
         self.drawAllLayers()
@@ -265,17 +347,18 @@ class QtImageViewerPlus(QtImageViewer):
     def toggleAnnotations(self, type, enable):
 
         if type == "regions":
-            for blob in self.annotations.seg_blobs:
-                if enable:
-                    self.drawBlob(blob)
-                else:
-                    self.undrawBlob(blob)
+            self.show_regions = enable
+            if not enable:
+                for blob in list(self.live_blobs.values()):
+                    self.undrawBlob(blob, redraw=False)
         else:
-            for point in self.annotations.annpoints:
-                if enable:
-                    self.drawPointAnn(point)
-                else:
-                    self.undrawAnnPoint(point)
+            self.show_points = enable
+            if not enable:
+                for point in list(self.live_annpoints.values()):
+                    self.undrawAnnPoint(point, redraw=False)
+
+        self.updateLiveItems()
+        self.scene.invalidate()
 
     def updateImageProperties(self):
         """
@@ -288,6 +371,7 @@ class QtImageViewerPlus(QtImageViewer):
     def setChannel(self, channel, switch=False):
         """
         Set the image channel to visualize. If the channel has not been previously loaded it is loaded and cached.
+        Large RGB maps are not loaded: they are displayed through the tile pyramid and read on demand.
         """
 
         if self.image is None:
@@ -297,12 +381,14 @@ class QtImageViewerPlus(QtImageViewer):
 
         if channel.qimage is not None:
             img = channel.qimage
+        elif self.isReadOnDemand(channel):
+            img = channel
         else:
             QApplication.setOverrideCursor(Qt.WaitCursor)
             img = channel.loadData(self.taglab_dir)
             QApplication.restoreOverrideCursor()
 
-        if img.isNull():
+        if img is not channel and img.isNull():
             (filename, filter) = QFileDialog.getOpenFileName(self, "Couldn't find the map, please select it:",
                                                                        QFileInfo(channel.filename).dir().path(),
                                                                        "Image Files (*.png *.jpg *.jpeg)")
@@ -321,12 +407,44 @@ class QtImageViewerPlus(QtImageViewer):
         else:
             self.setChannelImg(img)
 
+    def isReadOnDemand(self, channel):
+        """
+        True if the channel is a large RGB map, displayed without loading it in memory.
+        The DEM are always loaded, their visualization is normalized over the whole map.
+        """
+        if channel.type != "RGB":
+            return False
+
+        try:
+            (w, h) = channel.size()
+        except Exception:
+            return False
+
+        return max(w, h) >= self.PYRAMID_MIN_SIZE
+
     def setChannelImg(self, channel_img, zoomf=0.0):
         """
-        Set the scene's current image (input image must be a QImage)
+        Set the scene's current image (input image must be a QImage or a Channel, see QtImageViewer.setImg)
         For calculating the zoom factor automatically set it to 0.0.
         """
-        self.setImg(channel_img, zoomf)
+        source = None
+        if self.channel is not None and self.channel.filename is not None:
+            source = os.path.join(self.taglab_dir, self.channel.filename)
+
+        self.setImg(channel_img, zoomf, self.pyramidFolder(), source)
+
+    def pyramidFolder(self):
+        """
+        Folder where the overview levels of the current channel are cached, next to the project file.
+        """
+        if self.project is None or self.project.filename is None:
+            return None
+        if self.image is None or self.channel is None or self.channel.filename is None:
+            return None
+
+        folder = os.path.splitext(self.project.filename)[0] + "_pyramids"
+        name = os.path.splitext(os.path.basename(self.channel.filename))[0]
+        return os.path.join(folder, str(self.image.id) + "_" + name)
 
     def clear(self):
 
@@ -337,14 +455,8 @@ class QtImageViewerPlus(QtImageViewer):
         self.undo_data = Undo()
         self.undrawAllLayers()
 
-        # undraw all blobs
-        for blob in self.annotations.seg_blobs:
-            self.undrawBlob(blob)
-            del blob
-
-        for annpoint in self.annotations.annpoints:
-            self.undrawAnnPoint(annpoint)
-            del annpoint
+        # undraw all blobs and points
+        self.undrawLiveItems()
 
         # clear working area
         self.undrawWorkingArea()
@@ -467,7 +579,7 @@ class QtImageViewerPlus(QtImageViewer):
 
     def enableFill(self):
 
-        for blob in self.annotations.seg_blobs:
+        for blob in self.live_blobs.values():
             brush = self.project.classBrushFromName(blob)
             if blob.qpath_gitem is not None:
                 blob.qpath_gitem.setBrush(brush)
@@ -476,7 +588,7 @@ class QtImageViewerPlus(QtImageViewer):
 
     def disableFill(self):
 
-        for blob in self.annotations.seg_blobs:
+        for blob in self.live_blobs.values():
             if blob.qpath_gitem is not None:
                 blob.qpath_gitem.setBrush(QBrush(Qt.NoBrush))
 
@@ -492,7 +604,7 @@ class QtImageViewerPlus(QtImageViewer):
 
     def enableBorders(self):
 
-        for blob in self.annotations.seg_blobs:
+        for blob in self.live_blobs.values():
             pen = self.border_selected_pen if blob in self.selected_blobs else self.border_pen
             if blob.qpath_gitem is not None:
                 blob.qpath_gitem.setPen(pen)
@@ -501,7 +613,7 @@ class QtImageViewerPlus(QtImageViewer):
 
     def disableBorders(self):
 
-        for blob in self.annotations.seg_blobs:
+        for blob in self.live_blobs.values():
             if blob.qpath_gitem is not None:
                 blob.qpath_gitem.setPen(QPen(Qt.NoPen))
 
@@ -517,15 +629,15 @@ class QtImageViewerPlus(QtImageViewer):
 
     def enableIds(self):
 
-        for blob in self.annotations.seg_blobs:
+        for blob in self.live_blobs.values():
             if blob.id_item is not None:
-                blob.id_item.setVisible(True)
+                blob.id_item.setVisible(self.annotations.isVisible(blob))
 
         self.ids_enabled = True
 
     def disableIds(self):
 
-        for blob in self.annotations.seg_blobs:
+        for blob in self.live_blobs.values():
             if blob.id_item is not None:
                 blob.id_item.setVisible(False)
 
@@ -562,8 +674,7 @@ class QtImageViewerPlus(QtImageViewer):
 
     def drawAllPointsAnn(self):
 
-        for annpoint in self.annotations.annpoints:
-            self.drawPointAnn(annpoint)
+        self.drawAllPoints()
 
     def drawSamplingAreas(self):
 
@@ -591,7 +702,7 @@ class QtImageViewerPlus(QtImageViewer):
 
     def drawselectedAnnPoints(self):
 
-        for annpoint in self.annotations.annpoints:
+        for annpoint in self.live_annpoints.values():
             pen = self.annpoints_pen_selected if annpoint in self.selected_annpoints else self.annpoints_pen
             if annpoint.cross1_gitem is not None:
 
@@ -618,6 +729,9 @@ class QtImageViewerPlus(QtImageViewer):
             del annpoint.ellipse_gitem
             annpoint.ellipse_gitem = None
 
+        if annpoint in self.annotations.points_index:
+            self.live_annpoints[id(annpoint)] = annpoint
+
         #choose a pen
         pen = self.annpoints_pen_selected if annpoint in self.selected_annpoints else self.annpoints_pen
         brush = self.project.classBrushFromName(annpoint)
@@ -649,6 +763,9 @@ class QtImageViewerPlus(QtImageViewer):
 
         self.scene.addItem(annpoint.id_item)
 
+        if not self.annotations.isVisible(annpoint):
+            self.updateItemVisibility(annpoint, False)
+
 
     def drawShape(self, shape, layer_type):
 
@@ -709,37 +826,86 @@ class QtImageViewerPlus(QtImageViewer):
         # if it has just been created remove the current graphics item in order to set it again
         if blob.qpath_gitem is not None:
             self.scene.removeItem(blob.qpath_gitem)
-            self.scene.removeItem(blob.id_item)
             del blob.qpath_gitem
-            del blob.id_item
             blob.qpath_gitem = None
+
+        if blob.id_item is not None:
+            self.scene.removeItem(blob.id_item)
+            del blob.id_item
             blob.id_item = None
 
+        if blob in self.annotations.blobs_index:
+            self.live_blobs[id(blob)] = blob
+
         blob.setupForDrawing()
-        pen = self.border_selected_pen if blob in self.selected_blobs else self.border_pen
+        if blob in self.selected_blobs:
+            pen = self.border_selected_pen
+        elif self.border_enabled:
+            pen = self.border_pen
+        else:
+            pen = QPen(Qt.NoPen)
 
-        brush = self.project.classBrushFromName(blob)
-        blob.qpath_gitem = self.scene.addPath(blob.qpath, pen, brush)
+        if self.fill_enabled:
+            brush = self.project.classBrushFromName(blob)
+        else:
+            brush = QBrush(Qt.NoBrush)
+
+        blob.qpath_gitem = BlobItem(blob, self)
+        blob.qpath_gitem.setPen(pen)
+        blob.qpath_gitem.setBrush(brush)
         blob.qpath_gitem.setZValue(1)
         blob.qpath_gitem.setOpacity(self.transparency_value)
+        blob.qpath_gitem.setVisible(self.annotations.isVisible(blob))
+        self.scene.addItem(blob.qpath_gitem)
+
+        # the id item is created when the region is drawn large enough (see BlobItem)
+
+    def requestIdItem(self, blob):
+        """
+        Schedule the creation of the id item of the given region, the scene cannot be modified while it is painted.
+        """
+
+        if len(self.pending_id_blobs) == 0:
+            QTimer.singleShot(0, self.createPendingIdItems)
+
+        self.pending_id_blobs.append(blob)
+
+    def createPendingIdItems(self):
+
+        blobs = self.pending_id_blobs
+        self.pending_id_blobs = []
+
+        for blob in blobs:
+            # the region could have been removed in the meantime
+            if blob.id_item is None and blob.qpath_gitem is not None and blob.qpath_gitem.scene() is not None:
+                self.createIdItem(blob)
+
+    def createIdItem(self, blob):
 
         font_size = min(12, round(8.0 / self.image.pixelSize()))
         blob.id_item = TextItem(str(blob.id),  QFont("Roboto", font_size, QFont.Bold))
         blob.id_item.setPos(blob.centroid[0], blob.centroid[1])
         blob.id_item.setTransformOriginPoint(QPointF(blob.centroid[0] + 14.0, blob.centroid[1] + 14.0))
-        blob.id_item.setZValue(2)
         blob.id_item.setBrush(Qt.white)
 
         if blob in self.selected_blobs:
+            blob.id_item.setZValue(4)
             blob.id_item.setOpacity(1.0)
         else:
+            blob.id_item.setZValue(2)
             blob.id_item.setOpacity(0.7)
+
+        blob.id_item.setVisible(self.ids_enabled and blob.qpath_gitem.isVisible())
         self.scene.addItem(blob.id_item)
 
     def undrawBlob(self, blob, redraw=True):
 
-        self.scene.removeItem(blob.qpath_gitem)
-        self.scene.removeItem(blob.id_item)
+        self.live_blobs.pop(id(blob), None)
+
+        if blob.qpath_gitem is not None:
+            self.scene.removeItem(blob.qpath_gitem)
+        if blob.id_item is not None:
+            self.scene.removeItem(blob.id_item)
         blob.qpath = None
         blob.qpath_gitem = None
         blob.id_item = None
@@ -749,10 +915,13 @@ class QtImageViewerPlus(QtImageViewer):
 
     def undrawAnnPoint(self, annpoint, redraw=True):
 
-        self.scene.removeItem(annpoint.cross1_gitem)
-        self.scene.removeItem(annpoint.cross2_gitem)
-        self.scene.removeItem(annpoint.ellipse_gitem)
-        self.scene.removeItem(annpoint.id_item)
+        self.live_annpoints.pop(id(annpoint), None)
+
+        if annpoint.cross1_gitem is not None:
+            self.scene.removeItem(annpoint.cross1_gitem)
+            self.scene.removeItem(annpoint.cross2_gitem)
+            self.scene.removeItem(annpoint.ellipse_gitem)
+            self.scene.removeItem(annpoint.id_item)
         annpoint.cross1_gitem = None
         annpoint.cross2_gitem = None
         annpoint.ellipse_gitem = None
@@ -765,11 +934,11 @@ class QtImageViewerPlus(QtImageViewer):
 
         self.transparency_value = 1.0 - (value / 100.0)
         # current annotations
-        for blob in self.annotations.seg_blobs:
+        for blob in self.live_blobs.values():
             if blob.qpath_gitem is not None:
                 blob.qpath_gitem.setOpacity(self.transparency_value)
 
-        for annpoint in self.annotations.annpoints:
+        for annpoint in self.live_annpoints.values():
             if annpoint.cross1_gitem is not None:
                annpoint.cross1_gitem.setOpacity(self.transparency_value)
                annpoint.cross2_gitem.setOpacity(self.transparency_value)
@@ -777,14 +946,96 @@ class QtImageViewerPlus(QtImageViewer):
 
 
     def drawAllBlobs(self):
+        """
+        Re-create the graphics items of the regions in view.
+        """
 
-        for blob in self.annotations.seg_blobs:
-            self.drawBlob(blob)
+        for blob in list(self.live_blobs.values()):
+            self.undrawBlob(blob, redraw=False)
+
+        self.updateLiveItems()
 
     def drawAllPoints(self):
+        """
+        Re-create the graphics items of the points in view.
+        """
+
+        for point in list(self.live_annpoints.values()):
+            self.undrawAnnPoint(point, redraw=False)
+
+        self.updateLiveItems()
+
+    def undrawLiveItems(self):
+
+        for blob in list(self.live_blobs.values()):
+            self.undrawBlob(blob, redraw=False)
+
+        for point in list(self.live_annpoints.values()):
+            self.undrawAnnPoint(point, redraw=False)
+
+    def scheduleLiveItemsUpdate(self):
+        """
+        Update the graphics items after the view has been moved or zoomed. The updates are throttled
+        by a timer, so a continuous panning updates the items a few times per second.
+        """
+
+        if not self.culling_timer.isActive():
+            self.culling_timer.start()
+
+    def updateLiveItems(self):
+        """
+        Create the graphics items of the annotations entering the viewport and remove the ones of the annotations
+        leaving it. The annotations are retrieved through the spatial index, the selected ones always keep their items.
+        """
 
-        for point in self.annotations.annpoints:
-            self.drawPointAnn(point)
+        if self.image is None:
+            return
+
+        view = self.viewportToScene()
+        margin = max(view.width(), view.height()) * self.CULLING_MARGIN
+        box = [view.top() - margin, view.left() - margin, view.width() + 2.0 * margin, view.height() + 2.0 * margin]
+
+        blobs = self.annotations.blobs_index.query(box) if self.show_regions else []
+        in_view = set([id(blob) for blob in blobs])
+        in_view.update([id(blob) for blob in self.selected_blobs])
+
+        for key, blob in list(self.live_blobs.items()):
+            if key not in in_view:
+                self.undrawBlob(blob, redraw=False)
+
+        for blob in blobs:
+            if id(blob) not in self.live_blobs:
+                self.drawBlob(blob)
+
+        for blob in self.selected_blobs:
+            if blob.qpath_gitem is None:
+                self.drawBlob(blob)
+
+        points = self.annotations.points_index.query(box) if self.show_points else []
+        in_view = set([id(point) for point in points])
+        in_view.update([id(point) for point in self.selected_annpoints])
+
+        for key, point in list(self.live_annpoints.items()):
+            if key not in in_view:
+                self.undrawAnnPoint(point, redraw=False)
+
+        for point in points:
+            if id(point) not in self.live_annpoints:
+                self.drawPointAnn(point)
+
+        for point in self.selected_annpoints:
+            if point.cross1_gitem is None:
+                self.drawPointAnn(point)
+
+    def updateViewer(self):
+
+        QtImageViewer.updateViewer(self)
+        self.scheduleLiveItemsUpdate()
+
+    def scrollContentsBy(self, dx, dy):
+
+        QtImageViewer.scrollContentsBy(self, dx, dy)
+        self.scheduleLiveItemsUpdate()
 
     #used for crossair cursor
     def drawForeground(self, painter, rect):
@@ -1158,6 +1409,7 @@ class QtImageViewerPlus(QtImageViewer):
             self.centerOn(scene_pos - delta)
 
             self.updateScaleBar(self.zoom_factor)
+            self.scheduleLiveItemsUpdate()
 
             self.scene_overlay.invalidate()
             self.invalidateScene()
@@ -1260,8 +1512,11 @@ class QtImageViewerPlus(QtImageViewer):
             b = int(color_components[2])
             self.border_pen.setColor(QColor(r, g, b))
 
-            for blob in self.annotations.seg_blobs:
-                blob.qpath_gitem.setPen(self.border_pen)
+            for blob in self.live_blobs.values():
+                if blob in self.selected_blobs:
+                    continue
+                if blob.qpath_gitem is not None and self.border_enabled:
+                    blob.qpath_gitem.setPen(self.border_pen)
 
     @pyqtSlot(str, int)
     def setSelectionPen(self, color, thickness):
@@ -1296,13 +1551,21 @@ class QtImageViewerPlus(QtImageViewer):
                 self.working_area_rect.setPen(self.working_area_pen)
 
     def setBlobVisible(self, blob, visibility):
+        """
+        Set the visibility flag of a region (or of a point), it is shown only if also its class is visible.
+        """
+
+        self.annotations.setVisible(blob, visibility)
+        self.updateItemVisibility(blob, self.annotations.isVisible(blob))
+
+    def updateItemVisibility(self, blob, visibility):
 
         if type(blob) == Blob:
 
             if blob.qpath_gitem is not None:
                 blob.qpath_gitem.setVisible(visibility)
             if blob.id_item is not None:
-                blob.id_item.setVisible(visibility)
+                blob.id_item.setVisible(visibility and self.ids_enabled)
 
         #do the same for annotated points
 
@@ -1316,13 +1579,16 @@ class QtImageViewerPlus(QtImageViewer):
 
     def updateVisibility(self):
 
-        for blob in self.annotations.seg_blobs:
-            visibility = self.project.isLabelVisible(blob.class_name)
-            self.setBlobVisible(blob, visibility)
+        # the visibility is kept by the annotations, from the visibility of the labels
+        self.annotations.setClassVisibility(self.project.labels)
+        self.annotations.resetVisibility()
+
+        # only the annotations in view have graphics items to update
+        for blob in self.live_blobs.values():
+            self.updateItemVisibility(blob, self.annotations.isVisible(blob))
 
-        for blob in self.annotations.annpoints:
-            visibility = self.project.isLabelVisible(blob.class_name)
-            self.setBlobVisible(blob, visibility)
+        for annpoint in self.live_annpoints.values():
+            self.updateItemVisibility(annpoint, self.annotations.isVisible(annpoint))
 
 
 #SELECTED BLOBS MANAGEMENT
@@ -1388,11 +1654,9 @@ class QtImageViewerPlus(QtImageViewer):
         for blob in self.selected_blobs:
             self.updateBlobQPath(blob, False)
         self.selected_blobs.clear()        
-        for blob in self.image.annotations.seg_blobs:
-            if Mask.checkIntersection(wa, blob.bbox):
-                if blob not in self.selected_blobs:
-                    self.selected_blobs.append(blob)
-                    self.updateBlobQPath(blob, True)
+        for blob in self.image.annotations.calculate_inner_intersecting_blobs(wa):
+            self.selected_blobs.append(blob)
+            self.updateBlobQPath(blob, True)
 
         if redraw:
             self.scene.invalidate()
@@ -1405,6 +1669,10 @@ class QtImageViewerPlus(QtImageViewer):
         if blob not in self.selected_blobs:
             self.selected_blobs.append(blob)
 
+        # the selected regions always have their graphics items, also when they are out of view
+        if blob.qpath_gitem is None:
+            self.drawBlob(blob)
+
         self.updateBlobQPath(blob, True)
 
         if redraw:
@@ -1436,16 +1704,18 @@ class QtImageViewerPlus(QtImageViewer):
             if selected:
                 blob.qpath_gitem.setPen(self.border_selected_pen)
                 blob.qpath_gitem.setZValue(3)
-                blob.id_item.setZValue(4)
-                blob.id_item.setOpacity(1.0)
+                if blob.id_item is not None:
+                    blob.id_item.setZValue(4)
+                    blob.id_item.setOpacity(1.0)
             else:
                 if self.border_enabled is True:
                     blob.qpath_gitem.setPen(self.border_pen)
                 else:
                     blob.qpath_gitem.setPen(QPen(Qt.NoPen))
                 blob.qpath_gitem.setZValue(1)
-                blob.id_item.setZValue(2)
-                blob.id_item.setOpacity(0.7)
+                if blob.id_item is not None:
+                    blob.id_item.setZValue(2)
+                    blob.id_item.setOpacity(0.7)
 
 
 #SELECTED POINTS MANAGEMENT
@@ -1460,6 +1730,10 @@ class QtImageViewerPlus(QtImageViewer):
             self.selected_annpoints.append(annpoint)
             # str = "[SELECTION] A new blob (" + blob.blob_name + ";" + blob.class_name + ") has been selected."
             # self.logfile.info(str)
+
+        # the selected points always have their graphics items, also when they are out of view
+        if annpoint.cross1_gitem is None:
+            self.drawPointAnn(annpoint)
         #
         if annpoint.cross1_gitem is not None:
             annpoint.cross1_gitem.setPen(self.annpoints_pen_selected)
@@ -1523,8 +1797,9 @@ class QtImageViewerPlus(QtImageViewer):
                 else:
                     blob.qpath_gitem.setPen(QPen(Qt.NoPen))
                 blob.qpath_gitem.setZValue(1)
-                blob.id_item.setZValue(2)
-                blob.id_item.setOpacity(0.7)
+                if blob.id_item is not None:
+                    blob.id_item.setZValue(2)
+                    blob.id_item.setOpacity(0.7)
 
         for annpoint in self.selected_annpoints:
             if annpoint.cross1_gitem is not None:
@@ -1785,7 +2060,8 @@ class QtImageViewerPlus(QtImageViewer):
         for (blob, class_name) in operation['newclass']:
             self.project.setBlobClass(self.image, blob, class_name)
             brush = self.project.classBrushFromName(blob)
-            blob.qpath_gitem.setBrush(brush)
+            if blob.qpath_gitem:
+                blob.qpath_gitem.setBrush(brush)
 
         self.updateVisibility()
 
@@ -1840,9 +2116,7 @@ class QtImageViewerPlus(QtImageViewer):
 
             blob = Blob(region, offset[0], offset[1], new_id)
             blob.class_name = class_name
-            # Add to annotations
-            self.image.annotations.seg_blobs.append(blob)
-            # self.drawBlob(blob)
+            # Add to annotations (addBlob takes care of the image annotations)
             self.addBlob(blob, selected=False, redraw=False)
             added_blobs.append(blob)
 
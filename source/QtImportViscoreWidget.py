@@ -98,8 +98,7 @@ class QtImportViscoreWidget(QWidget):
 
             # Get the current orthomosaic
             channel = self.parent().activeviewer.image.getRGBChannel()
-            width = channel.qimage.width()
-            height = channel.qimage.height()
+            (width, height) = channel.size()
 
             # Get the path and basename
             image_file = channel.filename
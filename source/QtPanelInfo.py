@@ -349,6 +349,7 @@ class QtPanelInfo(QTabWidget):
 
         print(text)
         self.ann.data[name] = text
+        self.ann.dirty = True
 
     def updateNotes(self):
 
@@ -356,6 +357,7 @@ class QtPanelInfo(QTabWidget):
             return
 
         self.ann.note = self.fields['note'].document().toPlainText()
+        self.ann.dirty = True
 
     def clear(self):
 
@@ -0,0 +1,80 @@
+# TagLab
+# A semi-automatic segmentation tool
+#
+# Copyright(C) 2020
+# Visual Computing Lab
+# ISTI - Italian National Research Council
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License (http://www.gnu.org/licenses/gpl.txt)
+# for more details.
+
+import math
+
+from PyQt5.QtCore import QRectF
+from PyQt5.QtGui import QPainter
+from PyQt5.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+
+class QtTiledImageItem(QGraphicsItem):
+    """
+    Scene item which displays an ImagePyramid. Only the tiles overlapping the exposed region are drawn,
+    taken from the level of the pyramid matching the current zoom.
+    """
+
+    def __init__(self, parent=None):
+        super(QtTiledImageItem, self).__init__(parent)
+
+        self.pyramid = None
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+
+    def setPyramid(self, pyramid):
+        self.prepareGeometryChange()
+        self.pyramid = pyramid
+        self.update()
+
+    def boundingRect(self):
+        if self.pyramid is None:
+            return QRectF()
+        return QRectF(0, 0, self.pyramid.width, self.pyramid.height)
+
+    def paint(self, painter, option, widget=None):
+
+        if self.pyramid is None:
+            return
+
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.pyramid.levelForScale(scale)
+
+        # from level to scene coordinates
+        (w, h) = self.pyramid.levels[level]
+        sx = self.pyramid.width / w
+        sy = self.pyramid.height / h
+
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if exposed.isEmpty():
+            return
+
+        tile_size = self.pyramid.tile_size
+        (rows, cols) = self.pyramid.tileGrid(level)
+        col0 = max(0, int(math.floor(exposed.left() / sx / tile_size)))
+        col1 = min(cols - 1, int(math.floor(exposed.right() / sx / tile_size)))
+        row0 = max(0, int(math.floor(exposed.top() / sy / tile_size)))
+        row1 = min(rows - 1, int(math.floor(exposed.bottom() / sy / tile_size)))
+
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, scale < 1.0)
+
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                rect = self.pyramid.tileRect(level, row, col)
+                target = QRectF(rect.x() * sx, rect.y() * sy, rect.width() * sx, rect.height() * sy)
+                pixmap = self.pyramid.tilePixmap(level, row, col)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
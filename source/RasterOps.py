@@ -210,28 +210,24 @@ def write_shapefile( project, image, blobs, georef_filename, out_shp):
 
 
     # create the list of visible instances
-    name_list = []
-    visible_blobs = []
-    for blob in blobs:
-        if blob.qpath_gitem.isVisible():
-            index = blob.blob_name
-            name_list.append(index)
-            visible_blobs.append(blob)
+    annotations.setClassVisibility(project.labels)
+    visible_blobs = annotations.visibleBlobs(blobs)
 
     # SHAPEFILE NAMES CANNOT BE LONGER THAN 10 characters
 
-    number_of_seg = len(name_list)
+    number_of_seg = len(visible_blobs)
+    regions = annotations.regionsColumns(visible_blobs, scale_factor)
     dict = {
-        'TL_id': np.zeros(number_of_seg, dtype = np.int64),
-        'TL_Date': [],
-        'TL_Class': [],
-        'TL_Genet': np.zeros(number_of_seg, dtype = np.int64),
-        'TL_Cx': np.zeros(number_of_seg),
-        'TL_Cy': np.zeros(number_of_seg),
-        'TL_Area': np.zeros(number_of_seg),
-        'TL_SurfA': np.zeros(number_of_seg),
-        'TL_Perim': np.zeros(number_of_seg),
-        'TL_Note': []}
+        'TL_id': regions["id"],
+        'TL_Date': [date] * number_of_seg,
+        'TL_Class': regions["class"],
+        'TL_Genet': regions["genet"],
+        'TL_Cx': regions["cx"],
+        'TL_Cy': regions["cy"],
+        'TL_Area': regions["area"],
+        'TL_SurfA': regions["surface_area"],
+        'TL_Perim': regions["perimeter"],
+        'TL_Note': [blob.note for blob in visible_blobs]}
 
     for attribute in project.region_attributes.data:
         key = attribute["name"]
@@ -247,20 +243,6 @@ def write_shapefile( project, image, blobs, georef_filename, out_shp):
             pass
 
     for i, blob in enumerate(visible_blobs):
-        dict['TL_id'][i] = blob.id
-        dict['TL_Date'].append(date)
-        dict['TL_Class'].append(blob.class_name)
-        dict['TL_Cx'][i] = round(blob.centroid[0], 1)
-        dict['TL_Cy'][i] = round(blob.centroid[1], 1)
-        dict['TL_Area'][i] = round(blob.area * (scale_factor) * (scale_factor) / 100, 2)
-        if blob.surface_area > 0.0:
-            dict['TL_SurfA'][i] = round(blob.surface_area * (scale_factor) * (scale_factor) / 100, 2)
-        dict['TL_Perim'][i] = round(blob.perimeter * scale_factor / 10, 1)
-
-        if blob.genet is not None:
-            dict['TL_Genet'][i] = blob.genet
-
-        dict['TL_Note'].append(blob.note)
 
         for attribute in project.region_attributes.data:
 
@@ -294,9 +276,8 @@ def write_shapefile( project, image, blobs, georef_filename, out_shp):
     # # convert blobs in polygons
     polygons = []
     for blob in visible_blobs:
-        if blob.qpath_gitem.isVisible():
-            polygon = createPolygon(blob, transform)
-            polygons.append(polygon)
+        polygon = createPolygon(blob, transform)
+        polygons.append(polygon)
 
     # Now convert them to a shapefile with OGR
     outDriver = ogr.GetDriverByName('Esri Shapefile')
@@ -351,6 +332,9 @@ def load_georef(image):
     return geoinfo, transform
 
 def saveClippedTiff(input, blobs, georef_filename, name):
+    """
+    Clip the input raster with the given regions (see Annotation.visibleBlobs to export only the visible ones).
+    """
 
     # load georeference information to use
     img = rio.open(georef_filename)
@@ -360,9 +344,8 @@ def saveClippedTiff(input, blobs, georef_filename, name):
     # convert blobs into polygons
     mypolygons = []
     for blob in blobs:
-        if blob.qpath_gitem.isVisible():
-            polygon = createPolygon(blob, transform)
-            mypolygons.append(polygon)
+        polygon = createPolygon(blob, transform)
+        mypolygons.append(polygon)
 
     dataset = rio.open(input)
     out_image, out_transform = rio.mask.mask(dataset, mypolygons, crop=True)
@@ -0,0 +1,99 @@
+# TagLab
+# A semi-automatic segmentation tool
+#
+# Copyright(C) 2020
+# Visual Computing Lab
+# ISTI - Italian National Research Council
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License (http://www.gnu.org/licenses/gpl.txt)
+# for more details.
+
+import math
+
+
+class SampleGrid(object):
+    """
+    Background grid used to accelerate the dart throwing of the Poisson disk and of the importance sampling
+    (as in Bridson's algorithm): each sample is stored in the cell containing it, so only the samples of the
+    cells near a candidate point are tested. Each sample has a radius. A candidate point with radius r
+    is rejected if a sample is closer than:
+
+       2 * r                      - fixed radius (the radius of the samples is not considered)
+       (r + sample radius) / 2    - variable radius (i.e. from a radius map)
+    """
+
+    def __init__(self, cell_size, variable_radius=False):
+
+        self.cell_size = float(max(cell_size, 1.0))
+        self.variable_radius = variable_radius
+
+        # (row, col) -> list of (x, y, radius)
+        self.cells = {}
+        self.count = 0
+        self.max_radius = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def cell(self, x, y):
+        return (int(math.floor(y / self.cell_size)), int(math.floor(x / self.cell_size)))
+
+    def add(self, x, y, r=0.0):
+
+        key = self.cell(x, y)
+        samples = self.cells.get(key)
+        if samples is None:
+            samples = []
+            self.cells[key] = samples
+        samples.append((x, y, r))
+
+        self.count += 1
+        self.max_radius = max(self.max_radius, r)
+
+    def nearSamples(self, x, y, distance):
+        """
+        Samples of the cells overlapping the square of half side distance centered on (x, y).
+        """
+        (row0, col0) = self.cell(x - distance, y - distance)
+        (row1, col1) = self.cell(x + distance, y + distance)
+
+        if (row1 - row0 + 1) * (col1 - col0 + 1) > len(self.cells):
+            # the square covers more cells than the occupied ones
+            for (row, col), samples in self.cells.items():
+                if row0 <= row <= row1 and col0 <= col <= col1:
+                    yield from samples
+        else:
+            for row in range(row0, row1 + 1):
+                for col in range(col0, col1 + 1):
+                    samples = self.cells.get((row, col))
+                    if samples is not None:
+                        yield from samples
+
+    def isFree(self, x, y, r):
+        """
+        True if the point (x, y) with radius r is not too close to any sample.
+        """
+
+        if self.variable_radius:
+            reach = (r + self.max_radius) / 2.0
+        else:
+            reach = 2.0 * r
+
+        for (sx, sy, sr) in self.nearSamples(x, y, reach):
+            d = math.sqrt((sx - x) * (sx - x) + (sy - y) * (sy - y))
+            if self.variable_radius:
+                if d < (r + sr) / 2.0:
+                    return False
+            elif d < 2.0 * r:
+                return False
+
+        return True
@@ -0,0 +1,231 @@
+# TagLab
+# A semi-automatic segmentation tool
+#
+# Copyright(C) 2020
+# Visual Computing Lab
+# ISTI - Italian National Research Council
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License (http://www.gnu.org/licenses/gpl.txt)
+# for more details.
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from skimage import measure
+
+# variance of the coordinates inside a pixel, the moments of the polygons are converted to the moments of
+# the pixels centers (as computed by regionprops)
+PIXEL_VARIANCE = 1.0 / 12.0
+
+# corners of a pixel and middle points of its edges, with respect to its center
+PIXEL_CORNERS = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]])
+PIXEL_EDGES = np.array([[-0.5, 0.0], [0.5, 0.0], [0.0, -0.5], [0.0, 0.5]])
+
+
+def pixelsHull(pixels, offsets):
+    """
+    Convex hull of the given pixels (N x 2, pixel centers) enlarged by the offsets, as a polygon (float32).
+    """
+    hull = cv2.convexHull(np.asarray(pixels, dtype=np.float32)).reshape(-1, 2)
+    points = (hull[:, np.newaxis, :] + offsets[np.newaxis, :, :]).reshape(-1, 2)
+    return cv2.convexHull(points.astype(np.float32))
+
+
+def hullPixelCount(hull):
+    """
+    Number of pixels whose center is inside (or on the border of) the given convex polygon.
+    """
+    hull = np.asarray(hull, dtype=np.float64).reshape(-1, 2)
+    (x0, y0) = (hull[:, 0], hull[:, 1])
+    (x1, y1) = (np.roll(x0, -1), np.roll(y0, -1))
+
+    # intersections of the rows of pixels with the (non horizontal) edges, the extremes give the span of each row
+    y = np.arange(math.ceil(y0.min()), math.floor(y0.max()) + 1, dtype=np.float64)[:, np.newaxis]
+    crossing = (np.minimum(y0, y1) <= y) & (y <= np.maximum(y0, y1)) & (y0 != y1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+
+    eps = 1e-6
+    left = np.ceil(np.where(crossing, x, np.inf).min(axis=1) - eps)
+    right = np.floor(np.where(crossing, x, -np.inf).max(axis=1) + eps)
+    return int(np.maximum(right - left + 1, 0).sum())
+
+
+def ellipseFromMoments(mu20, mu11, mu02):
+    """
+    Fitted ellipse (as in regionprops) from the normalized central moments, x is the column, y the row.
+    It returns (major axis length, minor axis length, eccentricity, orientation) or None if degenerate.
+    """
+
+    # inertia tensor [[a, b], [b, c]]
+    a = mu20
+    b = -mu11
+    c = mu02
+
+    delta = math.sqrt(((a - c) / 2.0) ** 2 + b * b)
+    l1 = (a + c) / 2.0 + delta
+    l2 = max((a + c) / 2.0 - delta, 0.0)
+    if l1 <= 0.0:
+        return None
+
+    if a - c == 0:
+        orientation = -math.pi / 4.0 if b < 0 else math.pi / 4.0
+    else:
+        orientation = 0.5 * math.atan2(-2.0 * b, c - a)
+
+    return 4.0 * math.sqrt(l1), 4.0 * math.sqrt(l2), math.sqrt(1.0 - l2 / l1), orientation
+
+
+def descriptorsFromContours(blob):
+    """
+    Shape descriptors (in pixels) of a blob computed from its contours: bounding box, convex hull and minimum-area
+    rectangle of the pixels of the outer contour, ellipse from the moments of the polygon minus its holes.
+    It returns None if the contours are degenerate (i.e. very small regions).
+    """
+
+    contour = np.asarray(blob.contour, dtype=np.float32)
+    if contour.shape[0] < 3:
+        return None
+
+    moments = np.zeros(6)
+    for i, polygon in enumerate([contour] + [np.asarray(c, dtype=np.float32) for c in blob.inner_contours]):
+        if polygon.shape[0] < 3:
+            continue
+        m = cv2.moments(polygon)
+        values = np.array([m["m00"], m["m10"], m["m01"], m["m20"], m["m11"], m["m02"]])
+        # the holes are subtracted
+        moments += values if i == 0 else -values
+
+    (m00, m10, m01, m20, m11, m02) = moments
+    if m00 <= 1.0:
+        return None
+
+    # the contours do not describe the region (i.e. a hole crossing the outer contour), the mask is used
+    if abs(m00 - blob.area) > max(blob.perimeter / 2.0, 1.0):
+        return None
+
+    cx = m10 / m00
+    cy = m01 / m00
+    ellipse = ellipseFromMoments(m20 / m00 - cx * cx - PIXEL_VARIANCE, m11 / m00 - cx * cy,
+                                 m02 / m00 - cy * cy - PIXEL_VARIANCE)
+    if ellipse is None:
+        return None
+
+    # the vertices of the contour lie less than half pixel outside the border pixels, rounded they give
+    # the centers of the border pixels (blob.bbox cannot be used, it can be padded)
+    pixels = np.round(contour)
+    width = float(pixels[:, 0].max() - pixels[:, 0].min() + 1)
+    height = float(pixels[:, 1].max() - pixels[:, 1].min() + 1)
+
+    # convex area as in regionprops: pixels inside the hull of the middle points of the pixels edges
+    area_convex = float(hullPixelCount(pixelsHull(pixels, PIXEL_EDGES)))
+
+    # rectangle of the squares of the pixels
+    (rect_w, rect_h) = cv2.minAreaRect(pixelsHull(pixels, PIXEL_CORNERS))[1]
+
+    return {
+        "area_convex": area_convex,
+        "area_bbox": width * height,
+        "width_bbox": width,
+        "height_bbox": height,
+        "length_rect": float(max(rect_w, rect_h)),
+        "width_rect": float(min(rect_w, rect_h)),
+        "major_axis_length": ellipse[0],
+        "minor_axis_length": ellipse[1],
+        "eccentricity": ellipse[2],
+        "orientation": ellipse[3]
+    }
+
+
+def descriptorsFromMask(blob):
+    """
+    Shape descriptors (in pixels) of a blob computed from its mask (regionprops).
+    """
+
+    mask = blob.getMask()
+    props = measure.regionprops(mask)[0]
+
+    # rectangle of the squares of the pixels
+    (rect_w, rect_h) = cv2.minAreaRect(pixelsHull(np.argwhere(mask > 0)[:, ::-1], PIXEL_CORNERS))[1]
+
+    return {
+        "area_convex": float(props.area_convex),
+        "area_bbox": float(props.area_bbox),
+        "width_bbox": float(props.bbox[3] - props.bbox[1]),
+        "height_bbox": float(props.bbox[2] - props.bbox[0]),
+        "length_rect": float(max(rect_w, rect_h)),
+        "width_rect": float(min(rect_w, rect_h)),
+        "major_axis_length": float(props.major_axis_length),
+        "minor_axis_length": float(props.minor_axis_length),
+        "eccentricity": float(props.eccentricity),
+        "orientation": float(props.orientation)
+    }
+
+
+class ShapeDescriptors(object):
+    """
+    Shape descriptors of the regions, cached by region. The descriptors are computed from the contours,
+    the regions with degenerate contours fall back to the masks, processed by a pool of worker threads.
+    A cached entry is valid until the version (or the geometry) of the region changes.
+    """
+
+    def __init__(self, workers=None):
+
+        self.workers = workers
+
+        # id(blob) -> (signature, descriptors)
+        self.cache = {}
+
+    def signature(self, blob):
+        return (blob.version, blob.area, blob.perimeter, tuple(blob.bbox))
+
+    def cached(self, blob):
+
+        entry = self.cache.get(id(blob))
+        if entry is not None and entry[0] == self.signature(blob):
+            return entry[1]
+        return None
+
+    def store(self, blob, descriptors):
+        self.cache[id(blob)] = (self.signature(blob), descriptors)
+
+    def discard(self, blob):
+        self.cache.pop(id(blob), None)
+
+    def compute(self, blobs):
+        """
+        Shape descriptors of the given blobs, as a list of dictionaries (see descriptorsFromContours).
+        """
+
+        results = [None] * len(blobs)
+
+        masks_needed = []
+        for i, blob in enumerate(blobs):
+            descriptors = self.cached(blob)
+            if descriptors is None:
+                descriptors = descriptorsFromContours(blob)
+                if descriptors is None:
+                    masks_needed.append(i)
+                    continue
+                self.store(blob, descriptors)
+            results[i] = descriptors
+
+        if len(masks_needed) > 0:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                computed = executor.map(descriptorsFromMask, [blobs[i] for i in masks_needed])
+                for i, descriptors in zip(masks_needed, computed):
+                    self.store(blobs[i], descriptors)
+                    results[i] = descriptors
+
+        return results
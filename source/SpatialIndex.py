@@ -0,0 +1,180 @@
+# TagLab
+# A semi-automatic segmentation tool
+#
+# Copyright(C) 2020
+# Visual Computing Lab
+# ISTI - Italian National Research Council
+# All rights reserved.
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License (http://www.gnu.org/licenses/gpl.txt)
+# for more details.
+
+import math
+
+
+class SpatialIndex(object):
+    """
+    Uniform grid over the map used to speed up the spatial queries on the annotations.
+    Each object is registered with its bounding box, stored in the usual TagLab format
+    [top, left, width, height], and it is referenced by all the grid cells it overlaps.
+    The query results are returned in insertion order, so they are consistent with a linear
+    scan of the list the objects were added to.
+    """
+
+    def __init__(self, cell_size=512):
+
+        self.cell_size = cell_size
+
+        # (row, col) -> { key: object }
+        self.cells = {}
+
+        # key -> (insertion number, object, box, range of cells)
+        self.items = {}
+
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, obj):
+        return id(obj) in self.items
+
+    def clear(self):
+        self.cells = {}
+        self.items = {}
+        self.counter = 0
+
+    def cellRange(self, box):
+        """
+        Range of cells [row0, col0, row1, col1] (extremes included) covered by the given box.
+        """
+        top = box[0]
+        left = box[1]
+        bottom = box[0] + box[3]
+        right = box[1] + box[2]
+
+        row0 = int(math.floor(top / self.cell_size))
+        col0 = int(math.floor(left / self.cell_size))
+        row1 = int(math.floor(bottom / self.cell_size))
+        col1 = int(math.floor(right / self.cell_size))
+
+        return (row0, col0, row1, col1)
+
+    def insert(self, obj, box):
+        """
+        Add an object with the given bounding box. If the object is already indexed it is moved.
+        """
+
+        key = id(obj)
+        if key in self.items:
+            self.remove(obj)
+
+        box = [float(box[0]), float(box[1]), float(box[2]), float(box[3])]
+        cell_range = self.cellRange(box)
+        (row0, col0, row1, col1) = cell_range
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                cell = self.cells.get((row, col))
+                if cell is None:
+                    cell = {}
+                    self.cells[(row, col)] = cell
+                cell[key] = obj
+
+        self.items[key] = (self.counter, obj, box, cell_range)
+        self.counter += 1
+
+    def remove(self, obj):
+        """
+        Remove an object from the index. It returns False if the object was not indexed.
+        """
+
+        key = id(obj)
+        item = self.items.pop(key, None)
+        if item is None:
+            return False
+
+        (row0, col0, row1, col1) = item[3]
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                cell = self.cells.get((row, col))
+                if cell is not None:
+                    cell.pop(key, None)
+                    if len(cell) == 0:
+                        del self.cells[(row, col)]
+
+        return True
+
+    def update(self, obj, box):
+        """
+        Update the bounding box of an object already indexed, preserving its insertion order.
+        """
+
+        key = id(obj)
+        item = self.items.get(key)
+        if item is None:
+            self.insert(obj, box)
+            return
+
+        order = item[0]
+        self.remove(obj)
+        self.insert(obj, box)
+        (_, obj, box, cell_range) = self.items[key]
+        self.items[key] = (order, obj, box, cell_range)
+
+    def candidates(self, box):
+        """
+        Keys of the objects referenced by the cells overlapped by the given box.
+        """
+
+        (row0, col0, row1, col1) = self.cellRange(box)
+
+        keys = set()
+        if (row1 - row0 + 1) * (col1 - col0 + 1) > len(self.cells):
+            # the query covers more cells than the occupied ones
+            for (row, col), cell in self.cells.items():
+                if row0 <= row <= row1 and col0 <= col <= col1:
+                    keys.update(cell.keys())
+        else:
+            for row in range(row0, row1 + 1):
+                for col in range(col0, col1 + 1):
+                    cell = self.cells.get((row, col))
+                    if cell is not None:
+                        keys.update(cell.keys())
+
+        return keys
+
+    def query(self, box):
+        """
+        Objects whose indexed bounding box overlaps the given box [top, left, width, height].
+        The test is conservative (borders included), the caller is expected to apply the exact test.
+        """
+
+        top = box[0]
+        left = box[1]
+        bottom = box[0] + box[3]
+        right = box[1] + box[2]
+
+        items = []
+        for key in self.candidates(box):
+            item = self.items[key]
+            b = item[2]
+            if b[0] <= bottom and b[0] + b[3] >= top and b[1] <= right and b[1] + b[2] >= left:
+                items.append(item)
+
+        items.sort(key=lambda item: item[0])
+        return [item[1] for item in items]
+
+    def queryPoint(self, x, y, radius=0.0):
+        """
+        Objects whose indexed bounding box, enlarged by the given radius, contains the point (x, y).
+        """
+
+        return self.query([y - radius, x - radius, 2 * radius, 2 * radius])
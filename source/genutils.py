@@ -21,7 +21,7 @@
 
 import io
 from PyQt5.QtCore import Qt, QObject, QMetaObject, QMetaMethod
-from PyQt5.QtGui import QImage, QPixmap, qRgb, qRgba
+from PyQt5.QtGui import QImage, QPixmap, QPolygonF, qRgb, qRgba
 import numpy as np
 import cv2
 from skimage.draw import line
@@ -394,6 +394,7 @@ def setAttributes(project, data, object_list):
                     obj.data[field] = int(row[field])
                 else:
                     obj.data[field] = row[field]
+        obj.dirty = True
 
 def getSignal(oObject : QObject, strSignalName : str):
     """
@@ -583,6 +584,56 @@ def qimageToNumpyArray(qimg):
 
     return arr
 
+def qimageToNumpyView(qimg):
+    """
+    Read-only (h, w, 4) view of the pixels of a 32-bit QImage (Format_RGB32 or Format_ARGB32), the channels
+    are in BGRA order. No data is copied, so the QImage must be kept alive while the view is used.
+    """
+
+    w = qimg.width()
+    h = qimg.height()
+    bpl = qimg.bytesPerLine()
+
+    bits = qimg.constBits()
+    bits.setsize(int(h * bpl))
+    arr = np.frombuffer(bits, np.uint8)
+    arr = np.reshape(arr, [h, bpl // 4, 4])
+
+    return arr[:, :w, :]
+
+def numpyToQPolygonF(points, offset=0.0):
+    """
+    Create a QPolygonF from an Nx2 array of (x, y) points. The coordinates are written in one step
+    into the memory of the polygon, instead of appending the points one by one.
+    """
+
+    n = points.shape[0]
+    qpolygon = QPolygonF(n)
+
+    if n > 0:
+        ptr = qpolygon.data()
+        ptr.setsize(n * 2 * 8)
+        arr = np.frombuffer(ptr, np.float64).reshape(n, 2)
+        arr[:] = points
+        if offset != 0.0:
+            arr += offset
+
+    return qpolygon
+
+def qpolygonFToNumpy(qpolygon):
+    """
+    Nx2 array of the (x, y) points of a QPolygonF.
+    """
+
+    n = qpolygon.size()
+    if n == 0:
+        return np.zeros((0, 2))
+
+    ptr = qpolygon.data()
+    ptr.setsize(n * 2 * 8)
+
+    return np.frombuffer(ptr, np.float64).reshape(n, 2).copy()
+
 # ACI (Autocad Color Index) for DXF export
 def rgb_to_aci(self, r, g, b):
     # Define the simplified ACI color palette
@@ -35,7 +35,7 @@ class BricksSegmentation(Tool):
         bricksWidget = self.viewerplus.bricksWidget
         if bricksWidget is None:
             pixel_size = self.viewerplus.image.pixelSize()
-            bricksWidget = QtBricksWidget(self.viewerplus.img_map, pixel_size, blob, parent=self.viewerplus)
+            bricksWidget = QtBricksWidget(self.viewerplus.cropImage(blob.bbox), pixel_size, blob, parent=self.viewerplus)
             bricksWidget.setWindowModality(Qt.WindowModal)
             bricksWidget.btnCancel.clicked.connect(self.bricksCancel)
             bricksWidget.btnApply.clicked.connect(self.bricksApply)
@@ -27,7 +27,7 @@ class CreateCrack(Tool):
             blob = selected_blob.copy()
             self.blobInfo.emit(blob, "[TOOL][CREATECRACK][BLOB-SELECTED]")
 
-            crackWidget = QtCrackWidget(self.viewerplus.img_map, self.viewerplus.annotations, blob, x, y, parent=self.viewerplus)
+            crackWidget = QtCrackWidget(self.viewerplus.cropImage(blob.bbox), self.viewerplus.annotations, blob, x, y, parent=self.viewerplus)
             crackWidget.setWindowModality(Qt.WindowModal)
             crackWidget.btnCancel.clicked.connect(self.crackCancel)
             crackWidget.btnApply.clicked.connect(self.crackApply)
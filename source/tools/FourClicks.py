@@ -70,7 +70,7 @@ class FourClicks(Tool):
         h = bottom - top
         w = right - left
 
-        image_cropped = genutils.cropQImage(self.viewerplus.img_map, [top, left, w, h])
+        image_cropped = self.viewerplus.cropImage([top, left, w, h])
 
         fmt = image_cropped.format()
         assert (fmt == QImage.Format_RGB32)
@@ -94,7 +94,7 @@ class FourClicks(Tool):
 
     def segmentWithDeepExtreme(self):
 
-        if not self.viewerplus.img_map:
+        if not self.viewerplus.hasImage():
             return
 
         QApplication.setOverrideCursor(Qt.WaitCursor)
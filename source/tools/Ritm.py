@@ -107,7 +107,7 @@ class Ritm(Tool):
                                round(rect_map.width()), round(rect_map.height())]
 
 
-        image_crop = cropQImage(self.viewerplus.img_map, self.work_area_bbox)
+        image_crop = self.viewerplus.cropImage(self.work_area_bbox)
         input_image = qimageToNumpyArray(image_crop)
 
         # check input image size to prevent crash
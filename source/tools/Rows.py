@@ -126,7 +126,8 @@ class Rows(Tool):
         self.work_area_shadow = self.viewerplus.scene.addPath(shadow_path, QPen(Qt.NoPen), shadow_brush)
         
         # From the current view, crop the image 
-        self.image_cropped = self.viewerplus.img_map.copy(self.work_area.toRect())
+        crop_rect = self.work_area.toRect()
+        self.image_cropped = self.viewerplus.cropImage([crop_rect.top(), crop_rect.left(), crop_rect.width(), crop_rect.height()])
         # DEBUG Save the cropped image
         # self.image_cropped.save("cropped_image.png")
 
@@ -192,7 +192,8 @@ class SAMInteractive(Tool):
         offset = self.work_area_rect.pos()
         self.offset = [offset.x(), offset.y()]
 
-        image_cropped = self.viewerplus.img_map.copy(rect.toRect())
+        crop_rect = rect.toRect()
+        image_cropped = self.viewerplus.cropImage([crop_rect.top(), crop_rect.left(), crop_rect.width(), crop_rect.height()])
         
         # Crop the image based on the work area
         self.image_cropped = image_cropped
@@ -324,8 +325,8 @@ class SAMInteractive(Tool):
 		"""
 
         # Mosaic dimensions
-        self.width = self.viewerplus.img_map.size().width()
-        self.height = self.viewerplus.img_map.size().height()
+        self.width = self.viewerplus.imgwidth
+        self.height = self.viewerplus.imgheight
 
         # Current extent
         rect_map = self.viewerplus.viewportToScene()
@@ -377,7 +378,7 @@ class SAMInteractive(Tool):
 
     def segmentWithSAMPredictor(self):
 
-        if not self.viewerplus.img_map:
+        if not self.viewerplus.hasImage():
             return
 
         QApplication.setOverrideCursor(Qt.WaitCursor)
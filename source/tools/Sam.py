@@ -122,7 +122,8 @@ class Sam(Tool):
         offset = self.work_area_rect.pos()
         self.offset = [offset.x(), offset.y()]
 
-        image_cropped = self.viewerplus.img_map.copy(rect.toRect())
+        crop_rect = rect.toRect()
+        image_cropped = self.viewerplus.cropImage([crop_rect.top(), crop_rect.left(), crop_rect.width(), crop_rect.height()])
         
         # Crop the image based on the work area
         self.image_cropped = image_cropped
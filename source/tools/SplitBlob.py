@@ -44,7 +44,8 @@ class SplitBlob(Tool):
         points = self.pick_points.points
 
         self.viewerplus.removeBlob(selected_blob)
-        created_blobs = self.viewerplus.annotations.splitBlob(self.viewerplus.img_map, selected_blob, points)
+        cropimg = self.viewerplus.cropImage(selected_blob.bbox)
+        created_blobs = self.viewerplus.annotations.splitBlob(cropimg, selected_blob, points)
         self.viewerplus.project.updateCorrespondences("SPLIT", created_blobs, selected_blob, "")
 
         self.blobInfo.emit(selected_blob, "[TOOL][SPLITBLOB][BLOB-SELECTED]")
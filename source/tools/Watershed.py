@@ -125,13 +125,13 @@ class Watershed(Tool):
         if working_area[1] < 0:
             working_area[1] = 0
 
-        if working_area[0] + working_area[3] > self.viewerplus.img_map.height() - 1:
-            working_area[3] = self.viewerplus.img_map.height() - 1 - working_area[0]
+        if working_area[0] + working_area[3] > self.viewerplus.imgheight - 1:
+            working_area[3] = self.viewerplus.imgheight - 1 - working_area[0]
 
-        if working_area[1] + working_area[2] > self.viewerplus.img_map.width() - 1:
-            working_area[2] = self.viewerplus.img_map.width() - 1 - working_area[1]
+        if working_area[1] + working_area[2] > self.viewerplus.imgwidth - 1:
+            working_area[2] = self.viewerplus.imgwidth - 1 - working_area[1]
 
-        crop_img = genutils.cropQImage(self.viewerplus.img_map, working_area)
+        crop_img = self.viewerplus.cropImage(working_area)
         crop_imgnp = genutils.qimageToNumpyArray(crop_img)
 
         #cv2.imwrite('crop_img.png', crop_imgnp)